@@ -1,12 +1,14 @@
 from src.text_preprocessing import text_preprocessing
-from src.graph import CharacterGraph
+from src.graph import CharacterGraph, gexf_path
+from src.graph.graph_bundle import GraphBundle
 from src.graph.properties_extraction import *
 from src.graph.community_detection import *
+from src.graph.community_engine import COMMUNITY_ENGINES
+from src.storage import StageCache, occurences_location
+from src.third_party.bert_ner.bert import PRECISIONS
 
 # Import libraries
 import argparse
-import os
-import pickle
 
 if __name__ == "__main__":
     # ARGUMENTS
@@ -17,31 +19,78 @@ if __name__ == "__main__":
     parser.add_argument("--reprocess_text", action='store_true', help="use to repreprocess the novel")
     parser.add_argument("--recreate_graph", action='store_true', help="use to recreate the graph")
     parser.add_argument("--bert_large", action='store_true', help="to use BERT LARGE for NER, by default BERT base")
+    parser.add_argument("--ner_batch_size", type=int, default=None,
+                        help="number of text chunks per BERT-NER forward pass, by default chunks are processed one by one")
+    parser.add_argument("--ner_workers", type=int, default=1,
+                        help="number of processes used to apply BERT-NER on the chapters in parallel")
+    parser.add_argument("--ner_overlap", type=int, default=0,
+                        help="number of sentences of the previous chunk given as context to BERT-NER")
+    parser.add_argument("--ner_precision", type=str, default='fp32', choices=PRECISIONS,
+                        help="int8 to apply BERT-NER with dynamically quantized linear layers (faster on cpu)")
+    parser.add_argument("--ner_server", type=str, default=None,
+                        help="url of a BERT-NER server (src/third_party/bert_ner/api.py) to send the text chunks to, "
+                             "instead of loading the model")
+    parser.add_argument("--ner_pipeline", type=int, default=0,
+                        help="number of threads chunking the chapters ahead of BERT-NER, the forward passes and the "
+                             "merging of the tags running concurrently. By default (0), they run in sequence")
+    parser.add_argument("--windows_size", type=int, default=20,
+                        help="size (in tokens) of the windows in which two occurences interact")
+    parser.add_argument("--sparse_graph", action='store_true',
+                        help="store the full graph as CSR adjacency arrays instead of a networkx graph")
+    parser.add_argument("--compact_gexf", action='store_true', help="write the gexf files without indentation")
+    parser.add_argument("--gzip_gexf", action='store_true', help="write the gexf files compressed (.gexf.gz)")
+    parser.add_argument("--importance_step", type=int, default=None,
+                        help="also plot the importance of the characters over a sliding window moved by this number "
+                             "of tokens")
+    parser.add_argument("--community_engine", type=str, default='louvain',
+                        choices=list(COMMUNITY_ENGINES),
+                        help="algorithm used to detect the communities of the entity graph")
+    parser.add_argument("--community_seed", type=int, default=0,
+                        help="seed of the randomized community engines, so that the communities are the same from one "
+                             "run to the next")
     args = parser.parse_args()
 
     # NOVEL PREPROCESSING
     print("NOVEL PREPROCESSING")
-    text_preprocessing(args.book, reprocess=args.reprocess_text, bert_large=args.bert_large)
+    text_preprocessing(args.book, reprocess=args.reprocess_text, bert_large=args.bert_large,
+                       ner_batch_size=args.ner_batch_size, workers=args.ner_workers, ner_overlap=args.ner_overlap,
+                       ner_precision=args.ner_precision, ner_server=args.ner_server,
+                       ner_pipeline=args.ner_pipeline)
 
     # GRAPH CREATION
     print("\nGRAPH CREATION")
-    character_graph = CharacterGraph(args.book)
-    if os.path.exists('data/graph/' + args.book + '-dynamic-graph.gexf') and \
-            os.path.exists('data/graph/' + args.book + '-entity-graph.pkl') and not args.recreate_graph:
-        entity_graph = pickle.load(open('data/graph/' + args.book + '-entity-graph.pkl', 'rb'))
-        entity_chapter_graph = character_graph.entity_graph_by_chapter()
+    # the graphs are only recreated when the occurence list or the windows size changed
+    cache = StageCache(args.book)
+    graph_key = cache.key(cache.hash_path(occurences_location('data/entity_list/' + args.book + '_occ_list')),
+                          {'windows_size': args.windows_size})
+    graph_outputs = [gexf_path('data/graph/', args.book + '-dynamic-graph', compress=args.gzip_gexf),
+                     'data/graph/' + args.book + '-entity-graph.pkl']
+    cache.adopt('graph', graph_key, outputs=graph_outputs)
+    if cache.is_fresh('graph', graph_key, outputs=graph_outputs) and GraphBundle(args.book).exists() and \
+            not args.recreate_graph:
+        # the graphs are read from the bundle when they are used
+        character_graph = CharacterGraph.load(args.book)
+        entity_graph = character_graph.entity_graph
+        entity_chapter_graph = character_graph.entity_chapter_graphs
     else:
+        character_graph = CharacterGraph(args.book, windows_size=args.windows_size, sparse=args.sparse_graph)
         full_graph, entity_graph, dynamic_graph, chapter_graph, entity_chapter_graph = \
-            character_graph.generate_and_save()
+            character_graph.generate_and_save(prettyprint=not args.compact_gexf, compress=args.gzip_gexf)
+        cache.record('graph', graph_key)
 
     # Characters' importance
     entities_importance = importance_full_graph(entity_graph)
     most_central_characters, mcc_by_chapter = importance_subraphs(entity_chapter_graph)
+    if args.importance_step is not None:
+        importance_timeline(character_graph.temporal_index, windows_length=args.importance_step,
+                            step=args.importance_step)
 
     # Graph properties
     properties_full_graph(entity_graph, most_central_characters)
-    properties_subgraphs(entity_graph, entity_chapter_graph, most_central_characters, mcc_by_chapter)
+    properties_subgraphs(entity_graph, entity_chapter_graph, most_central_characters, mcc_by_chapter,
+                         entity_index=character_graph.entity_index)
 
     # Community detection
-    community_detection(entity_graph, entities_importance)
+    community_detection(entity_graph, entities_importance, engine=args.community_engine,
+                        seed=args.community_seed)
 
@@ -0,0 +1,52 @@
+from src.graph.community_engine import COMMUNITY_ENGINES, CompactAdjacency
+
+import argparse
+import networkx as nx
+import numpy as np
+import pickle
+import time
+
+"""
+Use this script to compare the community engines (see src/graph/community_engine.py) on the entity graph of a book :
+number of communities, weighted modularity and runtime of Louvain, label propagation and Girvan-Newman (first split),
+on the k-core used by community_detection and on the graph of the entities with more than min_degree interactions.
+Girvan-Newman is skipped on the graphs with more than --max_girvan_newman_edges edges.
+"""
+
+
+def benchmark(graph, engines, repeat, max_girvan_newman_edges):
+    adjacency, nodes = CompactAdjacency.from_graph(graph)
+    node_id = {node: idx for idx, node in enumerate(nodes)}
+    for engine in engines:
+        if engine == 'girvan_newman' and graph.number_of_edges() > max_girvan_newman_edges:
+            print("%17s | %13s | %10s | %s" % (engine, '-', '-', 'skipped'))
+            continue
+        best_time = float('inf')
+        for seed in range(repeat):
+            start = time.time()
+            communities = COMMUNITY_ENGINES[engine](graph, seed=seed)
+            best_time = min(best_time, time.time() - start)
+        labels = np.zeros(len(nodes), dtype=np.int64)
+        for label, community in enumerate(communities):
+            labels[[node_id[node] for node in community]] = label
+        print("%17s | %13d | %10.4f | %.4f" % (engine, len(communities), adjacency.modularity(labels), best_time))
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--book", type=str, default='hp1')
+    parser.add_argument("--engines", type=str, nargs='+', default=list(COMMUNITY_ENGINES))
+    parser.add_argument("--min_degree", type=int, default=5)
+    parser.add_argument("--max_girvan_newman_edges", type=int, default=1000)
+    parser.add_argument("--repeat", type=int, default=3)
+    args = parser.parse_args()
+
+    entity_graph = pickle.load(open('data/graph/' + args.book + '-entity-graph.pkl', 'rb'))
+    graphs = {'k-core': entity_graph.subgraph(nx.k_core(entity_graph)),
+              'degree > ' + str(args.min_degree): entity_graph.subgraph(
+                  [node for node, degree in entity_graph.degree() if degree > args.min_degree]),
+              'entity graph': entity_graph}
+    for name, graph in graphs.items():
+        print("\n%s : %d nodes, %d edges" % (name, graph.number_of_nodes(), graph.number_of_edges()))
+        print("           engine | nb communities | modularity | time (s)")
+        benchmark(graph, args.engines, args.repeat, args.max_girvan_newman_edges)
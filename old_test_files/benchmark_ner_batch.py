@@ -0,0 +1,44 @@
+from src.text_preprocessing.entities_extraction import EntitiesExtractor
+
+import argparse
+import time
+
+"""
+Use this script to compare the throughput (chunks/sec) of Ner.predict (one chunk per forward pass, padded to
+max_seq_length) with Ner.predict_batch (batches padded to their longest chunk) on the chapters of a book.
+It also checks that both paths give the same words and tags.
+"""
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--book", type=str, default='hp1')
+    parser.add_argument("--model", type=str, default='models/bert_ner_base/')
+    parser.add_argument("--nb_chapters", type=int, default=2)
+    parser.add_argument("--batch_size", type=int, default=32)
+    args = parser.parse_args()
+
+    entities_extractor = EntitiesExtractor(args.model)
+    bert_ner = entities_extractor.bert_ner
+    folder_path = 'data/book_by_chapter/' + args.book + '/'
+    chunks = []
+    for chapter in EntitiesExtractor.list_chapter_files(folder_path)[:args.nb_chapters]:
+        with open(folder_path + chapter) as f:
+            chunks += [chunk.text for chunk in entities_extractor.split_text(f.read())]
+    print("Number of chunks :", len(chunks))
+
+    start = time.time()
+    outputs = [bert_ner.predict(chunk) for chunk in chunks]
+    sequential_time = time.time() - start
+
+    start = time.time()
+    batch_outputs = bert_ner.predict_batch(chunks, batch_size=args.batch_size)
+    batch_time = time.time() - start
+
+    identical = all([(token['word'], token['tag']) for token in output] ==
+                    [(token['word'], token['tag']) for token in batch_output]
+                    for output, batch_output in zip(outputs, batch_outputs))
+
+    print("predict       : %.1f chunks/sec" % (len(chunks) / sequential_time))
+    print("predict_batch : %.1f chunks/sec (batch_size=%d)" % (len(chunks) / batch_time, args.batch_size))
+    print("speed-up      : %.2fx" % (sequential_time / batch_time))
+    print("identical words and tags :", identical)
@@ -0,0 +1,46 @@
+from src.text_preprocessing.entities_extraction import EntitiesExtractor
+
+import argparse
+import time
+
+"""
+Use this script to compare the time of EntitiesExtractor.from_chapter_files in sequence (chunking, forward passes and
+merging one after the other) and through the pipeline (see NerPipeline) on the chapters of a book, and to see the
+utilization of each stage of the pipeline.
+It also checks that both modes give the same occurences.
+"""
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--book", type=str, default='hp1')
+    parser.add_argument("--model", type=str, default='models/bert_ner_base/')
+    parser.add_argument("--nb_chapters", type=int, default=4)
+    parser.add_argument("--batch_size", type=int, default=16)
+    parser.add_argument("--workers", type=int, default=2, help="number of threads preparing the batches")
+    parser.add_argument("--queue_size", type=int, default=4)
+    args = parser.parse_args()
+
+    folder_path = 'data/book_by_chapter/' + args.book + '/'
+    chapter_paths = [folder_path + chapter
+                     for chapter in EntitiesExtractor.list_chapter_files(folder_path)[:args.nb_chapters]]
+
+    sequential_extractor = EntitiesExtractor(args.model)
+    start = time.time()
+    sequential_results = [sequential_extractor.from_text(open(path).read(), chapter=idx, batch_size=args.batch_size)
+                          for idx, path in enumerate(chapter_paths)]
+    sequential_time = time.time() - start
+
+    pipelined_extractor = EntitiesExtractor(args.model, pipeline_workers=args.workers,
+                                            pipeline_queue_size=args.queue_size)
+    # the WordPiece cache of the second extractor starts empty too
+    start = time.time()
+    pipelined_results = pipelined_extractor.from_chapter_files(chapter_paths, range(len(chapter_paths)),
+                                                               batch_size=args.batch_size)
+    pipelined_time = time.time() - start
+
+    nb_words = sum(nb_of_tokens for _, nb_of_tokens in sequential_results)
+    print("sequential : %.1f words/sec" % (nb_words / sequential_time))
+    print("pipelined  : %.1f words/sec (%d workers, queue of %d batches)" % (nb_words / pipelined_time, args.workers,
+                                                                             args.queue_size))
+    print("speed-up   : %.2fx" % (sequential_time / pipelined_time))
+    print("identical occurences :", sequential_results == pipelined_results)
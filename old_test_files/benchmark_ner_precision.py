@@ -0,0 +1,71 @@
+from src.text_preprocessing.entities_extraction import EntitiesExtractor
+
+import argparse
+import os
+import time
+import torch
+
+"""
+Use this script to choose the precision of BERT-NER (--ner_precision) : on the chapters of the books of
+data/book_by_chapter, it reports the throughput (words/sec and sub-tokens/sec) of the fp32 model and of the int8 model
+(dynamic quantization of the linear layers), and the agreement of the int8 model with the fp32 one :
+    - on the tags of the words
+    - on the PER occurences (character name and position) : precision, recall and F1 of int8 against fp32
+"""
+
+
+def tag_and_time(entities_extractor, chunks, batch_size):
+    start = time.time()
+    outputs = entities_extractor.bert_ner.predict_encodings([chunk.encoding for chunk in chunks],
+                                                            batch_size=batch_size)
+    elapsed = time.time() - start
+    token_list = []
+    for chunk, chunk_token_list in zip(chunks, outputs):
+        token_list += entities_extractor.chunk_tokens(chunk, chunk_token_list)
+    return token_list, elapsed
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--books", type=str, nargs='+', default=sorted(os.listdir('data/book_by_chapter/')))
+    parser.add_argument("--model", type=str, default='models/bert_ner_base/')
+    parser.add_argument("--nb_chapters", type=int, default=None, help="number of chapters per book, by default all")
+    parser.add_argument("--batch_size", type=int, default=32)
+    parser.add_argument("--threads", type=int, default=torch.get_num_threads())
+    args = parser.parse_args()
+
+    torch.set_num_threads(args.threads)
+    extractors = {precision: EntitiesExtractor(args.model, precision=precision) for precision in ['fp32', 'int8']}
+
+    chunks = []
+    for book in args.books:
+        folder_path = 'data/book_by_chapter/' + book + '/'
+        for chapter in EntitiesExtractor.list_chapter_files(folder_path)[:args.nb_chapters]:
+            with open(folder_path + chapter) as f:
+                chunks += extractors['fp32'].split_text(f.read())
+    nb_words = sum(chunk.nb_words for chunk in chunks)
+    nb_subtokens = sum(len(chunk.encoding.subword_ids) for chunk in chunks)
+    print("books :", args.books, "chunks :", len(chunks), "words :", nb_words, "sub-tokens :", nb_subtokens,
+          "threads :", args.threads)
+
+    token_lists = {}
+    times = {}
+    for precision, entities_extractor in extractors.items():
+        token_lists[precision], times[precision] = tag_and_time(entities_extractor, chunks, args.batch_size)
+        print("%s : %.1f words/sec, %.1f sub-tokens/sec" % (precision, nb_words / times[precision],
+                                                             nb_subtokens / times[precision]))
+    print("int8 speed-up : %.2fx" % (times['fp32'] / times['int8']))
+
+    same_tags = sum(token_fp32['tag'] == token_int8['tag']
+                    for token_fp32, token_int8 in zip(token_lists['fp32'], token_lists['int8']))
+    print("tag agreement : %.4f" % (same_tags / max(1, len(token_lists['fp32']))))
+
+    occurences = {precision: set((occurence['character_name'], occurence['position'])
+                                 for occurence in EntitiesExtractor.merge_person_tokens(token_list)[0])
+                  for precision, token_list in token_lists.items()}
+    common = len(occurences['fp32'] & occurences['int8'])
+    precision = common / max(1, len(occurences['int8']))
+    recall = common / max(1, len(occurences['fp32']))
+    print("PER occurences : fp32 %d, int8 %d, common %d" % (len(occurences['fp32']), len(occurences['int8']), common))
+    print("entity agreement : precision %.4f, recall %.4f, F1 %.4f"
+          % (precision, recall, 2 * precision * recall / max(1e-12, precision + recall)))
@@ -0,0 +1,64 @@
+from src.text_preprocessing.entities_extraction import EntitiesExtractor
+
+import argparse
+import os
+
+"""
+Use this script to count the BERT-NER forward passes (one per chunk) of the former split_text (chunks of 200 words,
+its loop ran len(string) // 200 times, most of the chunks being empty strings) and of TokenBudgetChunker (whole
+sentences up to the sub-token budget of the model) on the chapters of the books of data/book_by_chapter.
+It also counts the chunks over the budget and checks that the words given to BERT-NER are the words of the chapter
+(the former chunks repeated the last words of each chapter, which shifted the positions of the next chapters).
+"""
+
+
+def legacy_split_text(string, batch_size=200):
+    token_list = string.split(" ")
+
+    for i in range(len(string) // batch_size):
+        yield " ".join(token_list[i * batch_size: (i + 1) * batch_size])
+
+    if len(string) % batch_size != 0:
+        yield " ".join(token_list[(len(token_list) // batch_size) * batch_size:])
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--books", type=str, nargs='+', default=sorted(os.listdir('data/book_by_chapter/')))
+    parser.add_argument("--model", type=str, default='models/bert_ner_base/')
+    parser.add_argument("--overlap", type=int, default=0)
+    args = parser.parse_args()
+
+    entities_extractor = EntitiesExtractor(args.model, overlap=args.overlap)
+    budget = entities_extractor.chunker.budget
+    print("sub-token budget :", budget, "overlap :", args.overlap)
+    print("book | chapters | words | former chunks (empty, over budget, words) | new chunks (over budget, words) | "
+          "saved forward passes")
+    total_legacy, total_new = 0, 0
+    for book in args.books:
+        folder_path = 'data/book_by_chapter/' + book + '/'
+        chapters = EntitiesExtractor.list_chapter_files(folder_path)
+        nb_words = 0
+        legacy = {'chunks': 0, 'empty': 0, 'over': 0, 'words': 0}
+        new = {'chunks': 0, 'over': 0, 'words': 0}
+        for chapter in chapters:
+            with open(folder_path + chapter) as f:
+                text = f.read()
+            nb_words += entities_extractor.measure(text)[0]
+            for chunk in legacy_split_text(text):
+                chunk_words, chunk_subtokens = entities_extractor.measure(chunk)
+                legacy['chunks'] += 1
+                legacy['empty'] += chunk_words == 0
+                legacy['over'] += chunk_subtokens > budget
+                legacy['words'] += chunk_words
+            for chunk in entities_extractor.split_text(text):
+                new['chunks'] += 1
+                new['over'] += entities_extractor.measure(chunk.text)[1] > budget
+                new['words'] += chunk.nb_words - chunk.nb_context_words
+        total_legacy += legacy['chunks']
+        total_new += new['chunks']
+        print("%s | %d | %d | %d (%d, %d, %d) | %d (%d, %d) | %d (%.1fx fewer)"
+              % (book, len(chapters), nb_words, legacy['chunks'], legacy['empty'], legacy['over'], legacy['words'],
+                 new['chunks'], new['over'], new['words'], legacy['chunks'] - new['chunks'],
+                 legacy['chunks'] / max(1, new['chunks'])))
+    print("total : %d forward passes instead of %d" % (total_new, total_legacy))
@@ -0,0 +1,81 @@
+from src.graph import CharacterGraph, EdgeType
+from src.graph.interaction_counting import window_pairs
+from src.graph.sparse_graph import symmetric_csr
+
+import argparse
+import gc
+import numpy as np
+import time
+
+"""
+Use this script to compare the generation of the INTERACT_WITH edges of the full graph with the former python
+while-loop (one add_edge per pair) and with window_pairs (searchsorted on the sorted positions, one add_edges_from),
+for windows sizes from 5 to 200 tokens. It also checks that both give the same edges.
+The time of window_pairs alone and of the CSR build of the sparse backend are given to separate the pair generation
+from the insertion in the networkx graph.
+"""
+
+
+def loop_interaction_edges(graph, occurence_nodes_sort_by_pos, windows_size):
+    for idx_current_node in range(len(occurence_nodes_sort_by_pos)):
+        idx_other_node = idx_current_node + 1
+        current_pos = occurence_nodes_sort_by_pos[idx_current_node][1]
+        while idx_other_node < len(occurence_nodes_sort_by_pos) and \
+                occurence_nodes_sort_by_pos[idx_other_node][1] - current_pos < windows_size:
+            graph.add_edge(occurence_nodes_sort_by_pos[idx_current_node],
+                           occurence_nodes_sort_by_pos[idx_other_node],
+                           type=EdgeType.INTERACT_WITH)
+            idx_other_node += 1
+
+
+def vectorized_interaction_edges(graph, occurence_nodes_sort_by_pos, windows_size):
+    positions = np.array([position for _, position in occurence_nodes_sort_by_pos], dtype=np.int64)
+    idx_current_nodes, idx_other_nodes = window_pairs(positions, windows_size)
+    graph.add_edges_from(((occurence_nodes_sort_by_pos[idx_current_node], occurence_nodes_sort_by_pos[idx_other_node])
+                          for idx_current_node, idx_other_node in zip(idx_current_nodes.tolist(),
+                                                                      idx_other_nodes.tolist())),
+                         type=EdgeType.INTERACT_WITH)
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--book", type=str, default='hp1')
+    parser.add_argument("--windows_sizes", type=int, nargs='+', default=[5, 10, 20, 50, 100, 200])
+    parser.add_argument("--repeat", type=int, default=3)
+    args = parser.parse_args()
+
+    character_graph = CharacterGraph(args.book)
+    occurence_nodes_sort_by_pos = sorted(list(character_graph.occurence_nodes), key=lambda x: x[1])
+
+    positions = np.array([position for _, position in occurence_nodes_sort_by_pos], dtype=np.int64)
+    print("windows_size | nb pairs | loop (s) | vectorized (s) | speed-up | window_pairs (s) | CSR (s) | identical")
+    for windows_size in args.windows_sizes:
+        graphs = []
+        times = []
+        for generate_edges in [loop_interaction_edges, vectorized_interaction_edges]:
+            # best of args.repeat runs, without garbage collection during the measure
+            best_time = float('inf')
+            for _ in range(args.repeat):
+                graph = character_graph.full_graph.copy()
+                graph.remove_edges_from([(u_node, v_node) for u_node, v_node, data in graph.edges(data=True)
+                                         if data['type'] == EdgeType.INTERACT_WITH])
+                gc.collect()
+                gc.disable()
+                start = time.time()
+                generate_edges(graph, occurence_nodes_sort_by_pos, windows_size)
+                best_time = min(best_time, time.time() - start)
+                gc.enable()
+            times.append(best_time)
+            graphs.append(graph)
+
+        start = time.time()
+        idx_current_nodes, idx_other_nodes = window_pairs(positions, windows_size)
+        pairs_time = time.time() - start
+        start = time.time()
+        symmetric_csr(len(positions), idx_current_nodes, idx_other_nodes)
+        csr_time = time.time() - start + pairs_time
+
+        identical = dict(graphs[0].edges) == dict(graphs[1].edges)
+        print("%12d | %8d | %8.3f | %14.3f | %7.2fx | %16.4f | %7.4f | %s"
+              % (windows_size, len(idx_current_nodes), times[0], times[1], times[0] / times[1], pairs_time, csr_time,
+                 identical))
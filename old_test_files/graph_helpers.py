@@ -0,0 +1,11 @@
+"""
+Helpers shared by the graph tests
+"""
+
+
+def weighted_edges(graph):
+    """
+    :param graph: undirected nxGraph with weighted edges
+    :return: dict {node_1, node_2} -> weight of the edge, to compare two graphs regardless of the order of the ends
+    """
+    return {frozenset((u_node, v_node)): data['weight'] for u_node, v_node, data in graph.edges(data=True)}
@@ -0,0 +1,24 @@
+from src.graph import CharacterGraph
+from src.graph.centrality_timeline import pagerank_timeline
+
+import networkx as nx
+
+"""
+Check the warm-started PageRank of each sliding window against nx.pagerank on the snapshot graph of the window
+"""
+
+
+def test_pagerank_timeline():
+    temporal_index = CharacterGraph('hp1').temporal_index
+    for windows_length, step in [(2000, 2000), (10000, 2500)]:
+        importance_evol_df = pagerank_timeline(temporal_index, windows_length=windows_length, step=step)
+        assert list(importance_evol_df.index) == list(range(0, int(temporal_index.event_positions[-1]) + 1, step))
+        for windows_start, ranks in importance_evol_df.iterrows():
+            snapshot = temporal_index.snapshot(windows_start, windows_start + windows_length)
+            pagerank = nx.pagerank(snapshot, weight='weight') if snapshot.number_of_nodes() > 0 else {}
+            for entity, rank in ranks.items():
+                assert abs(pagerank.get(entity, 0) - rank) < 1e-4
+
+
+if __name__ == '__main__':
+    test_pagerank_timeline()
@@ -0,0 +1,22 @@
+from src.graph import CharacterGraph, NodeType
+from graph_helpers import weighted_edges
+
+"""
+Check that the one-sweep per-chapter entity graphs are the entity interaction graphs of the chapter subgraphs
+"""
+
+
+def test_chapter_entity_graphs():
+    for windows_size in [5, 20, 100]:
+        character_graph = CharacterGraph('hp1', windows_size=windows_size)
+        entity_chapter_graphs = character_graph.entity_graph_by_chapter()
+        chapter_nodes = character_graph.filter_nodes(NodeType.CHAPTER)
+        assert len(entity_chapter_graphs) == len(chapter_nodes)
+        for chapter, entity_graph in zip(chapter_nodes, entity_chapter_graphs):
+            reference = character_graph.entity_interaction_graph(character_graph.subgraph_from_chapter(chapter))
+            assert set(entity_graph.nodes) == set(reference.nodes)
+            assert weighted_edges(entity_graph) == weighted_edges(reference)
+
+
+if __name__ == '__main__':
+    test_chapter_entity_graphs()
@@ -0,0 +1,47 @@
+from src.graph.community_engine import COMMUNITY_ENGINES, CompactAdjacency, detect_communities
+
+import networkx as nx
+import networkx.algorithms.community as nxcom
+import numpy as np
+import pickle
+
+"""
+Check that the community engines return partitions of the graph, with the modularity computed by networkx
+"""
+
+
+def test_partitions():
+    entity_graph = pickle.load(open('data/graph/hp1-entity-graph.pkl', 'rb'))
+    k_core = entity_graph.subgraph(nx.k_core(entity_graph))
+    adjacency, nodes = CompactAdjacency.from_graph(entity_graph)
+    for engine in COMMUNITY_ENGINES:
+        graph = entity_graph if engine != 'girvan_newman' else k_core
+        communities = detect_communities(graph, engine=engine, seed=0)
+        assert nxcom.is_partition(graph, communities)
+        if graph is entity_graph:
+            community = {node: idx for idx, nodes_of_community in enumerate(communities) for node in nodes_of_community}
+            assert abs(adjacency.modularity(np.array([community[node] for node in nodes])) -
+                       nxcom.modularity(entity_graph, communities, weight='weight')) < 1e-9
+
+    assert nxcom.modularity(k_core, detect_communities(k_core, engine='louvain', seed=0)) >= \
+        nxcom.modularity(k_core, detect_communities(k_core, engine='girvan_newman'))
+    assert nxcom.modularity(entity_graph, detect_communities(entity_graph, engine='louvain', seed=0)) > 0.15
+
+
+def test_planted_communities():
+    # two weighted cliques linked by a light edge, a self loop and an isolated node
+    graph = nx.Graph()
+    for clique in [['a', 'b', 'c', 'd'], ['e', 'f', 'g']]:
+        graph.add_edges_from(((u, v) for u in clique for v in clique if u < v), weight=5)
+    graph.add_edge('d', 'e', weight=1)
+    graph.add_edge('a', 'a', weight=2)
+    graph.add_node('h')
+    for engine in ['louvain', 'label_propagation']:
+        communities = detect_communities(graph, engine=engine, seed=1)
+        assert sorted(map(sorted, communities)) == [['a', 'b', 'c', 'd'], ['e', 'f', 'g'], ['h']]
+    assert detect_communities(nx.Graph()) == []
+
+
+if __name__ == '__main__':
+    test_partitions()
+    test_planted_communities()
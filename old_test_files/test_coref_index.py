@@ -0,0 +1,80 @@
+from src.text_preprocessing.coreferences_resolution import parse_human_name, parsed_name, Coreferences
+
+import json
+import os
+import pickle
+import subprocess
+import sys
+import tempfile
+from nameparser import HumanName
+
+"""
+Check that the indexed Coreferences gives the same entity matching as the former version, which scanned the whole
+entity set for each person name, on the NER outputs stored in data/entity_list.
+
+data/entity_list/<book>_coref.json is the output of improved_matching(resolve()) of the former implementation
+(src/text_preprocessing/coreferences_resolution.py before the indexes), computed with PYTHONHASHSEED=0 : ties between
+equally frequent entities are broken by the iteration order of sets of entities, which depends on the hash seed.
+"""
+
+# run in a python process with PYTHONHASHSEED=0 : argv[1] book name, argv[2] output path
+MATCHING_SCRIPT = """
+import json, pickle, sys
+from src.text_preprocessing.coreferences_resolution import Coreferences
+NER_list = pickle.load(open('data/entity_list/' + sys.argv[1] + '.pkl', 'rb'))
+person_name_list = [occurence['character_name'] for occurence in NER_list]
+coref = Coreferences(person_name_list, coref_rules_folder='data/coref_rules/')
+idx_to_entity, removed = coref.improved_matching(coref.resolve())
+json.dump({'entities': [str(idx_to_entity[idx]) for idx in range(len(person_name_list))], 'removed': removed},
+          open(sys.argv[2], 'w'))
+"""
+
+
+def matching(book_name):
+    """
+    :return: dict entities : name of the entity of each person name, removed : indexes of the 'NONE' entities, output
+        of Coreferences.improved_matching on the NER output of the book with PYTHONHASHSEED=0
+    """
+    with tempfile.TemporaryDirectory() as folder:
+        output_path = os.path.join(folder, 'matching.json')
+        python_path = [os.getcwd()] + ([os.environ['PYTHONPATH']] if os.environ.get('PYTHONPATH') else [])
+        env = dict(os.environ, PYTHONHASHSEED='0', PYTHONPATH=os.pathsep.join(python_path))
+        subprocess.run([sys.executable, '-c', MATCHING_SCRIPT, book_name, output_path], env=env, check=True,
+                       stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+        with open(output_path) as f:
+            return json.load(f)
+
+
+def check_book(book_name):
+    with open('data/entity_list/' + book_name + '_coref.json') as f:
+        expected = json.load(f)
+    assert matching(book_name) == expected
+
+
+def test_resolve_1984():
+    check_book('1984')
+
+
+def test_resolve_hp1():
+    check_book('hp1')
+
+
+def test_parse_cache():
+    for name in ["mr. alexandre duval", "Sir  de Léséleuc", "miss lucas", "`` potter"]:
+        human_name = HumanName(name)
+        parsed = parsed_name(name)
+        assert (parsed.title, parsed.first, parsed.last, str(parsed)) == \
+               (human_name.title, human_name.first, human_name.last, str(human_name))
+
+    NER_list = pickle.load(open('data/entity_list/1984.pkl', 'rb'))
+    coref = Coreferences([occurence['character_name'] for occurence in NER_list])
+    coref.improved_matching(coref.resolve())
+    cache_info = parse_human_name.cache_info()
+    assert cache_info.hits > cache_info.misses
+
+
+if __name__ == '__main__':
+    test_resolve_1984()
+    test_resolve_hp1()
+    test_parse_cache()
+    print("indexed coreferences : OK")
@@ -0,0 +1,44 @@
+from src.graph import CharacterGraph
+
+import networkx as nx
+import numpy as np
+from collections import defaultdict
+
+"""
+Parity test of the dynamic entity interaction graph on hp1 against data/graph/hp1-dynamic-graph.gexf
+(exported with the all_simple_paths version of CharacterGraph.dynamic_entity_interaction_graph)
+"""
+
+
+def stored_dynamic_graph():
+    """
+    :return: dict entity -> start, dict {entity_1, entity_2} -> sorted list of interaction positions
+    """
+    gephi_graph = nx.read_gexf('data/graph/hp1-dynamic-graph.gexf')
+    starts = {node: int(float(data['start'])) for node, data in gephi_graph.nodes(data=True)}
+    positions = defaultdict(list)
+    for u_node, v_node, data in gephi_graph.edges(data=True):
+        positions[frozenset((u_node, v_node))].append(int(float(data['start'])))
+    return starts, {pair: sorted(pair_positions) for pair, pair_positions in positions.items()}
+
+
+def test_parity_with_stored_dynamic_graph():
+    character_graph = CharacterGraph('hp1')
+    reference_starts, reference_positions = stored_dynamic_graph()
+
+    for array_positions in [False, True]:
+        dynamic_graph = character_graph.dynamic_entity_interaction_graph(array_positions=array_positions)
+        assert dict(dynamic_graph.nodes(data='start')) == reference_starts
+
+        positions = {}
+        for u_node, v_node, data in dynamic_graph.edges(data=True):
+            assert dynamic_graph.nodes[u_node]['start'] < dynamic_graph.nodes[v_node]['start']
+            assert isinstance(data['positions'], np.ndarray if array_positions else list)
+            positions[frozenset((u_node, v_node))] = list(data['positions'])
+        # positions are emitted already sorted
+        assert positions == reference_positions
+
+
+if __name__ == '__main__':
+    test_parity_with_stored_dynamic_graph()
+    print("dynamic entity interaction graph : OK")
@@ -0,0 +1,61 @@
+from src.graph import CharacterGraph, NodeType, EdgeType
+from src.graph.entity_index import EntityOccurrenceIndex
+from src.graph.properties_extraction import entities_lifespan
+from src.storage import load_occurences
+
+import pickle
+
+"""
+Check the entity occurence index against the occurence list and the networkx neighbor lists it replaces
+"""
+
+
+def test_entity_index():
+    occurence_list = pickle.load(open('data/entity_list/hp1_occ_list.pkl', 'rb'))
+    entity_index = EntityOccurrenceIndex.from_occurences(load_occurences('data/entity_list/hp1_occ_list'))
+    assert len(entity_index) == len(occurence_list)
+    assert list(entity_index.positions) == sorted(occurence['position'] for occurence in occurence_list)
+
+    for entity in set(occurence['entity'] for occurence in occurence_list):
+        positions = sorted(occurence['position'] for occurence in occurence_list if occurence['entity'] == entity)
+        chapters = [occurence['chapter'] for occurence in sorted(occurence_list, key=lambda x: x['position'])
+                    if occurence['entity'] == entity]
+        entity_slice = entity_index.entity_slice(entity)
+        assert list(entity_index.entity_positions[entity_slice]) == positions
+        assert list(entity_index.entity_chapters[entity_slice]) == chapters
+        entity_id = entity_index.entity_id[entity]
+        assert entity_index.first_positions()[entity_id] == positions[0]
+        assert entity_index.last_positions()[entity_id] == positions[-1]
+
+    for chapter in set(occurence['chapter'] for occurence in occurence_list):
+        assert entity_index.occurence_keys(entity_index.chapter_slice(chapter)) == \
+            sorted(((occurence['character_name'], occurence['position']) for occurence in occurence_list
+                    if occurence['chapter'] == chapter), key=lambda x: x[1])
+    assert len(entity_index.chapter_slice(1000)) == 0
+
+
+def test_time_pairs():
+    character_graph = CharacterGraph('hp1')
+    entity_index = character_graph.entity_index
+    time_pairs = set()
+    for entity in character_graph.filter_nodes(NodeType.ENTITY):
+        occurence_nodes = sorted(character_graph.full_graph.neighbors(entity), key=lambda x: x[1])
+        time_pairs.update(frozenset(pair) for pair in zip(occurence_nodes[:-1], occurence_nodes[1:]))
+    idx_current_nodes, idx_next_nodes = entity_index.time_pairs()
+    assert set(frozenset((entity_index.occurence_key(u_idx), entity_index.occurence_key(v_idx)))
+               for u_idx, v_idx in zip(idx_current_nodes, idx_next_nodes)) == time_pairs
+    assert set(frozenset((u_node, v_node)) for u_node, v_node, data in character_graph.full_graph.edges(data=True)
+               if data['type'] == EdgeType.TIME) <= time_pairs
+
+
+def test_entities_lifespan():
+    character_graph = CharacterGraph('hp1')
+    assert entities_lifespan(character_graph.entity_graph, character_graph.entity_chapter_graphs) == \
+        entities_lifespan(character_graph.entity_graph, character_graph.entity_chapter_graphs,
+                          entity_index=character_graph.entity_index)
+
+
+if __name__ == '__main__':
+    test_entity_index()
+    test_time_pairs()
+    test_entities_lifespan()
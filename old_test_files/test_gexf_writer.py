@@ -0,0 +1,53 @@
+from src.graph import CharacterGraph, export_full_graph, export_entity_graph, export_dynamic_graph
+
+from collections import Counter
+import networkx as nx
+import pickle
+import tempfile
+
+"""
+Check that the gexf files written by the streaming writer contain the same graphs as the files of data/graph
+(written with nx.write_gexf)
+"""
+
+
+def edge_attributes(graph, *attributes):
+    return Counter((frozenset((u_node, v_node)),) + tuple(data.get(attribute) for attribute in attributes)
+                   for u_node, v_node, data in graph.edges(data=True))
+
+
+def node_attributes(graph, *attributes):
+    return {node: tuple(data.get(attribute) for attribute in attributes) for node, data in graph.nodes(data=True)}
+
+
+def test_exports():
+    character_graph = CharacterGraph('hp1')
+    entity_graph = pickle.load(open('data/graph/hp1-entity-graph.pkl', 'rb'))
+    dynamic_graph = character_graph.dynamic_entity_interaction_graph()
+    for options in [{}, {'prettyprint': False, 'compress': True}]:
+        extension = '.gexf.gz' if options else '.gexf'
+        with tempfile.TemporaryDirectory() as path:
+            export_full_graph(character_graph.full_graph, path + '/', 'hp1-full-graph', **options)
+            export_entity_graph(entity_graph, path + '/', 'hp1-entity-graph', **options)
+            export_dynamic_graph(dynamic_graph, path + '/', 'hp1-dynamic-graph', **options)
+
+            full_graph = nx.read_gexf(path + '/hp1-full-graph' + extension)
+            reference = nx.read_gexf('data/graph/hp1-full-graph.gexf')
+            assert node_attributes(full_graph, 'label', 'viz') == node_attributes(reference, 'label', 'viz')
+            assert Counter(data['label'] for _, _, data in full_graph.edges(data=True)) == \
+                Counter(data['label'] for _, _, data in reference.edges(data=True))
+
+            entity_graph_read = nx.read_gexf(path + '/hp1-entity-graph' + extension)
+            reference = nx.read_gexf('data/graph/hp1-entity-graph.gexf')
+            assert node_attributes(entity_graph_read, 'label') == node_attributes(reference, 'label')
+            assert edge_attributes(entity_graph_read, 'weight') == edge_attributes(reference, 'weight')
+
+            dynamic_graph_read = nx.read_gexf(path + '/hp1-dynamic-graph' + extension)
+            reference = nx.read_gexf('data/graph/hp1-dynamic-graph.gexf')
+            assert node_attributes(dynamic_graph_read, 'label', 'start') == node_attributes(reference, 'label', 'start')
+            assert edge_attributes(dynamic_graph_read, 'start', 'end', 'weight') == \
+                edge_attributes(reference, 'start', 'end', 'weight')
+
+
+if __name__ == '__main__':
+    test_exports()
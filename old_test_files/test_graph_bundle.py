@@ -0,0 +1,56 @@
+from src.graph import CharacterGraph
+from src.graph.graph_bundle import GraphBundle, GRAPH_BUNDLE_VERSION
+from graph_helpers import weighted_edges
+
+import json
+import networkx as nx
+import pytest
+import tempfile
+
+"""
+Check that the graphs saved in a bundle are reloaded by CharacterGraph.load, one artifact at a time
+"""
+
+
+def test_lazy_load():
+    character_graph = CharacterGraph('hp1')
+    with tempfile.TemporaryDirectory() as folder:
+        GraphBundle('hp1', folder=folder).save({'full_graph': character_graph.full_graph,
+                                                'entity_graph': character_graph.entity_graph,
+                                                'dynamic_graph': character_graph.dynamic_graph,
+                                                'entity_chapter_graphs': character_graph.entity_chapter_graphs},
+                                               character_graph.windows_size)
+
+        loaded_graph = CharacterGraph.load('hp1', folder=folder)
+        assert loaded_graph.bundle.artifacts == {}
+        assert weighted_edges(loaded_graph.entity_graph) == weighted_edges(character_graph.entity_graph)
+        assert list(loaded_graph.bundle.artifacts) == ['entity_graph']
+
+        for entity_graph, reference in zip(loaded_graph.entity_chapter_graphs, character_graph.entity_chapter_graphs):
+            assert weighted_edges(entity_graph) == weighted_edges(reference)
+        assert 'full_graph' not in loaded_graph.bundle.artifacts
+
+        assert nx.utils.graphs_equal(loaded_graph.full_graph, character_graph.full_graph)
+        assert loaded_graph.chapter_nodes == character_graph.chapter_nodes
+        assert dict(loaded_graph.dynamic_graph.edges) == dict(character_graph.dynamic_graph.edges)
+
+
+def test_version():
+    with tempfile.TemporaryDirectory() as folder:
+        with pytest.raises(FileNotFoundError):
+            CharacterGraph.load('hp1', folder=folder)
+
+        bundle = GraphBundle('hp1', folder=folder)
+        bundle.save({'entity_graph': nx.Graph()}, windows_size=20)
+        assert bundle.exists()
+        with open(bundle.manifest_path) as f:
+            manifest = json.load(f)
+        manifest['version'] = GRAPH_BUNDLE_VERSION - 1
+        with open(bundle.manifest_path, 'w') as f:
+            json.dump(manifest, f)
+        assert not bundle.exists()
+
+
+if __name__ == '__main__':
+    test_lazy_load()
+    test_version()
@@ -0,0 +1,55 @@
+from src.graph import CharacterGraph, NodeType, EdgeType
+from graph_helpers import weighted_edges
+
+import pickle
+import networkx as nx
+from itertools import product
+
+"""
+Parity test of the entity interaction counting engine on hp1 :
+- against the entity graph stored in data/graph/hp1-entity-graph.pkl (generated with the all_simple_paths version)
+- against the all_simple_paths enumeration itself on the first chapter graphs
+"""
+
+
+def entity_graph_by_paths(graph):
+    """
+    Former implementation of CharacterGraph.entity_interaction_graph : enumerate the paths of size 3 between
+    every ordered pair of entities
+    """
+    entity_nodes = [node for node, data in graph.nodes(data=True) if data["type"] == NodeType.ENTITY]
+    entity_graph = nx.Graph()
+    for entity in entity_nodes:
+        entity_graph.add_node(entity, type=NodeType.ENTITY)
+    for entity_1, entity_2 in product(entity_nodes, entity_nodes):
+        if entity_1 != entity_2:
+            nb_interactions = len(list(nx.all_simple_paths(graph, source=entity_1, target=entity_2, cutoff=3)))
+            if nb_interactions > 0:
+                entity_graph.add_edge(entity_1, entity_2, weight=nb_interactions, type=EdgeType.INTERACT_WITH)
+    return entity_graph
+
+
+def test_parity_with_stored_entity_graph():
+    character_graph = CharacterGraph('hp1')
+    entity_graph = character_graph.entity_interaction_graph(character_graph.full_graph)
+    reference_graph = pickle.load(open('data/graph/hp1-entity-graph.pkl', 'rb'))
+
+    assert set(entity_graph.nodes) == set(reference_graph.nodes)
+    assert weighted_edges(entity_graph) == weighted_edges(reference_graph)
+
+
+def test_parity_with_path_enumeration():
+    character_graph = CharacterGraph('hp1')
+    for chapter in range(3):
+        chapter_graph = character_graph.subgraph_from_chapter(chapter)
+        entity_graph = character_graph.entity_interaction_graph(chapter_graph)
+        reference_graph = entity_graph_by_paths(chapter_graph)
+
+        assert list(entity_graph.nodes) == list(reference_graph.nodes)
+        assert list(entity_graph.edges(data=True)) == list(reference_graph.edges(data=True))
+
+
+if __name__ == '__main__':
+    test_parity_with_stored_entity_graph()
+    test_parity_with_path_enumeration()
+    print("entity interaction counting : OK")
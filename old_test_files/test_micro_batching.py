@@ -0,0 +1,117 @@
+import threading
+import time
+
+from src.third_party.bert_ner.micro_batching import MicroBatcher, Overloaded
+
+"""
+Check that MicroBatcher gives back to each caller the output of its own input, flushes its batches at max_batch_size
+or at the deadline, and rejects the inputs above max_queue
+"""
+
+
+def test_outputs_routed_to_callers():
+    batch_sizes = []
+
+    def predict_batch(inputs):
+        batch_sizes.append(len(inputs))
+        time.sleep(0.005)
+        return [2 * item for item in inputs]
+
+    batcher = MicroBatcher(predict_batch, max_batch_size=8, max_wait=0.02)
+    results = {}
+
+    def caller(idx):
+        results[idx] = [future.result() for future in batcher.submit_many([idx, idx + 1000])]
+
+    threads = [threading.Thread(target=caller, args=(idx,)) for idx in range(40)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    batcher.close()
+
+    assert results == {idx: [2 * idx, 2 * (idx + 1000)] for idx in range(40)}
+    assert max(batch_sizes) <= 8 and sum(batch_sizes) == 80
+    # the concurrent inputs are grouped
+    assert len(batch_sizes) < 80
+    stats = batcher.stats()
+    assert stats['completed'] == stats['submitted'] == 80
+    assert stats['batches'] == len(batch_sizes)
+    assert 0 < stats['latency_ms']['p50'] <= stats['latency_ms']['p99'] <= stats['latency_ms']['max']
+
+
+def test_deadline_flush():
+    batcher = MicroBatcher(lambda inputs: inputs, max_batch_size=32, max_wait=0.05)
+    start = time.monotonic()
+    assert batcher.submit('alone').result(timeout=5) == 'alone'
+    # the batch is not full : it is flushed at the deadline
+    assert 0.04 <= time.monotonic() - start < 2
+    batcher.close()
+
+
+def test_backpressure():
+    release = threading.Event()
+
+    def predict_batch(inputs):
+        release.wait()
+        return inputs
+
+    batcher = MicroBatcher(predict_batch, max_batch_size=2, max_wait=0, max_queue=4)
+    futures = batcher.submit_many([0, 1])
+    # wait for the first batch to leave the queue
+    while batcher.stats()['queue_size'] > 0:
+        time.sleep(0.001)
+    futures += batcher.submit_many([2, 3, 4, 5])
+    try:
+        batcher.submit(6)
+        assert False, "the queue is full"
+    except Overloaded:
+        pass
+    release.set()
+    assert [future.result() for future in futures] == [0, 1, 2, 3, 4, 5]
+    batcher.close()
+    assert batcher.stats()['rejected'] == 1
+
+
+def test_errors_forwarded():
+    def predict_batch(inputs):
+        raise RuntimeError("model failed")
+
+    batcher = MicroBatcher(predict_batch, max_batch_size=4, max_wait=0.001)
+    future = batcher.submit(0)
+    try:
+        future.result()
+        assert False, "the error of the model is given to the caller"
+    except RuntimeError:
+        pass
+    batcher.close()
+    assert batcher.stats()['failed'] == 1
+
+
+def test_bad_input_isolated():
+    # the batch fails on a negative input : only its caller gets the error
+    def predict_batch(inputs):
+        if any(item < 0 for item in inputs):
+            raise ValueError("negative input")
+        return [2 * item for item in inputs]
+
+    batcher = MicroBatcher(predict_batch, max_batch_size=8, max_wait=0.05)
+    futures = batcher.submit_many([1, 2, -3, 4])
+    assert [future.result() for future in futures[:2]] == [2, 4]
+    assert futures[3].result() == 8
+    try:
+        futures[2].result()
+        assert False, "the error of the bad input is given to its caller"
+    except ValueError:
+        pass
+    batcher.close()
+    stats = batcher.stats()
+    assert stats['batches'] == 1 and stats['completed'] == 3 and stats['failed'] == 1
+
+
+if __name__ == '__main__':
+    test_outputs_routed_to_callers()
+    test_deadline_flush()
+    test_backpressure()
+    test_errors_forwarded()
+    test_bad_input_isolated()
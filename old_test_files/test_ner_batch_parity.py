@@ -0,0 +1,64 @@
+from src.third_party.bert_ner.bert import BertNer, Ner
+from test_valid_gather import tiny_config
+
+import json
+import os
+import tempfile
+import torch
+
+"""
+Check that Ner.predict_batch and Ner.predict_encodings give, word for word, the same tags and confidences as
+Ner.predict, with inputs of mixed lengths and a batch size which does not divide the number of inputs, on a tiny
+randomly initialized model
+"""
+
+WORDS = ["harry", "potter", "ron", "weasley", "hermione", "granger", "said", "the", "wand", "of", "a", "to",
+         "was", "in", "castle", ".", ","]
+
+TEXTS = ["Harry said .",
+         "Ron Weasley said to Hermione Granger that the wand of Dumbledore was in the castle .",
+         "Hogwarts",
+         "The castle of Hogwarts , said Harry Potter , was a castle .",
+         "Dumbledore said to Harry Potter , Ron Weasley and Hermione Granger that the castle was Hogwarts .",
+         "Potter",
+         "A wand , a castle , a Weasley .",
+         "Granger said the wand was in Hogwarts ."]
+
+
+def make_model_dir(model_dir):
+    """
+    Save a tiny randomly initialized BERT-NER, its vocabulary (with sub-words) and its model_config.json in model_dir
+    """
+    vocab = ["[PAD]", "[UNK]", "[CLS]", "[SEP]", "[MASK]"] + WORDS + ["hog", "##warts", "dumble", "##dore"]
+    with open(os.path.join(model_dir, "vocab.txt"), "w") as f:
+        f.write("\n".join(vocab) + "\n")
+    torch.manual_seed(0)
+    BertNer(tiny_config(vocab_size=len(vocab))).save_pretrained(model_dir)
+    # every label is in the label_map : the random model may predict any of them
+    labels = ["O", "B-MISC", "I-MISC", "B-PER", "I-PER", "B-ORG", "I-ORG", "B-LOC", "I-LOC", "[CLS]", "[SEP]", "X"]
+    with open(os.path.join(model_dir, "model_config.json"), "w") as f:
+        json.dump({"bert_model": "tiny", "do_lower": True, "max_seq_length": 40, "num_labels": len(labels),
+                   "label_map": {str(label_id): label for label_id, label in enumerate(labels)}}, f)
+
+
+def test_batch_parity():
+    with tempfile.TemporaryDirectory() as model_dir:
+        make_model_dir(model_dir)
+        bert_ner = Ner(model_dir)
+    expected = [bert_ner.predict(text) for text in TEXTS]
+    lengths = set(len(bert_ner.tokenize(text).subword_ids) for text in TEXTS)
+    assert len(lengths) > 4 and max(lengths) + 2 <= bert_ner.max_seq_length
+    encodings = [bert_ner.tokenize(text) for text in TEXTS]
+    for batch_size in [1, 3, 5, len(TEXTS)]:
+        for outputs in [bert_ner.predict_batch(TEXTS, batch_size=batch_size),
+                        bert_ner.predict_encodings(encodings, batch_size=batch_size, progress=False)]:
+            assert len(outputs) == len(expected)
+            for output, expected_output in zip(outputs, expected):
+                assert [(word['word'], word['tag']) for word in output] == \
+                       [(word['word'], word['tag']) for word in expected_output]
+                assert max(abs(word['confidence'] - expected_word['confidence'])
+                           for word, expected_word in zip(output, expected_output)) == 0
+
+
+if __name__ == '__main__':
+    test_batch_parity()
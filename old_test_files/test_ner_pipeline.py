@@ -0,0 +1,88 @@
+import threading
+import time
+
+from src.text_preprocessing.ner_pipeline import NerPipeline
+from src.text_preprocessing.text_chunker import Chunk
+from src.third_party.bert_ner.bert import Encoding
+
+"""
+Check that NerPipeline gives back the results of the texts in order, with the outputs of their chunks in order, that
+an error of a stage is raised by run, and that no thread of the pipeline stays blocked after an interruption
+"""
+
+
+class FakeNer:
+    # tags each word with its length, the stages sleep to let the threads interleave
+    def prepare_batch(self, encodings):
+        time.sleep(0.001)
+        return [list(encoding.words) for encoding in encodings]
+
+    def run_batch(self, features):
+        time.sleep(0.002)
+        if any('FAIL' in words for words in features):
+            raise RuntimeError("forward pass failed")
+        return [[len(word) for word in words] for words in features]
+
+    def decode_batch(self, encodings, features, logits):
+        return [[{'word': word, 'tag': tag} for word, tag in zip(encoding.words, row)]
+                for encoding, row in zip(encodings, logits)]
+
+
+def split(text):
+    for sentence in text.split('.'):
+        words = sentence.split()
+        if words:
+            yield Chunk(sentence, 0, len(words), Encoding(words, list(range(len(words))), [1] * len(words)))
+
+
+def finish(rank, chunks, outputs):
+    assert len(chunks) == len(outputs)
+    return rank, [(token['word'], token['tag']) for output in outputs for token in output]
+
+
+TEXTS = ["Harry went to Hogwarts. Ron met him. " * (idx % 5) + "Hermione read a book." for idx in range(30)] + [""]
+
+
+def test_results_in_order():
+    expected = [(rank, [(word, len(word)) for chunk in split(text) for word in chunk.encoding.words])
+                for rank, text in enumerate(TEXTS)]
+    for batch_size in [1, 3]:
+        for nb_workers in [1, 4]:
+            pipeline = NerPipeline(FakeNer(), batch_size=batch_size, nb_workers=nb_workers, queue_size=2)
+            assert pipeline.run(TEXTS, split, finish) == expected
+            stats = pipeline.stats
+            assert set(stats['stages']) == {'prepare', 'model', 'merge'}
+            assert stats['queues']['batches']['max_depth'] <= 2
+            assert all(0 <= stage['utilization'] <= 1 for stage in stats['stages'].values())
+    assert NerPipeline(FakeNer()).run([], split, finish) == []
+
+
+def test_errors_raised():
+    for texts in [TEXTS[:5] + ["Dobby FAIL."] + TEXTS[5:], TEXTS[:5] + [None] + TEXTS[5:]]:
+        try:
+            NerPipeline(FakeNer(), batch_size=2, nb_workers=3, queue_size=1).run(texts, split, finish)
+            assert False, "the error of the stage is raised"
+        except (RuntimeError, AttributeError):
+            pass
+
+
+def test_interruption():
+    def interrupted(rank, chunks, outputs):
+        if rank == 2:
+            raise KeyboardInterrupt()
+        return finish(rank, chunks, outputs)
+
+    start = time.monotonic()
+    try:
+        NerPipeline(FakeNer(), batch_size=1, nb_workers=3, queue_size=1).run(TEXTS * 5, split, interrupted)
+        assert False, "the interruption is raised"
+    except KeyboardInterrupt:
+        pass
+    assert time.monotonic() - start < 10
+    assert not [thread for thread in threading.enumerate() if thread.name.startswith('ner-')]
+
+
+if __name__ == '__main__':
+    test_results_in_order()
+    test_errors_raised()
+    test_interruption()
@@ -0,0 +1,43 @@
+from src.storage import OccurenceColumns, save_occurences, load_occurences
+from src.graph import CharacterGraph
+
+import pickle
+import tempfile
+
+"""
+Check that the columnar storage of the occurence lists gives back the pickled list of dict of data/entity_list
+"""
+
+
+def test_round_trip():
+    for book_name in ['hp1', '1984', 'hp1_occ_list']:
+        occurence_list = pickle.load(open('data/entity_list/' + book_name + '.pkl', 'rb'))
+        with tempfile.TemporaryDirectory() as path:
+            save_occurences(occurence_list, path)
+            columns = load_occurences(path)
+            assert len(columns) == len(occurence_list)
+            assert columns.to_list() == occurence_list
+            assert list(columns) == occurence_list
+            assert columns.character_names() == [occurence['character_name'] for occurence in occurence_list]
+
+
+def test_pickle_fallback():
+    columns = load_occurences('data/entity_list/hp1_occ_list')
+    assert isinstance(columns, OccurenceColumns)
+    assert columns.to_list() == pickle.load(open('data/entity_list/hp1_occ_list.pkl', 'rb'))
+
+
+def test_character_graph_from_columns():
+    character_graph = CharacterGraph('hp1')
+    occurence_list = pickle.load(open('data/entity_list/hp1_occ_list.pkl', 'rb'))
+    nodes = set((occurence['character_name'], occurence['position']) for occurence in occurence_list) | \
+        set(occurence['entity'] for occurence in occurence_list) | \
+        set(occurence['chapter'] for occurence in occurence_list)
+    assert set(character_graph.full_graph.nodes) == nodes
+
+
+if __name__ == '__main__':
+    test_round_trip()
+    test_pickle_fallback()
+    test_character_graph_from_columns()
+    print("columnar occurence storage : OK")
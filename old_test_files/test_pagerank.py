@@ -0,0 +1,42 @@
+from src.graph import CharacterGraph
+from src.graph.pagerank import batched_pagerank
+
+import networkx as nx
+
+"""
+Check the block-diagonal PageRank of the chapter graphs against nx.pagerank on each graph
+"""
+
+
+def assert_close(ranks, expected_ranks, tolerance=1e-5):
+    assert set(ranks) == set(expected_ranks)
+    for node, rank in expected_ranks.items():
+        assert abs(ranks[node] - rank) < tolerance
+
+
+def test_chapter_pagerank():
+    character_graph = CharacterGraph('hp1')
+    entity_chapter_graphs = character_graph.entity_chapter_graphs
+    for ranks, graph in zip(batched_pagerank(entity_chapter_graphs), entity_chapter_graphs):
+        assert_close(ranks, nx.pagerank(graph, weight='weight'))
+    assert_close(batched_pagerank([character_graph.entity_graph])[0],
+                 nx.pagerank(character_graph.entity_graph, weight='weight'))
+
+
+def test_special_graphs():
+    # isolated (dangling) nodes, self loop, unweighted edges, empty graph, directed graph
+    graph = nx.Graph()
+    graph.add_edge('a', 'b', weight=3)
+    graph.add_edge('b', 'c')
+    graph.add_edge('c', 'c', weight=2)
+    graph.add_node('d')
+    directed_graph = nx.DiGraph([('a', 'b'), ('b', 'c'), ('c', 'a'), ('c', 'd')])
+    ranks = batched_pagerank([graph, nx.Graph(), directed_graph])
+    assert_close(ranks[0], nx.pagerank(graph, weight='weight'))
+    assert ranks[1] == {}
+    assert_close(ranks[2], nx.pagerank(directed_graph, weight='weight'))
+
+
+if __name__ == '__main__':
+    test_chapter_pagerank()
+    test_special_graphs()
@@ -0,0 +1,51 @@
+from src.graph import CharacterGraph, NodeType
+from graph_helpers import weighted_edges
+
+"""
+Check that the sparse backend of CharacterGraph gives the same graphs as the networkx one on HarryPotter
+"""
+
+
+def test_to_networkx():
+    full_graph = CharacterGraph('hp1').full_graph
+    sparse_graph = CharacterGraph('hp1', sparse=True).full_graph
+    assert sparse_graph.number_of_nodes() == full_graph.number_of_nodes()
+    assert sparse_graph.number_of_edges() == full_graph.number_of_edges()
+
+    converted_graph = sparse_graph.to_networkx()
+    assert dict(converted_graph.nodes(data=True)) == dict(full_graph.nodes(data=True))
+    for u_node, v_node, data in full_graph.edges(data=True):
+        assert converted_graph.edges[u_node, v_node] == data
+
+
+def test_chapter_graphs():
+    character_graph = CharacterGraph('hp1')
+    sparse_character_graph = CharacterGraph('hp1', sparse=True)
+    assert sorted(sparse_character_graph.filter_nodes(NodeType.CHAPTER)) == \
+        sorted(character_graph.filter_nodes(NodeType.CHAPTER))
+
+    for chapter in range(len(character_graph.chapter_nodes)):
+        subgraph = character_graph.subgraph_from_chapter(chapter)
+        sparse_subgraph = sparse_character_graph.subgraph_from_chapter(chapter)
+        assert set(sparse_subgraph.nodes()) == set(subgraph.nodes)
+        assert set(map(frozenset, sparse_subgraph.edges())) == set(map(frozenset, subgraph.edges))
+
+    for entity_graph, sparse_entity_graph in zip(character_graph.entity_graph_by_chapter(),
+                                                 sparse_character_graph.entity_graph_by_chapter()):
+        assert set(sparse_entity_graph.nodes) == set(entity_graph.nodes)
+        assert weighted_edges(sparse_entity_graph) == weighted_edges(entity_graph)
+
+
+def test_entity_graph():
+    character_graph = CharacterGraph('hp1')
+    sparse_character_graph = CharacterGraph('hp1', sparse=True)
+    entity_graph = character_graph.entity_interaction_graph(character_graph.full_graph)
+    sparse_entity_graph = sparse_character_graph.entity_interaction_graph(sparse_character_graph.full_graph)
+    assert set(sparse_entity_graph.nodes) == set(entity_graph.nodes)
+    assert weighted_edges(sparse_entity_graph) == weighted_edges(entity_graph)
+
+
+if __name__ == '__main__':
+    test_to_networkx()
+    test_chapter_graphs()
+    test_entity_graph()
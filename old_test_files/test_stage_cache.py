@@ -0,0 +1,80 @@
+from src.storage import StageCache
+from src.third_party.bert_ner.bert import Ner
+
+import os
+import tempfile
+import time
+
+"""
+Check that the stage cache only asks to recompute a stage when the content of its inputs changed
+"""
+
+
+def test_stage_freshness():
+    with tempfile.TemporaryDirectory() as folder:
+        input_path = os.path.join(folder, 'input.txt')
+        output_path = os.path.join(folder, 'output.txt')
+        with open(input_path, 'w') as f:
+            f.write('Harry Potter')
+        with open(output_path, 'w') as f:
+            f.write('HARRY POTTER')
+
+        cache = StageCache('book', cache_folder=folder)
+        key = cache.key(cache.hash_file(input_path), {'windows_size': 20})
+        assert not cache.is_fresh('stage', key, outputs=[output_path])
+        cache.record('stage', key)
+
+        # same content, new modification time : still fresh
+        cache = StageCache('book', cache_folder=folder)
+        time.sleep(0.01)
+        with open(input_path, 'w') as f:
+            f.write('Harry Potter')
+        assert cache.is_fresh('stage', cache.key(cache.hash_file(input_path), {'windows_size': 20}),
+                              outputs=[output_path])
+
+        # other parameter, other content or missing output : recompute
+        assert not cache.is_fresh('stage', cache.key(cache.hash_file(input_path), {'windows_size': 30}),
+                                  outputs=[output_path])
+        with open(input_path, 'w') as f:
+            f.write('Ron Weasley')
+        assert not cache.is_fresh('stage', cache.key(cache.hash_file(input_path), {'windows_size': 20}),
+                                  outputs=[output_path])
+        os.remove(output_path)
+        assert not cache.is_fresh('stage', key, outputs=[output_path])
+
+
+def test_adopt_existing_outputs():
+    with tempfile.TemporaryDirectory() as folder:
+        cache = StageCache('book', cache_folder=folder)
+        assert not cache.adopt('stage', 'key', outputs=[os.path.join(folder, 'missing')])
+        assert cache.adopt('stage', 'key', outputs=[folder])
+        assert not cache.adopt('stage', 'other key', outputs=[folder])
+        assert cache.is_fresh('stage', 'key', outputs=[folder])
+
+
+def test_chapter_cache():
+    with tempfile.TemporaryDirectory() as folder:
+        cache = StageCache('book', cache_folder=folder)
+        chapter_result = ([{'character_name': 'Harry', 'position': 3, 'chapter': 0}], 12)
+        assert cache.load_chapter('key') is None
+        cache.save_chapter('key', chapter_result)
+        assert StageCache('other book', cache_folder=folder).load_chapter('key') == chapter_result
+
+
+def test_model_digest():
+    # the NER server publishes Ner.model_digest, compared with the digest of the model in the NER cache key
+    with tempfile.TemporaryDirectory() as folder:
+        os.makedirs(os.path.join(folder, 'model', 'sub'))
+        for name, content in [('vocab.txt', '[CLS]\nHarry'), ('pytorch_model.bin', 'weights'),
+                              (os.path.join('sub', 'config.json'), '{}')]:
+            with open(os.path.join(folder, 'model', name), 'w') as f:
+                f.write(content)
+        model_dir = os.path.join(folder, 'model')
+        assert Ner.model_digest(model_dir) == StageCache('book', cache_folder=folder).hash_path(model_dir)
+
+
+if __name__ == '__main__':
+    test_stage_freshness()
+    test_adopt_existing_outputs()
+    test_chapter_cache()
+    test_model_digest()
@@ -0,0 +1,60 @@
+from src.graph import CharacterGraph
+from src.graph.temporal_index import TemporalInteractionIndex
+from graph_helpers import weighted_edges
+
+import random
+
+"""
+Check the queries of the temporal index against a scan of the positions of every edge of the dynamic graph
+"""
+
+
+def scan_weights(dynamic_graph, start, end):
+    weights = {}
+    for entity_1, entity_2, positions in dynamic_graph.edges(data='positions'):
+        weight = sum(1 for position in positions if start <= position < end)
+        if weight > 0:
+            weights[frozenset((entity_1, entity_2))] = weight
+    return weights
+
+
+def test_temporal_queries():
+    dynamic_graph = CharacterGraph('hp1').dynamic_graph
+    temporal_index = TemporalInteractionIndex.from_dynamic_graph(dynamic_graph)
+    assert len(temporal_index) == sum(len(positions) for _, _, positions in dynamic_graph.edges(data='positions'))
+    last_position = int(temporal_index.event_positions[-1])
+
+    random.seed(0)
+    for _ in range(20):
+        start = random.randint(-10, last_position)
+        end = start + random.randint(0, 5000)
+        assert weighted_edges(temporal_index.snapshot(start, end)) == scan_weights(dynamic_graph, start, end)
+
+        t = random.randint(0, last_position + 10)
+        cumulative_graph = temporal_index.cumulative_graph(t)
+        assert weighted_edges(cumulative_graph) == scan_weights(dynamic_graph, 0, t)
+        assert set(cumulative_graph.nodes) == set(entity for entity, entity_start in dynamic_graph.nodes(data='start')
+                                                  if entity_start < t)
+
+    for entity_1, entity_2, positions in list(dynamic_graph.edges(data='positions'))[:50]:
+        assert list(temporal_index.pair_history(entity_2, entity_1)) == sorted(positions)
+        assert list(temporal_index.pair_history(entity_1, entity_2, 1000, 20000)) == \
+            [position for position in sorted(positions) if 1000 <= position < 20000]
+    assert len(temporal_index.pair_history('not an entity', 'other')) == 0
+
+
+def test_sliding_windows():
+    dynamic_graph = CharacterGraph('hp1').dynamic_graph
+    temporal_index = TemporalInteractionIndex.from_dynamic_graph(dynamic_graph)
+    for windows_length, step in [(5000, 2500), (1000, 3000), (20000, 20000)]:
+        nb_windows = 0
+        for windows_start, weights in temporal_index.sliding_windows(windows_length, step):
+            assert {frozenset(pair): weight for pair, weight in weights.items()} == \
+                scan_weights(dynamic_graph, windows_start, windows_start + windows_length)
+            nb_windows += 1
+        assert nb_windows == len(range(0, int(temporal_index.event_positions[-1]) + 1, step))
+
+
+if __name__ == '__main__':
+    test_temporal_queries()
+    test_sliding_windows()
@@ -0,0 +1,79 @@
+import warnings
+
+from src.text_preprocessing.text_chunker import TokenBudgetChunker
+from src.third_party.bert_ner.bert import Encoding
+
+from nltk import word_tokenize
+
+"""
+Check that the chunks of TokenBudgetChunker are never empty, fit in the budget and give back the words of the text,
+and that their encoding is the encoding of their text
+"""
+
+TEXT = ("Mr. and Mrs. Dursley, of number four, Privet Drive, were proud to say that they were perfectly normal. "
+        "They were the last people you'd expect to be involved in anything strange or mysterious. "
+        "Mr. Dursley was the director of a firm called Grunnings, which made drills. \n\n"
+        "He was a big, beefy man with hardly any neck, although he did have a very large mustache. "
+        + " ".join(["Hagrid"] * 60) + ". " +
+        "Mrs. Dursley was thin and blonde and had nearly twice the usual amount of neck. ")
+
+
+def tokenize(text):
+    # a fake sub-word tokenizer : one sub-token every 4 characters of each word
+    words = word_tokenize(text)
+    subword_ids, valid_positions = [], []
+    for word in words:
+        nb_subtokens = (len(word) + 3) // 4
+        subword_ids += [len(word)] * nb_subtokens
+        valid_positions += [1] + [0] * (nb_subtokens - 1)
+    return Encoding(words, subword_ids, valid_positions)
+
+
+def test_chunks():
+    for budget in [16, 40, 128]:
+        for overlap in [0, 1, 2]:
+            chunks = list(TokenBudgetChunker(tokenize, budget, overlap=overlap).chunks(TEXT))
+            words = []
+            for chunk in chunks:
+                assert chunk.nb_words > chunk.nb_context_words
+                assert chunk.encoding == tokenize(chunk.text)
+                assert len(chunk.encoding.words) == chunk.nb_words
+                assert len(chunk.encoding.subword_ids) <= budget
+                words += chunk.encoding.words[chunk.nb_context_words:]
+            assert words == word_tokenize(TEXT)
+            if overlap == 0:
+                assert all(chunk.nb_context_words == 0 for chunk in chunks)
+    assert list(TokenBudgetChunker(tokenize, 128).chunks("")) == []
+    assert list(TokenBudgetChunker(tokenize, 128).chunks("  \n ")) == []
+
+
+def test_long_sentence():
+    # the pieces of a sentence longer than the budget are slices of its encoding, the words are not tokenized again
+    encoding = Encoding(["Mr.", "Dursley"] * 30 + ["."], [3, 5, 6] * 30 + [1], [1, 1, 0] * 30 + [1])
+    for budget in [3, 8, 16]:
+        pieces = list(TokenBudgetChunker(tokenize, budget).split(encoding))
+        assert len(pieces) > 1
+        assert all(len(piece_encoding.subword_ids) <= budget for _, piece_encoding in pieces)
+        assert all(piece_encoding.valid_positions[0] == 1 for _, piece_encoding in pieces)
+        assert Encoding.concatenate([piece_encoding for _, piece_encoding in pieces]) == encoding
+        assert " ".join(text for text, _ in pieces).split() == encoding.words
+
+
+def test_long_word():
+    # the sub-tokens of a word longer than the budget are cut, its words before and after are kept whole
+    word = "Grunnings" * 10
+    sentence = "Mr. Dursley was the director of " + word + " , which made drills."
+    with warnings.catch_warnings(record=True) as caught:
+        warnings.simplefilter("always")
+        chunks = list(TokenBudgetChunker(tokenize, 8).chunks(sentence))
+    assert len(caught) == 1 and word in str(caught[0].message)
+    assert all(len(chunk.encoding.subword_ids) <= 8 for chunk in chunks)
+    assert [word for chunk in chunks for word in chunk.encoding.words] == word_tokenize(sentence)
+    cut = [chunk.encoding for chunk in chunks if word in chunk.encoding.words]
+    assert cut == [Encoding([word], [len(word)] * 8, [1] + [0] * 7)]
+
+
+if __name__ == '__main__':
+    test_chunks()
+    test_long_sentence()
+    test_long_word()
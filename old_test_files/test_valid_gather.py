@@ -0,0 +1,80 @@
+from src.third_party.bert_ner.bert import BertNer
+
+import time
+import torch
+from pytorch_transformers import BertConfig
+
+"""
+Check that the tensorized valid-token gather of BertNer.forward gives bit-identical logits to the former python
+double loop, for batch sizes 1..8. Run as a script to get a micro-benchmark of both versions.
+"""
+
+
+def gather_valid_loop(sequence_output, valid_ids):
+    """
+    Former implementation of the valid-token gather of BertNer.forward
+    """
+    batch_size, max_len, feat_dim = sequence_output.shape
+    valid_output = torch.zeros(batch_size, max_len, feat_dim, dtype=torch.float32, device=sequence_output.device)
+    for i in range(batch_size):
+        jj = -1
+        for j in range(max_len):
+            if valid_ids[i][j].item() == 1:
+                jj += 1
+                valid_output[i][jj] = sequence_output[i][j]
+    return valid_output
+
+
+def random_inputs(batch_size, max_len, vocab_size=100):
+    """
+    :return: input_ids, attention_mask and valid_ids of random sentences of various lengths padded to max_len
+    """
+    input_ids = torch.randint(1, vocab_size, (batch_size, max_len))
+    attention_mask = torch.zeros(batch_size, max_len, dtype=torch.long)
+    valid_ids = torch.zeros(batch_size, max_len, dtype=torch.long)
+    for i in range(batch_size):
+        length = int(torch.randint(2, max_len + 1, (1,)))
+        attention_mask[i, :length] = 1
+        valid_ids[i, :length] = (torch.rand(length) < 0.7).long()
+        valid_ids[i, 0] = valid_ids[i, length - 1] = 1
+    return input_ids, attention_mask, valid_ids
+
+
+def tiny_config(vocab_size=100):
+    """
+    :return: BertConfig of a tiny randomly initialized BERT-NER, fast enough for the tests
+    """
+    return BertConfig(vocab_size_or_config_json_file=vocab_size, hidden_size=32, num_hidden_layers=2,
+                      num_attention_heads=2, intermediate_size=64, num_labels=12)
+
+
+def test_bit_identical_logits():
+    torch.manual_seed(0)
+    model = BertNer(tiny_config())
+    model.eval()
+    for batch_size in range(1, 9):
+        input_ids, attention_mask, valid_ids = random_inputs(batch_size, max_len=40)
+        token_type_ids = torch.zeros_like(input_ids)
+        with torch.no_grad():
+            sequence_output = model.bert(input_ids, token_type_ids, attention_mask, head_mask=None)[0]
+            expected_logits = model.classifier(model.dropout(gather_valid_loop(sequence_output, valid_ids)))
+            logits = model(input_ids, token_type_ids, attention_mask, valid_ids)
+        assert torch.equal(logits, expected_logits)
+
+
+if __name__ == '__main__':
+    test_bit_identical_logits()
+
+    print("MICRO-BENCHMARK OF THE VALID-TOKEN GATHER (hidden size 768, max_seq_length 128)")
+    torch.manual_seed(0)
+    for batch_size in [1, 8, 32]:
+        _, _, valid_ids = random_inputs(batch_size, max_len=128)
+        sequence_output = torch.rand(batch_size, 128, 768)
+        timings = []
+        for gather in [gather_valid_loop, BertNer.gather_valid]:
+            start = time.time()
+            for _ in range(10):
+                gather(sequence_output, valid_ids)
+            timings.append((time.time() - start) / 10)
+        print("batch_size=%2d  loop: %.2f ms  tensorized: %.2f ms  speed-up: %.0fx"
+              % (batch_size, timings[0] * 1000, timings[1] * 1000, timings[0] / timings[1]))
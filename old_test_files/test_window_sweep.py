@@ -0,0 +1,41 @@
+from src.graph import CharacterGraph
+from src.graph.entity_index import EntityOccurrenceIndex
+from src.graph.interaction_counting import entity_graphs_by_window
+from src.storage import load_occurences
+from graph_helpers import weighted_edges
+
+import time
+
+"""
+Check that the entity graphs of a windows size sweep are the entity graphs of a CharacterGraph built with each
+windows size, and compare their cost
+"""
+
+WINDOWS_SIZES = [5, 10, 20, 30, 50, 75, 100, 125, 150, 200]
+
+
+def test_window_sweep():
+    entity_index = EntityOccurrenceIndex.from_occurences(load_occurences('data/entity_list/hp1_occ_list'))
+    entity_graphs = entity_graphs_by_window(entity_index, [100, 5, 20, 20])
+    assert sorted(entity_graphs) == [5, 20, 100]
+    for windows_size, entity_graph in entity_graphs.items():
+        reference = CharacterGraph('hp1', windows_size=windows_size).entity_graph
+        assert set(entity_graph.nodes) == set(reference.nodes)
+        assert weighted_edges(entity_graph) == weighted_edges(reference)
+    assert entity_graphs_by_window(entity_index, []) == {}
+
+
+if __name__ == '__main__':
+    test_window_sweep()
+
+    entity_index = EntityOccurrenceIndex.from_occurences(load_occurences('data/entity_list/hp1_occ_list'))
+    start = time.time()
+    entity_graphs_by_window(entity_index, WINDOWS_SIZES)
+    print("sweep of %d windows sizes : %.3fs" % (len(WINDOWS_SIZES), time.time() - start))
+    start = time.time()
+    entity_graphs_by_window(entity_index, WINDOWS_SIZES[-1:])
+    print("largest windows size only : %.3fs" % (time.time() - start))
+    start = time.time()
+    for windows_size in WINDOWS_SIZES:
+        CharacterGraph('hp1', windows_size=windows_size).entity_graph
+    print("one CharacterGraph per windows size : %.3fs" % (time.time() - start))
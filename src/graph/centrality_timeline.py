@@ -0,0 +1,98 @@
+import numpy as np
+import pandas as pd
+
+from .pagerank import block_pagerank, directed_edges
+
+"""
+In this file is defined the PageRank time series of the entities over a sliding window of tokens.
+
+Running nx.pagerank on the snapshot graph of each window starts every power iteration from scratch and rebuilds a
+networkx graph per window. Here, for each window of the sweep (see TemporalInteractionIndex.sliding_events) :
+    - the weight of each pair of entities is updated with the interactions that entered and left the window, and the
+      set of the pairs of the window with the pairs whose weight changed : a step costs in proportion to the events
+      which enter and leave the window, not to the number of pairs of the book
+    - the power iteration is a sparse matrix-vector product over the pairs of the window (see pagerank.block_pagerank)
+    - it starts from the PageRank vector of the previous window, which is already close to the solution
+The result of each window is the one nx.pagerank(snapshot, weight='weight') would give, up to the tolerance.
+"""
+
+
+def weighted_pagerank(edges_1, edges_2, edge_weights, nb_entities, x_start=None, alpha=0.85, tol=1e-6,
+                      max_iter=100):
+    """
+    PageRank of an undirected weighted graph given as an edge list over the entity ids [0, nb_entities)
+    Entities without any edge are not part of the graph and get 0
+    :param edges_1: int array, entity id of the first end of each edge
+    :param edges_2: int array, entity id of the second end of each edge
+    :param edge_weights: float array, weight (> 0) of each edge
+    :param nb_entities: [int]
+    :param x_start: float array of size nb_entities, starting vector (warm start), by default uniform
+    :param alpha: damping factor
+    :param tol: error tolerance used to check convergence, as in nx.pagerank
+    :param max_iter: maximum number of iterations of the power method
+    :return: float array of size nb_entities (sum to 1 over the entities of the graph), number of iterations
+    """
+    nodes = np.unique(np.concatenate([edges_1, edges_2]))
+    x = np.zeros(nb_entities)
+    if len(nodes) == 0:
+        return x, 0
+
+    # the entities of the graph are renumbered [0, len(nodes)) and form a single block
+    node_id = np.zeros(nb_entities, dtype=np.int64)
+    node_id[nodes] = np.arange(len(nodes))
+    # starting vector : previous values of the entities of the graph, 1 / len(nodes) for the new ones
+    node_start = None
+    if x_start is not None:
+        node_start = np.where(x_start[nodes] > 0, x_start[nodes], 1.0 / len(nodes))
+
+    sources, targets, weights = directed_edges(node_id[edges_1], node_id[edges_2], edge_weights)
+    x[nodes], nb_iter = block_pagerank(sources, targets, weights, np.zeros(len(nodes), dtype=np.int64), 1,
+                                       x_start=node_start, alpha=alpha, tol=tol, max_iter=max_iter)
+    return x, nb_iter
+
+
+def pagerank_timeline(temporal_index, windows_length=2000, step=2000, start=0, end=None, alpha=0.85, tol=1e-6,
+                      max_iter=100):
+    """
+    PageRank of the entities in each window [s, s + windows_length) of the text, for s = start, start + step, ...
+    :param temporal_index: TemporalInteractionIndex of the dynamic graph (see CharacterGraph.temporal_index)
+    :param windows_length: [int] length of a window, in tokens
+    :param step: [int] shift between two windows, in tokens
+    :param start: [int] start of the first window
+    :param end: [int] end of the sweep, by default the last interaction position + 1
+    :param alpha: damping factor
+    :param tol: error tolerance used to check convergence, as in nx.pagerank
+    :param max_iter: maximum number of iterations of the power method in each window
+    :return: DataFrame - one row per window (indexed by the window start), one column per entity, 0 when the entity
+        does not interact in the window (same layout as the degree_evol_df of importance_subraphs)
+    """
+    nb_entities = len(temporal_index.entities)
+    pair_entity_ids = temporal_index.pair_entity_ids
+    pair_weights = np.zeros(len(temporal_index.pairs), dtype=np.int64)
+    # pairs with at least one interaction in the current window
+    active_pairs = set()
+    x = None
+    windows_starts = []
+    ranks = []
+    for windows_start, leaving, entering in temporal_index.sliding_events(windows_length, step, start=start,
+                                                                          end=end):
+        # only the pairs of the events which left or entered the window change
+        leaving_pairs = temporal_index.event_pairs[leaving]
+        entering_pairs = temporal_index.event_pairs[entering]
+        np.subtract.at(pair_weights, leaving_pairs, 1)
+        np.add.at(pair_weights, entering_pairs, 1)
+        changed_pairs = np.unique(np.concatenate([leaving_pairs, entering_pairs]))
+        changed_weights = pair_weights[changed_pairs]
+        active_pairs.difference_update(changed_pairs[changed_weights == 0].tolist())
+        active_pairs.update(changed_pairs[changed_weights > 0].tolist())
+        pairs = np.sort(np.fromiter(active_pairs, dtype=np.int64, count=len(active_pairs)))
+        x, _ = weighted_pagerank(pair_entity_ids[pairs, 0], pair_entity_ids[pairs, 1],
+                                 pair_weights[pairs].astype(np.float64), nb_entities, x_start=x, alpha=alpha,
+                                 tol=tol, max_iter=max_iter)
+        windows_starts.append(windows_start)
+        ranks.append(x)
+
+    ranks = pd.DataFrame(np.array(ranks).reshape(-1, nb_entities), index=pd.Index(windows_starts, name='position'),
+                         columns=temporal_index.entities)
+    # entities which never interact in the sweep are not part of any window graph
+    return ranks.loc[:, (ranks != 0).any()]
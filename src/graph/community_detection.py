@@ -4,11 +4,16 @@ import networkx as nx
 import networkx.algorithms.community as nxcom
 import matplotlib.pyplot as plt
 
+from .community_engine import detect_communities
 
-def community_detection(full_g, entities_importance):
+
+def community_detection(full_g, entities_importance, engine='louvain', seed=0):
 	"""
 	:param full_g: entity graph
 	entities_importance: ordered list of characters from most important to least
+	:param engine: community detection engine used on the k-core (see community_engine.COMMUNITY_ENGINES)
+	:param seed: seed of the randomized engines and of the layout, so that the communities and the plot are the same
+	from one run to the next
 	Detects the different communities that exist in the graph and plots them
 	"""
 
@@ -27,9 +32,8 @@ def community_detection(full_g, entities_importance):
 			sub_nodes.append(el[0])
 	g = full_g.subgraph(sub_nodes)
 
-	# Girvan newman method to find communities
-	result = nxcom.girvan_newman(g_core)
-	communities = next(result)
+	# Find communities (Louvain modularity optimization by default, Girvan newman with engine='girvan_newman')
+	communities = detect_communities(g_core, engine=engine, seed=seed)
 
 	# Set node and edge communities
 	set_node_community(g_core, communities)
@@ -44,7 +48,7 @@ def community_detection(full_g, entities_importance):
 	df.loc[df['community']=='Officer', 'color'] *= -1
 
 	plt.figure(figsize=(20, 14))
-	layout = nx.fruchterman_reingold_layout(g_core)
+	layout = nx.fruchterman_reingold_layout(g_core, seed=seed)
 	vmin = df['color'].min()
 	vmax = df['color'].max()
 	cmap = plt.cm.coolwarm
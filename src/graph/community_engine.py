@@ -0,0 +1,282 @@
+import random
+
+import networkx.algorithms.community as nxcom
+import numpy as np
+
+"""
+In this file are defined the community detection engines used by community_detection.
+
+Girvan-Newman recomputes the edge betweenness after each edge removal (O(m^2 n)), which does not finish on the dense
+entity graphs. The engines below work on a compact adjacency (CSR arrays of the weighted graph) :
+    - louvain : weighted modularity optimization (local moves, then aggregation of the communities), the communities
+      which end up disconnected are split as in Leiden
+    - label_propagation : each node takes the label with the largest weight among its neighbors until it is stable
+Every engine returns a list of sets of nodes, the format taken by set_node_community.
+"""
+
+
+class CompactAdjacency:
+    """
+    Symmetric weighted adjacency of a graph in CSR layout : the neighbors of the node i are
+    indices[indptr[i]:indptr[i + 1]], with the weights data[indptr[i]:indptr[i + 1]].
+    A self loop of weight w is stored as A_ii = 2w, so that the strength of a node is the sum of its row
+    """
+    def __init__(self, nb_nodes, rows, columns, weights):
+        """
+        :param nb_nodes: [int]
+        :param rows: int array, row of each entry (each entry appears once, no duplicate)
+        :param columns: int array, column of each entry
+        :param weights: float array, weight of each entry
+        """
+        order = np.lexsort((columns, rows))
+        self.nb_nodes = nb_nodes
+        self.indptr = np.zeros(nb_nodes + 1, dtype=np.int64)
+        np.cumsum(np.bincount(rows, minlength=nb_nodes), out=self.indptr[1:])
+        self.indices = columns[order]
+        self.data = weights[order]
+        self.strength = np.bincount(rows, weights=weights, minlength=nb_nodes)
+        self.total_weight = self.strength.sum()
+
+    @classmethod
+    def from_graph(cls, graph, weight='weight'):
+        """
+        :param graph: undirected nxGraph
+        :param weight: edge attribute used as weight, 1 when an edge does not have it
+        :return: CompactAdjacency, list of the nodes of the graph (node i of the adjacency is nodes[i])
+        """
+        nodes = list(graph)
+        node_id = {node: idx for idx, node in enumerate(nodes)}
+        edges = list(graph.edges(data=weight, default=1))
+        edges_1 = np.array([node_id[u] for u, _, _ in edges], dtype=np.int64)
+        edges_2 = np.array([node_id[v] for _, v, _ in edges], dtype=np.int64)
+        edge_weights = np.array([w for _, _, w in edges], dtype=np.float64)
+        not_loop = edges_1 != edges_2
+        # self loops count twice in the strength of their node, as in the modularity of networkx
+        return cls(len(nodes), np.concatenate([edges_1, edges_2[not_loop]]),
+                   np.concatenate([edges_2, edges_1[not_loop]]),
+                   np.concatenate([np.where(not_loop, edge_weights, 2 * edge_weights), edge_weights[not_loop]])), nodes
+
+    def aggregate(self, labels, nb_labels):
+        """
+        :param labels: int array, community of each node in [0, nb_labels)
+        :param nb_labels: [int]
+        :return: CompactAdjacency with one node per community (the internal weights become self loops)
+        """
+        rows = np.repeat(labels, np.diff(self.indptr))
+        keys, inverse = np.unique(rows * nb_labels + labels[self.indices], return_inverse=True)
+        weights = np.bincount(inverse.reshape(-1), weights=self.data)
+        return CompactAdjacency(nb_labels, keys // nb_labels, keys % nb_labels, weights)
+
+    def modularity(self, labels, resolution=1):
+        """
+        :param labels: int array, community of each node
+        :param resolution: [float] resolution of the modularity
+        :return: [float] modularity of the partition (same value as nx.community.modularity)
+        """
+        if self.total_weight == 0:
+            return 0.0
+        rows = np.repeat(labels, np.diff(self.indptr))
+        internal = self.data[rows == labels[self.indices]].sum()
+        totals = np.bincount(labels, weights=self.strength)
+        return internal / self.total_weight - resolution * np.sum((totals / self.total_weight) ** 2)
+
+
+def relabel(labels):
+    """
+    :param labels: int array
+    :return: labels renumbered [0, nb_labels) by order of first appearance, nb_labels
+    """
+    _, first_idx, inverse = np.unique(labels, return_index=True, return_inverse=True)
+    rank = np.empty(len(first_idx), dtype=np.int64)
+    rank[np.argsort(first_idx)] = np.arange(len(first_idx))
+    return rank[inverse.reshape(-1)], len(first_idx)
+
+
+def local_moves(adjacency, resolution, rng, threshold=1e-7):
+    """
+    Louvain local moving phase : move each node to the neighbor community with the largest modularity gain until no
+    node moves
+    :param adjacency: CompactAdjacency
+    :param resolution: [float]
+    :param rng: random.Random, used for the order of the nodes
+    :param threshold: minimum modularity gain of a move
+    :return: int array, community of each node, True if at least two nodes were merged
+    """
+    indptr = adjacency.indptr.tolist()
+    indices = adjacency.indices.tolist()
+    data = adjacency.data.tolist()
+    strength = adjacency.strength.tolist()
+    scale = resolution / adjacency.total_weight
+    labels = list(range(adjacency.nb_nodes))
+    totals = list(strength)
+
+    order = list(range(adjacency.nb_nodes))
+    rng.shuffle(order)
+    improved = True
+    while improved:
+        improved = False
+        for node in order:
+            current = labels[node]
+            # weights from the node to each neighbor community (self loop excluded)
+            community_weights = {current: 0.0}
+            for idx in range(indptr[node], indptr[node + 1]):
+                neighbor = indices[idx]
+                if neighbor != node:
+                    community_weights[labels[neighbor]] = community_weights.get(labels[neighbor], 0.0) + data[idx]
+            totals[current] -= strength[node]
+            best, best_gain = current, community_weights[current] - scale * totals[current] * strength[node]
+            for community, weight in community_weights.items():
+                gain = weight - scale * totals[community] * strength[node]
+                if gain > best_gain + threshold:
+                    best, best_gain = community, gain
+            totals[best] += strength[node]
+            if best != current:
+                labels[node] = best
+                improved = True
+    labels, _ = relabel(np.array(labels, dtype=np.int64))
+    return labels, len(set(labels.tolist())) < adjacency.nb_nodes
+
+
+def split_disconnected(adjacency, labels):
+    """
+    :param adjacency: CompactAdjacency
+    :param labels: int array, community of each node
+    :return: labels where each community is connected : a community made of several components is split
+    """
+    parent = list(range(adjacency.nb_nodes))
+
+    def find(node):
+        while parent[node] != node:
+            parent[node] = parent[parent[node]]
+            node = parent[node]
+        return node
+
+    rows = np.repeat(np.arange(adjacency.nb_nodes), np.diff(adjacency.indptr))
+    internal = labels[rows] == labels[adjacency.indices]
+    for node_1, node_2 in zip(rows[internal].tolist(), adjacency.indices[internal].tolist()):
+        root_1, root_2 = find(node_1), find(node_2)
+        if root_1 != root_2:
+            parent[root_1] = root_2
+    return relabel(np.array([find(node) for node in range(adjacency.nb_nodes)], dtype=np.int64))[0]
+
+
+def louvain_labels(adjacency, resolution=1, seed=None):
+    """
+    :param adjacency: CompactAdjacency
+    :param resolution: [float] resolution of the modularity, > 1 for smaller communities
+    :param seed: seed of the order of the nodes in the local moves
+    :return: int array, community of each node
+    """
+    rng = random.Random(seed)
+    labels = np.arange(adjacency.nb_nodes)
+    if adjacency.total_weight == 0:
+        return labels
+    level = adjacency
+    while True:
+        level_labels, merged = local_moves(level, resolution, rng)
+        if not merged:
+            break
+        # each node of the current level is a community of the previous level
+        labels = level_labels[labels]
+        level = level.aggregate(level_labels, int(level_labels.max()) + 1)
+    return split_disconnected(adjacency, labels)
+
+
+def label_propagation_labels(adjacency, seed=None, max_iter=100):
+    """
+    :param adjacency: CompactAdjacency
+    :param seed: seed of the order of the nodes and of the ties
+    :param max_iter: maximum number of passes over the nodes
+    :return: int array, community of each node
+    """
+    rng = random.Random(seed)
+    indptr = adjacency.indptr.tolist()
+    indices = adjacency.indices.tolist()
+    data = adjacency.data.tolist()
+    labels = list(range(adjacency.nb_nodes))
+    order = list(range(adjacency.nb_nodes))
+    for _ in range(max_iter):
+        rng.shuffle(order)
+        changed = False
+        for node in order:
+            label_weights = {}
+            for idx in range(indptr[node], indptr[node + 1]):
+                if indices[idx] != node:
+                    label = labels[indices[idx]]
+                    label_weights[label] = label_weights.get(label, 0.0) + data[idx]
+            if not label_weights:
+                continue
+            max_weight = max(label_weights.values())
+            best_labels = [label for label, weight in label_weights.items() if weight == max_weight]
+            # the current label is kept when it is one of the best
+            if labels[node] not in best_labels:
+                labels[node] = rng.choice(best_labels)
+                changed = True
+        if not changed:
+            break
+    return relabel(np.array(labels, dtype=np.int64))[0]
+
+
+def labels_to_communities(labels, nodes):
+    """
+    :param labels: int array, community of each node
+    :param nodes: list of the nodes
+    :return: list of sets of nodes, from the largest community to the smallest
+    """
+    communities = {}
+    for node, label in zip(nodes, labels.tolist()):
+        communities.setdefault(label, set()).add(node)
+    return sorted(communities.values(), key=len, reverse=True)
+
+
+def louvain_communities(graph, weight='weight', resolution=1, seed=None):
+    """
+    :param graph: undirected nxGraph
+    :param weight: edge attribute used as weight
+    :param resolution: [float] resolution of the modularity, > 1 for smaller communities
+    :param seed: seed of the order of the nodes
+    :return: list of sets of nodes
+    """
+    adjacency, nodes = CompactAdjacency.from_graph(graph, weight=weight)
+    return labels_to_communities(louvain_labels(adjacency, resolution=resolution, seed=seed), nodes)
+
+
+def label_propagation_communities(graph, weight='weight', seed=None, max_iter=100):
+    """
+    :param graph: undirected nxGraph
+    :param weight: edge attribute used as weight
+    :param seed: seed of the order of the nodes and of the ties
+    :param max_iter: maximum number of passes over the nodes
+    :return: list of sets of nodes
+    """
+    adjacency, nodes = CompactAdjacency.from_graph(graph, weight=weight)
+    return labels_to_communities(label_propagation_labels(adjacency, seed=seed, max_iter=max_iter), nodes)
+
+
+def girvan_newman_communities(graph, weight='weight', seed=None):
+    """
+    First split of the Girvan-Newman method (edge betweenness, unweighted), kept for comparison
+    :param graph: undirected nxGraph
+    :return: list of sets of nodes
+    """
+    return list(next(nxcom.girvan_newman(graph)))
+
+
+COMMUNITY_ENGINES = {'louvain': louvain_communities,
+                     'label_propagation': label_propagation_communities,
+                     'girvan_newman': girvan_newman_communities}
+
+
+def detect_communities(graph, engine='louvain', weight='weight', seed=None):
+    """
+    :param graph: undirected nxGraph
+    :param engine: name of the engine (see COMMUNITY_ENGINES)
+    :param weight: edge attribute used as weight
+    :param seed: seed of the randomized engines
+    :return: list of sets of nodes (format taken by set_node_community)
+    """
+    if engine not in COMMUNITY_ENGINES:
+        raise ValueError("Unknown community engine " + engine + ", expected one of " + str(list(COMMUNITY_ENGINES)))
+    if graph.number_of_nodes() == 0:
+        return []
+    return COMMUNITY_ENGINES[engine](graph, weight=weight, seed=seed)
@@ -0,0 +1,152 @@
+import numpy as np
+
+"""
+In this file is defined the index of the occurences of each entity, shared by the graph builders.
+
+It is built once from the occurence list and holds int arrays instead of networkx neighbor lists :
+    - the occurences sorted by position (position, chapter, character name and entity of each of them)
+    - for each entity, the positions and chapters of its occurences, sorted by position (CSR layout : the occurences
+      of entity e are in [entity_offsets[e], entity_offsets[e + 1]))
+    - for each chapter, its occurences sorted by position (CSR layout with chapter_offsets)
+"""
+
+
+def group_by(keys, nb_groups):
+    """
+    :param keys: int array, group of each element, elements sorted by position
+    :param nb_groups: [int]
+    :return: order (indexes of the elements grouped by key, stable), offsets (int array of size nb_groups + 1)
+    """
+    order = np.argsort(keys, kind='stable')
+    offsets = np.zeros(nb_groups + 1, dtype=np.int64)
+    np.cumsum(np.bincount(keys, minlength=nb_groups), out=offsets[1:])
+    return order, offsets
+
+
+class EntityOccurrenceIndex:
+    """
+    Sorted arrays of the occurences of each entity and of each chapter
+    Entities are identified by their id : their rank of first appearance in the text (entity_names[id])
+    Chapters are identified by their rank in the sorted chapter_table
+    """
+    def __init__(self, positions, chapters, character_names, character_name_table, entity_ids, entity_names):
+        """
+        :param positions: int array, position of each occurence, sorted
+        :param chapters: int array, chapter of each occurence
+        :param character_names: int array, index in character_name_table of each occurence
+        :param character_name_table: list[str]
+        :param entity_ids: int array, entity id of each occurence
+        :param entity_names: list[str] name of each entity id
+        """
+        self.positions = positions
+        self.chapters = chapters
+        self.character_names = character_names
+        self.character_name_table = character_name_table
+        self.entity_ids = entity_ids
+        self.entity_names = entity_names
+        self.entity_id = {entity: idx for idx, entity in enumerate(entity_names)}
+
+        self.entity_occurences, self.entity_offsets = group_by(entity_ids, len(entity_names))
+        self.entity_positions = positions[self.entity_occurences]
+        self.entity_chapters = chapters[self.entity_occurences]
+
+        self.chapter_table, chapter_ranks = np.unique(chapters, return_inverse=True)
+        self.chapter_occurences, self.chapter_offsets = group_by(chapter_ranks.reshape(-1), len(self.chapter_table))
+
+    @classmethod
+    def from_occurences(cls, occurence_list):
+        """
+        :param occurence_list: OccurenceColumns with entities
+            As in the full graph, an occurence is identified by its character_name and position : if several occurences
+            have the same ones, the last one is kept
+        :return: EntityOccurrenceIndex
+        """
+        position = np.asarray(occurence_list.position, dtype=np.int64)
+        character_name = np.asarray(occurence_list.character_name, dtype=np.int64)
+        _, last_rows = np.unique((character_name * (int(position.max(initial=0)) + 1) + position)[::-1],
+                                 return_index=True)
+        rows = np.sort(len(position) - 1 - last_rows)
+        rows = rows[np.argsort(position[rows], kind='stable')]
+
+        # entity ids by order of first appearance in the text
+        entity_codes, first_idx, entity_ids = np.unique(np.asarray(occurence_list.entity)[rows], return_index=True,
+                                                        return_inverse=True)
+        rank = np.empty(len(entity_codes), dtype=np.int64)
+        rank[np.argsort(first_idx, kind='stable')] = np.arange(len(entity_codes))
+        entity_names = [occurence_list.entity_table[code] for code in entity_codes[np.argsort(first_idx)].tolist()]
+
+        return cls(position[rows], np.asarray(occurence_list.chapter, dtype=np.int64)[rows], character_name[rows],
+                   occurence_list.character_name_table, rank[entity_ids.reshape(-1)], entity_names)
+
+    def __len__(self):
+        return len(self.positions)
+
+    def occurence_key(self, idx):
+        """
+        :param idx: [int] index of an occurence (in the position order)
+        :return: (character_name, position) : the occurence node of the full graph
+        """
+        return self.character_name_table[self.character_names[idx]], int(self.positions[idx])
+
+    def occurence_keys(self, idxs=None):
+        """
+        :param idxs: int array of occurence indexes, by default all the occurences
+        :return: list of (character_name, position)
+        """
+        idxs = np.arange(len(self)) if idxs is None else idxs
+        return list(zip([self.character_name_table[name] for name in self.character_names[idxs].tolist()],
+                        self.positions[idxs].tolist()))
+
+    def occurence_entities(self, idxs=None):
+        """
+        :param idxs: int array of occurence indexes, by default all the occurences
+        :return: list of the entity names of the occurences
+        """
+        idxs = np.arange(len(self)) if idxs is None else idxs
+        return [self.entity_names[entity] for entity in self.entity_ids[idxs].tolist()]
+
+    def entity_slice(self, entity):
+        """
+        :param entity: name of the entity
+        :return: slice of the occurences of the entity in entity_occurences, entity_positions and entity_chapters
+        """
+        entity_id = self.entity_id[entity]
+        return slice(self.entity_offsets[entity_id], self.entity_offsets[entity_id + 1])
+
+    def first_positions(self):
+        """
+        :return: int array, position of the first occurence of each entity id
+        """
+        return self.entity_positions[self.entity_offsets[:-1]]
+
+    def last_positions(self):
+        """
+        :return: int array, position of the last occurence of each entity id
+        """
+        return self.entity_positions[self.entity_offsets[1:] - 1]
+
+    def first_and_last_chapters(self):
+        """
+        :return: two int arrays, rank (in chapter_table) of the first and of the last chapter where each entity id
+            appears
+        """
+        chapter_ranks = np.searchsorted(self.chapter_table, self.entity_chapters)
+        return chapter_ranks[self.entity_offsets[:-1]], chapter_ranks[self.entity_offsets[1:] - 1]
+
+    def time_pairs(self):
+        """
+        :return: two int arrays (i, j) of occurence indexes : j is the occurence of the same entity that follows i
+        """
+        is_same_entity = np.ones(len(self.entity_occurences) - 1 if len(self) > 0 else 0, dtype=bool)
+        is_same_entity[self.entity_offsets[1:-1] - 1] = False
+        return self.entity_occurences[:-1][is_same_entity], self.entity_occurences[1:][is_same_entity]
+
+    def chapter_slice(self, chapter):
+        """
+        :param chapter: [int] chapter
+        :return: int array, indexes of the occurences of the chapter, sorted by position
+        """
+        chapter_rank = np.searchsorted(self.chapter_table, chapter)
+        if chapter_rank == len(self.chapter_table) or self.chapter_table[chapter_rank] != chapter:
+            return np.zeros(0, dtype=np.int64)
+        return self.chapter_occurences[self.chapter_offsets[chapter_rank]:self.chapter_offsets[chapter_rank + 1]]
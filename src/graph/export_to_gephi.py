@@ -1,42 +1,47 @@
-import networkx as nx
 from .node_type import NodeType
+from .gexf_writer import GexfWriter
 from tqdm import tqdm
 
 """
 In this file are defined the functions that will be used to export the different character graph
 into a gexf format readable by gephi 
+The nodes and edges are streamed to the file by a GexfWriter, without copying the graph.
 """
 
+NODE_COLORS = {NodeType.CHAPTER: {'r': 255, 'g': 0, 'b': 0, 'a': 0},
+               NodeType.ENTITY: {'r': 0, 'g': 255, 'b': 0, 'a': 0},
+               NodeType.OCCURENCE: {'r': 0, 'g': 0, 'b': 255, 'a': 0}}
 
-def export_full_graph(full_graph, path, name):
+
+def gexf_path(path, name, compress=False):
+    """
+    :return: path of the file written by the export functions
+    """
+    return path + name + ('.gexf.gz' if compress else '.gexf')
+
+
+def export_full_graph(full_graph, path, name, prettyprint=True, compress=False):
     """
     Export the full graph it in GEXF format
     It is mandatory to convert Enum value that characterize EdgeType and NodeType to string before performing
     the writing in gext format
-    :param full_graph : nxGraph representing the full character graph
+    :param full_graph : nxGraph or SparseCharacterGraph representing the full character graph
     :param path: folder where to save the graph
     :param name: name of the file that will be create
+    :param prettyprint: False to write a compact file, without indentation
+    :param compress: True to write a gzip file (name.gexf.gz)
 
     """
-    gephi_graph = nx.Graph()
-    for node, data in full_graph.nodes(data=True):
-        color = {}
-        if data['type'] == NodeType.CHAPTER:
-            color = {'color': {'r': 255, 'g': 0, 'b': 0, 'a': 0}}
-        if data['type'] == NodeType.ENTITY:
-            color = {'color': {'r': 0, 'g': 255, 'b': 0, 'a': 0}}
-        if data['type'] == NodeType.OCCURENCE:
-            color = {'color': {'r': 0, 'g': 0, 'b': 255, 'a': 0}}
+    with GexfWriter(gexf_path(path, name, compress), viz=True, prettyprint=prettyprint,
+                    compress=compress) as writer:
+        for node, data in full_graph.nodes(data=True):
+            writer.write_node(node, label=str(data["type"]), color=NODE_COLORS.get(data['type']))
 
-        gephi_graph.add_node(node, label=str(data["type"]), viz=color)
+        for u_node, v_node, data in full_graph.edges(data=True):
+            writer.write_edge(u_node, v_node, label=str(data["type"]))
 
-    for u_node, v_node, data in full_graph.edges(data=True):
-        gephi_graph.add_edge(u_node, v_node, label=str(data["type"]))
 
-    nx.write_gexf(gephi_graph, path + name + '.gexf', prettyprint=True)
-
-
-def export_entity_graph(entity_graph, path, name):
+def export_entity_graph(entity_graph, path, name, prettyprint=True, compress=False):
     """
     Export the entity graph it in GEXF format
     It is mandatory to convert Enum value that characterize EdgeType and NodeType to string before performing
@@ -44,18 +49,19 @@ def export_entity_graph(entity_graph, path, name):
     :param entity_graph: nxGraph representing the entity interaction graph
     :param path: folder where to save the graph
     :param name: name of the file that will be create
+    :param prettyprint: False to write a compact file, without indentation
+    :param compress: True to write a gzip file (name.gexf.gz)
 
     """
-    gephi_graph = nx.Graph()
-    for node, data in entity_graph.nodes(data=True):
-        gephi_graph.add_node(node, label=str([node]))
+    with GexfWriter(gexf_path(path, name, compress), prettyprint=prettyprint, compress=compress) as writer:
+        for node in entity_graph.nodes:
+            writer.write_node(node, label=str([node]))
 
-    for u_node, v_node, data in entity_graph.edges(data=True):
-        gephi_graph.add_edge(u_node, v_node, label=str(data["type"]), weight=data["weight"])
+        for u_node, v_node, data in entity_graph.edges(data=True):
+            writer.write_edge(u_node, v_node, label=str(data["type"]), weight=data["weight"])
 
-    nx.write_gexf(gephi_graph, path + name + '.gexf', prettyprint=True)
 
-def export_dynamic_graph(dynamic_graph, path, name):
+def export_dynamic_graph(dynamic_graph, path, name, prettyprint=True, compress=False):
     """
     Export the dynamic graph in GEXF format
     The idea is to use a MultiGraph representation to facilitate the transcription.
@@ -74,26 +80,22 @@ def export_dynamic_graph(dynamic_graph, path, name):
     We used this trick because we did not manage to create an edge attribute which vary over time
         -> Here in fact, we delete the edge and create a new one each time the attribute changes
 
+    The edges of the MultiGraph are directly written in the file, one spell after the other.
+
     :param dynamic_graph: nx.Graph representating the dynamic graph
     :param path: folder where to save the graph
     :param name: name of the file that will be create
+    :param prettyprint: False to write a compact file, without indentation
+    :param compress: True to write a gzip file (name.gexf.gz)
     """
-    gephi_graph = nx.MultiGraph()
-    for node, data in dynamic_graph.nodes(data=True):
-        gephi_graph.add_node(node, label=str([node]), start=float(data['start']))
-
-    print('Export dynamic graph')
-    for u_node, v_node, data in tqdm(dynamic_graph.edges(data=True)):
-        nb_of_interaction = 1
-        i = 0
-        while i < len(data["positions"]):
-            edge_dict = {'start': float(data["positions"][i]),
-                         'weight': nb_of_interaction}
-            if i + 1 < len(data["positions"]):
-                edge_dict['end'] = float(data["positions"][i+1])
-            gephi_graph.add_edge(u_node, v_node, **edge_dict)
-            i += 1
-            nb_of_interaction += 1
-
-    nx.write_gexf(gephi_graph, path + name + '.gexf', prettyprint=True)
-
+    with GexfWriter(gexf_path(path, name, compress), mode='dynamic', prettyprint=prettyprint,
+                    compress=compress) as writer:
+        for node, data in dynamic_graph.nodes(data=True):
+            writer.write_node(node, label=str([node]), start=float(data['start']))
+
+        print('Export dynamic graph')
+        for u_node, v_node, data in tqdm(dynamic_graph.edges(data=True)):
+            positions = data["positions"]
+            for i in range(len(positions)):
+                end = float(positions[i + 1]) if i + 1 < len(positions) else None
+                writer.write_edge(u_node, v_node, weight=i + 1, start=float(positions[i]), end=end)
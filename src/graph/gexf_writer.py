@@ -0,0 +1,117 @@
+import datetime
+import gzip
+from xml.sax.saxutils import quoteattr
+
+"""
+In this file is defined a streaming GEXF writer.
+
+nx.write_gexf needs a copy of the graph with the gephi attributes and builds the whole XML tree in memory before
+writing it. GexfWriter writes each node and edge as soon as it is given, so the exports do not keep anything in memory
+but the file buffer, whatever the size of the graph.
+"""
+
+GEXF_NAMESPACE = 'http://www.gexf.net/1.2draft'
+
+
+class GexfWriter:
+    """
+    Write a GEXF 1.2 file (readable by gephi) node by node, then edge by edge :
+
+        with GexfWriter('data/graph/book-graph.gexf', mode='dynamic') as writer:
+            writer.write_node('HARRY POTTER', label='HARRY POTTER', start=47.0)
+            ...
+            writer.write_edge('HARRY POTTER', 'RON WEASLEY', weight=1, start=47.0, end=62.0)
+
+    All the nodes must be written before the first edge.
+    """
+    def __init__(self, path, mode='static', viz=False, prettyprint=True, compress=False):
+        """
+        :param path: path of the file to create
+        :param mode: 'static' or 'dynamic' (nodes and edges with start and end in the timeline)
+        :param viz: True if the nodes have a color (gephi viz namespace)
+        :param prettyprint: True to indent the file, False to write one element after the other without spaces
+        :param compress: True to write a gzip file (gephi opens .gexf.gz files)
+        """
+        self.file = gzip.open(path, 'wt', encoding='utf-8') if compress else open(path, 'w', encoding='utf-8')
+        self.prettyprint = prettyprint
+        self.nb_edges = 0
+        self.section = None
+
+        namespaces = 'xmlns="%s"' % GEXF_NAMESPACE
+        if viz:
+            namespaces += ' xmlns:viz="%s/viz"' % GEXF_NAMESPACE
+        self.file.write("<?xml version='1.0' encoding='utf-8'?>")
+        self.write_line(0, '<gexf %s xmlns:xsi="http://www.w3.org/2001/XMLSchema-instance" '
+                           'xsi:schemaLocation="%s %s/gexf.xsd" version="1.2">'
+                        % (namespaces, GEXF_NAMESPACE, GEXF_NAMESPACE))
+        self.write_line(1, '<meta lastmodifieddate="%s">' % datetime.date.today().isoformat())
+        self.write_line(2, '<creator>Dynamic-Graph-Networks</creator>')
+        self.write_line(1, '</meta>')
+        time_format = ' timeformat="double"' if mode == 'dynamic' else ''
+        self.write_line(1, '<graph defaultedgetype="undirected" mode="%s" name=""%s>' % (mode, time_format))
+
+    def write_line(self, depth, element):
+        if self.prettyprint:
+            self.file.write('\n' + '  ' * depth)
+        self.file.write(element)
+
+    def open_section(self, section):
+        if self.section == section:
+            return
+        if section == 'nodes' and self.section is not None:
+            raise ValueError('All the nodes must be written before the edges')
+        if self.section is not None:
+            self.write_line(2, '</%s>' % self.section)
+        self.write_line(2, '<%s>' % section)
+        self.section = section
+
+    @staticmethod
+    def attributes(**attributes):
+        return ''.join(' %s=%s' % (name, quoteattr(str(value)))
+                       for name, value in attributes.items() if value is not None)
+
+    def write_node(self, node, label=None, start=None, end=None, color=None):
+        """
+        :param node: node of the graph, its id in the file is str(node)
+        :param label: str
+        :param start: float, position in the timeline where the node appears (dynamic mode)
+        :param end: float, position in the timeline where the node disappears (dynamic mode)
+        :param color: dict {'r': [int], 'g': [int], 'b': [int], 'a': [int]}
+        """
+        self.open_section('nodes')
+        attributes = self.attributes(id=node, label=label, start=start, end=end)
+        if color is None:
+            self.write_line(3, '<node%s />' % attributes)
+        else:
+            self.write_line(3, '<node%s>' % attributes)
+            self.write_line(4, '<viz:color%s />' % self.attributes(**color))
+            self.write_line(3, '</node>')
+
+    def write_edge(self, source, target, label=None, weight=None, start=None, end=None):
+        """
+        :param source: node of the graph
+        :param target: node of the graph
+        :param label: str
+        :param weight: number
+        :param start: float, position in the timeline where the edge appears (dynamic mode)
+        :param end: float, position in the timeline where the edge disappears (dynamic mode)
+        """
+        self.open_section('edges')
+        self.write_line(3, '<edge%s />' % self.attributes(id=self.nb_edges, source=source, target=target, label=label,
+                                                          weight=weight, start=start, end=end))
+        self.nb_edges += 1
+
+    def close(self):
+        if self.section is None:
+            self.open_section('nodes')
+        self.write_line(2, '</%s>' % self.section)
+        self.write_line(1, '</graph>')
+        self.write_line(0, '</gexf>')
+        self.file.write('\n')
+        self.file.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
@@ -0,0 +1,81 @@
+import json
+import os
+import pickle
+
+"""
+In this file is defined the on-disk bundle of the graphs computed for a book.
+
+A bundle is a folder data/graph/book_name-bundle/ which contains :
+    - bundle.json : version of the bundle format, windows size and backend used to build the graphs
+    - one pickle file per artifact (full graph, entity graph, dynamic graph, per-chapter entity graphs)
+Each artifact is unpickled only when it is asked for, so that an analysis which only needs the entity graphs
+does not pay for the full graph.
+"""
+
+GRAPH_BUNDLE_VERSION = 1
+GRAPH_ARTIFACTS = ['full_graph', 'entity_graph', 'dynamic_graph', 'entity_chapter_graphs']
+
+
+class GraphBundle:
+    """
+    Versioned folder of pickled graphs. A bundle written with another GRAPH_BUNDLE_VERSION is considered as missing.
+    """
+    def __init__(self, book_name, folder='data/graph/'):
+        """
+        :param book_name: str
+        :param folder: folder where the bundle folder is stored
+        """
+        self.path = os.path.join(folder, book_name + '-bundle')
+        self.manifest_path = os.path.join(self.path, 'bundle.json')
+        self.artifacts = {}
+
+    def manifest(self):
+        """
+        :return: dict stored in bundle.json, None if the bundle does not exist or has another version
+        """
+        if not os.path.exists(self.manifest_path):
+            return None
+        with open(self.manifest_path) as f:
+            manifest = json.load(f)
+        if manifest.get('version') != GRAPH_BUNDLE_VERSION:
+            return None
+        return manifest
+
+    def exists(self):
+        """
+        :return: True if the bundle exists, with the current version and all its artifacts
+        """
+        manifest = self.manifest()
+        return manifest is not None and \
+            all(os.path.exists(self.artifact_path(name)) for name in manifest['artifacts'])
+
+    def artifact_path(self, name):
+        return os.path.join(self.path, name + '.pkl')
+
+    def save(self, artifacts, windows_size, sparse=False):
+        """
+        :param artifacts: dict artifact name (see GRAPH_ARTIFACTS) -> graph or list of graphs
+        :param windows_size: [int] size of the co-occurence windows used to build the graphs
+        :param sparse: True if the full graph is a SparseCharacterGraph
+        """
+        os.makedirs(self.path, exist_ok=True)
+        # the manifest is removed first so that an interrupted save does not leave a valid bundle
+        if os.path.exists(self.manifest_path):
+            os.remove(self.manifest_path)
+        for name, artifact in artifacts.items():
+            with open(self.artifact_path(name), 'wb') as f:
+                pickle.dump(artifact, f, protocol=pickle.HIGHEST_PROTOCOL)
+            self.artifacts[name] = artifact
+        with open(self.manifest_path, 'w') as f:
+            json.dump({'version': GRAPH_BUNDLE_VERSION, 'windows_size': windows_size, 'sparse': sparse,
+                       'artifacts': sorted(artifacts)}, f, indent=1)
+
+    def load(self, name):
+        """
+        :param name: artifact name (see GRAPH_ARTIFACTS)
+        :return: the artifact, unpickled on the first call
+        """
+        if name not in self.artifacts:
+            with open(self.artifact_path(name), 'rb') as f:
+                self.artifacts[name] = pickle.load(f)
+        return self.artifacts[name]
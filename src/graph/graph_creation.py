@@ -1,11 +1,22 @@
 import networkx as nx
-from tqdm import tqdm
-from itertools import product
+import numpy as np
 import pickle
 
+from src.storage import load_occurences
 from .edge_type import EdgeType
 from .node_type import NodeType
 from .export_to_gephi import export_full_graph, export_dynamic_graph, export_entity_graph
+from .interaction_counting import count_entity_interactions, entity_graph_from_counts, interaction_timeline, \
+    window_pairs, entity_graphs_by_window, multi_window_interaction_counts
+from .sparse_graph import SparseCharacterGraph
+from .graph_bundle import GraphBundle
+from .entity_index import EntityOccurrenceIndex
+from .temporal_index import TemporalInteractionIndex
+
+# Attributes that are materialized on their first access (see CharacterGraph.__getattr__)
+LAZY_ATTRIBUTES = ['occurence_list', 'entity_index', 'full_graph', 'chapter_nodes', 'occurence_nodes', 'entity_nodes',
+                   'entity_graph', 'dynamic_graph', 'temporal_index', 'entity_chapter_graphs']
+
 
 class CharacterGraph:
     """
@@ -21,77 +32,143 @@ class CharacterGraph:
         - EdgeType.BELONG_TO
         - EdgeType.IS_ENTITY
     """
-    def __init__(self, book_name, windows_size=20):
+    def __init__(self, book_name, windows_size=20, sparse=False):
         """
-        Genere a ChacterGraph from a occurence list (must be present as a pickle file in data/entity_list
-        :param book_name : str. Except to have a book_name_occ_list.pkl file in data/entity_list which contains
+        Genere a ChacterGraph from a occurence list (must be present in data/entity_list)
+        :param book_name : str. Except to have a book_name_occ_list folder (columnar format, see src.storage) or
+            a book_name_occ_list.pkl file in data/entity_list which contains
             occurence_list: list[dict ('character_name':[str], 'position':[int], 'chapter':[int], 'entities':[str]])
         :param windows_size: [int] size of the co-occurence windows
             -> 2 occurence nodes will be connected by an interaction edges if they appears together within a windows
             of windows_size tokens
+        :param sparse: True to store the full graph as a SparseCharacterGraph (integer node ids and CSR adjacency
+            arrays) instead of a networkx graph. It can be converted with self.full_graph.to_networkx()
         """
         self.book_name = book_name
+        self.bundle = None
+        self.sparse = sparse
         self.full_graph = nx.Graph()
         self.windows_size = windows_size
         self.chapter_nodes = set()
         self.occurence_nodes = set()
         self.entity_nodes = set()
 
-        self.occurence_list = pickle.load(open('data/entity_list/' + book_name + '_occ_list.pkl', 'rb'))
+        self.occurence_list = load_occurences('data/entity_list/' + book_name + '_occ_list')
         self.generate_full_graph()
 
+    @classmethod
+    def load(cls, book_name, folder='data/graph/'):
+        """
+        Load the graphs saved by generate_and_save in data/graph/book_name-bundle without building anything :
+        the full graph, entity graph, dynamic graph, per-chapter entity graphs (and the occurence list) are only
+        read when they are accessed for the first time
+        :param book_name: str
+        :param folder: folder containing the bundle
+        :return: CharacterGraph
+        """
+        bundle = GraphBundle(book_name, folder=folder)
+        if not bundle.exists():
+            raise FileNotFoundError("No graph bundle for " + book_name + " in " + bundle.path +
+                                    ", use CharacterGraph(book_name).generate_and_save() to create it")
+        manifest = bundle.manifest()
+        character_graph = cls.__new__(cls)
+        character_graph.book_name = book_name
+        character_graph.bundle = bundle
+        character_graph.sparse = manifest['sparse']
+        character_graph.windows_size = manifest['windows_size']
+        return character_graph
+
+    def __getattr__(self, name):
+        """
+        Only called when the attribute does not exist yet : materialize the lazy attributes on their first access,
+        from the bundle when the graph was loaded with CharacterGraph.load, or by computing them
+        """
+        if name not in LAZY_ATTRIBUTES or 'book_name' not in self.__dict__:
+            raise AttributeError(name)
+        bundle = self.__dict__.get('bundle')
+        if bundle is not None and name in bundle.manifest()['artifacts']:
+            value = bundle.load(name)
+        elif name == 'occurence_list':
+            value = load_occurences('data/entity_list/' + self.book_name + '_occ_list')
+        elif name == 'entity_index':
+            value = EntityOccurrenceIndex.from_occurences(self.occurence_list)
+        elif name == 'chapter_nodes':
+            value = set(self.filter_nodes(NodeType.CHAPTER))
+        elif name == 'entity_nodes':
+            value = set(self.filter_nodes(NodeType.ENTITY))
+        elif name == 'occurence_nodes':
+            value = set() if self.sparse else set(self.filter_nodes(NodeType.OCCURENCE))
+        elif name == 'entity_graph':
+            value = self.entity_interaction_graph(self.full_graph)
+        elif name == 'dynamic_graph':
+            value = self.dynamic_entity_interaction_graph()
+        elif name == 'temporal_index':
+            value = TemporalInteractionIndex.from_dynamic_graph(self.dynamic_graph)
+        elif name == 'entity_chapter_graphs':
+            value = self.entity_graph_by_chapter()
+        else:
+            raise AttributeError(name)
+        setattr(self, name, value)
+        return value
+
     def generate_full_graph(self):
         """
         Generate a networkx graph from the occurence_list as describe in report
         :return: the networkx graph
         """
         print("-- GENERATE FULL GRAPH --")
+        if self.sparse:
+            # occurence_nodes is not filled : it would build one tuple per occurence
+            self.full_graph = SparseCharacterGraph.from_index(self.entity_index, self.windows_size)
+            self.chapter_nodes = set(self.full_graph.filter_nodes(NodeType.CHAPTER))
+            self.entity_nodes = set(self.full_graph.filter_nodes(NodeType.ENTITY))
+            return self.full_graph
+
+        occurences = self.occurence_list.records()
+
         # Generate occurence nodes
-        self.occurence_nodes = set((occurence['character_name'], occurence['position'])
-                                   for occurence in self.occurence_list)
+        self.occurence_nodes = set((character_name, position) for character_name, position, _, _ in occurences)
         for node in self.occurence_nodes:
             self.full_graph.add_node(node, type=NodeType.OCCURENCE)
 
         # Generate chapter nodes
-        self.chapter_nodes = set(occurence['chapter'] for occurence in self.occurence_list)
+        self.chapter_nodes = set(chapter for _, _, chapter, _ in occurences)
         for node in self.chapter_nodes:
             self.full_graph.add_node(node, type=NodeType.CHAPTER)
 
         # Generate entity nodes
-        self.entity_nodes = set(occurence['entity'] for occurence in self.occurence_list)
+        self.entity_nodes = set(entity for _, _, _, entity in occurences)
         for node in self.entity_nodes:
             self.full_graph.add_node(node, type=NodeType.ENTITY)
 
         # Generate belong_to (chapter) and is_entity edges
-        for occurence in self.occurence_list:
-            self.full_graph.add_edge((occurence['character_name'], occurence['position']),
-                                     (occurence['entity']),
+        for character_name, position, chapter, entity in occurences:
+            self.full_graph.add_edge((character_name, position),
+                                     (entity),
                                      type=EdgeType.IS_ENTITY)
 
-            self.full_graph.add_edge((occurence['character_name'], occurence['position']),
-                                     (occurence['chapter']),
+            self.full_graph.add_edge((character_name, position),
+                                     (chapter),
                                      type=EdgeType.BELONG_TO)
 
         # Generate time edges
-        for entity_node in self.entity_nodes:
-            list_of_occurence_nodes = self.full_graph.neighbors(entity_node)
-            occurence_nodes_sort_by_pos = sorted(list_of_occurence_nodes, key=lambda x: x[1])
-            for idx in range(len(occurence_nodes_sort_by_pos) - 1):
-                self.full_graph.add_edge(occurence_nodes_sort_by_pos[idx],
-                                         occurence_nodes_sort_by_pos[idx+1],
-                                         type=EdgeType.TIME)
+        # consecutive occurences of each entity, read from the entity index
+        occurence_nodes_sort_by_pos = self.entity_index.occurence_keys()
+        idx_current_nodes, idx_next_nodes = self.entity_index.time_pairs()
+        self.full_graph.add_edges_from(((occurence_nodes_sort_by_pos[idx_current_node],
+                                         occurence_nodes_sort_by_pos[idx_next_node])
+                                        for idx_current_node, idx_next_node in zip(idx_current_nodes.tolist(),
+                                                                                   idx_next_nodes.tolist())),
+                                       type=EdgeType.TIME)
 
         # Generate interaction edges
-        occurence_nodes_sort_by_pos = sorted(list(self.occurence_nodes), key=lambda x: x[1])
-        for idx_current_node in tqdm(range(len(occurence_nodes_sort_by_pos))):
-            idx_other_node = idx_current_node + 1
-            current_pos = occurence_nodes_sort_by_pos[idx_current_node][1]
-            while idx_other_node < len(occurence_nodes_sort_by_pos) and \
-                  occurence_nodes_sort_by_pos[idx_other_node][1] - current_pos < self.windows_size:
-                self.full_graph.add_edge(occurence_nodes_sort_by_pos[idx_current_node],
-                                         occurence_nodes_sort_by_pos[idx_other_node],
-                                         type=EdgeType.INTERACT_WITH)
-                idx_other_node += 1
+        # all the pairs of occurences within the windows are found at once on the sorted positions
+        idx_current_nodes, idx_other_nodes = window_pairs(self.entity_index.positions, self.windows_size)
+        self.full_graph.add_edges_from(((occurence_nodes_sort_by_pos[idx_current_node],
+                                         occurence_nodes_sort_by_pos[idx_other_node])
+                                        for idx_current_node, idx_other_node in zip(idx_current_nodes.tolist(),
+                                                                                    idx_other_nodes.tolist())),
+                                       type=EdgeType.INTERACT_WITH)
 
         return self.full_graph
 
@@ -100,6 +177,8 @@ class CharacterGraph:
         :param node_type: [NodeType]
         :return: all the node from the fullgraph that have the given type
         """
+        if self.sparse:
+            return self.full_graph.filter_nodes(node_type)
         return [node for node, data in self.full_graph.nodes(data=True) if data["type"] == node_type]
 
     def subgraph_from_chapter(self, chapter_idx):
@@ -110,22 +189,37 @@ class CharacterGraph:
         - all occurence nodes that are directly connected to this chapter node
         - all entity nodes that are directly connected to those occurence nodes
         :param chapter_idx: [int]
-        :return: nxGraph
+        :return: nxGraph (SparseCharacterGraph with the sparse backend)
         """
-        occurence_nodes_in_chapter = list(self.full_graph.neighbors(chapter_idx))
-        entity_nodes_in_chapter = set(node for occurence in occurence_nodes_in_chapter
-                                      for node in self.full_graph.neighbors(occurence)
-                                      if self.full_graph.nodes[node]["type"] == NodeType.ENTITY)
+        if self.sparse:
+            return self.full_graph.subgraph_from_chapter(chapter_idx)
+        if chapter_idx not in self.full_graph:
+            raise nx.NetworkXError("The node %s is not in the graph." % chapter_idx)
+        occurences_in_chapter = self.entity_index.chapter_slice(chapter_idx)
+        occurence_nodes_in_chapter = self.entity_index.occurence_keys(occurences_in_chapter)
+        entity_nodes_in_chapter = set(self.entity_index.occurence_entities(occurences_in_chapter))
         return self.full_graph.subgraph([chapter_idx] + occurence_nodes_in_chapter + list(entity_nodes_in_chapter))
 
     def entity_graph_by_chapter(self):
         """
         Compute the entity interaction graph, chapter by chapter
-        :return: list[nxGraph]
+        The occurences of each chapter are read from the entity index, already sorted by position : the interactions
+        of a chapter are counted on its window pairs (see interaction_counting.multi_window_interaction_counts)
+        instead of building the subgraph of the chapter
+        :return: list[nxGraph], in the order of the chapter nodes of the full graph
         """
         print('Chapter Entity graph')
-        chapter_nodes = self.filter_nodes(NodeType.CHAPTER)
-        return [self.entity_interaction_graph(self.subgraph_from_chapter(chapter)) for chapter in chapter_nodes]
+        entity_chapter_graphs = []
+        for chapter in self.filter_nodes(NodeType.CHAPTER):
+            occurences_in_chapter = self.entity_index.chapter_slice(chapter)
+            entity_ids = self.entity_index.entity_ids[occurences_in_chapter]
+            counts = multi_window_interaction_counts(self.entity_index.positions[occurences_in_chapter], entity_ids,
+                                                     [self.windows_size])[self.windows_size]
+            entity_nodes = [self.entity_index.entity_names[entity] for entity in dict.fromkeys(entity_ids.tolist())]
+            entity_chapter_graphs.append(entity_graph_from_counts(
+                entity_nodes, {(self.entity_index.entity_names[entity_1], self.entity_index.entity_names[entity_2]):
+                               nb_interactions for (entity_1, entity_2), nb_interactions in counts.items()}))
+        return entity_chapter_graphs
 
     @staticmethod
     def entity_interaction_graph(graph):
@@ -134,82 +228,101 @@ class CharacterGraph:
         Following the interaction definition we used, two entities interacted if there exist two occurence_nodes
         that are each connected to those entity are linked together by a edge of type INTERACT_WITH
         As a result, the number of interaction between two entities is the number of path of size 3 between the
-        two entity node in the graph
+        two entity node in the graph.
+        Those paths are not enumerated : we count them in one pass over the INTERACT_WITH edges
+        (see interaction_counting.count_entity_interactions)
 
-        :param graph: nxGraph
+        :param graph: nxGraph or SparseCharacterGraph
         :return: a undirected weight nxGraph where the node represent the entity and the weight the number of time
         the entities interacted between each other
         """
-        entity_nodes = [node for node, data in graph.nodes(data=True) if data["type"] == NodeType.ENTITY]
-        # entity_nodes = self.entity_nodes
-        entity_graph = nx.Graph()
-
         print("-- GENERATE ENTITY INTERACTION GRAPH --")
+        if isinstance(graph, SparseCharacterGraph):
+            entity_nodes = graph.filter_nodes(NodeType.ENTITY)
+            interaction_counter = graph.count_entity_interactions()
+        else:
+            entity_nodes = [node for node, data in graph.nodes(data=True) if data["type"] == NodeType.ENTITY]
+            interaction_counter = count_entity_interactions(graph)
 
-        for entity in entity_nodes:
-            entity_graph.add_node(entity,type=NodeType.ENTITY)
-
-        for entity_1, entity_2 in tqdm(list(product(entity_nodes, entity_nodes))):
-            if entity_1 != entity_2:
-                nb_interactions = len(list(nx.all_simple_paths(graph, source=entity_1, target=entity_2, cutoff=3)))
-                if nb_interactions > 0:
-                    entity_graph.add_edge(entity_1, entity_2, weight=nb_interactions, type=EdgeType.INTERACT_WITH)
+        return entity_graph_from_counts(entity_nodes, interaction_counter)
 
-        return entity_graph
+    def entity_graphs_by_window(self, windows_sizes):
+        """
+        Compute the entity interaction graph for several windows sizes in one pass over the sorted occurences,
+        to compare windows sizes without building a CharacterGraph for each of them
+        (see interaction_counting.multi_window_interaction_counts)
+        :param windows_sizes: list[int] sizes of the co-occurence windows
+        :return: dict windows_size -> entity interaction graph
+        """
+        print("-- GENERATE ENTITY INTERACTION GRAPHS OF", len(set(windows_sizes)), "WINDOWS SIZES --")
+        return entity_graphs_by_window(self.entity_index, windows_sizes)
 
-    def dynamic_entity_interaction_graph(self):
+    def dynamic_entity_interaction_graph(self, array_positions=False):
         """
         From the full character graph, compute a dynamic entity interaction graph.
         This graph will only be composed of Entity node and INTERACT_WTI Edge.
         The timeline will be defined using the position in the text, ie from [0, nb_token_in_the_novel]
         Each entity node will comporte a start attribute : first time it appears in the ext
         Each interaction edge will  comporte a postions of attribute : list of each interaction position in the text
+        The positions are collected in one sweep over the occurences sorted by position
+        (see interaction_counting.interaction_timeline)
+        :param array_positions: True to store the positions of each edge as a numpy array instead of a list
         :return: nxGraph - dynamic entity interaction graph.
         """
         dynamic_graph = nx.Graph()
 
-        entity_nodes = [node for node, data in self.full_graph.nodes(data=True) if data["type"] == NodeType.ENTITY]
-        for entity_node in entity_nodes:
-            first_occurence = min(list(self.full_graph.neighbors(entity_node)), key=lambda x: x[1])[1]
-            dynamic_graph.add_node(entity_node, start=first_occurence)
+        print("-- GENERATE DYNAMIC GRAPH --")
+        occurences = list(zip(self.entity_index.positions.tolist(), self.entity_index.occurence_entities()))
+        first_position = dict(zip(self.entity_index.entity_names, self.entity_index.first_positions().tolist()))
+        _, interaction_positions = interaction_timeline(occurences, self.windows_size, first_position=first_position)
 
-        entity_nodes_with_occ = list(dynamic_graph.nodes(data=True))
+        for entity_node, start in first_position.items():
+            dynamic_graph.add_node(entity_node, start=start)
 
-        print("-- GENERATE DYNAMIC GRAPH --")
-        for (entity_1, data_1), (entity_2, data_2) in tqdm(list(product(entity_nodes_with_occ, entity_nodes_with_occ))):
-            if entity_1 != entity_2 and data_1["start"] < data_2["start"]:
-                interactions = (list(nx.all_simple_paths(self.full_graph, source=entity_1, target=entity_2, cutoff=3)))
-                # By construction of the full graph each, interaction of the list interactions is a list or 4 nodes :
-                # ent_1 -> occurence of ent_1 -> occurence of ent_2 -> ent_2
-                # we will store for each interaction the position value of (occurence of ent_1)
-                if len(interactions) > 0:
-                    interaction_positions = list(map(lambda interaction: interaction[1][1], interactions))
-                    dynamic_graph.add_edge(entity_1, entity_2,
-                                           positions=interaction_positions,
-                                           type=EdgeType.INTERACT_WITH)
+        for (entity_1, entity_2), positions in interaction_positions.items():
+            if array_positions:
+                positions = np.array(positions, dtype=np.int64)
+            dynamic_graph.add_edge(entity_1, entity_2,
+                                   positions=positions,
+                                   type=EdgeType.INTERACT_WITH)
 
         return dynamic_graph
 
-    def generate_and_save(self):
+    def generate_and_save(self, prettyprint=True, compress=False):
+        """
+        Generate the entity, dynamic and chapter graphs, export them in data/graph and save them in the graph bundle
+        (see CharacterGraph.load)
+        :param prettyprint: False to write compact gexf files, without indentation
+        :param compress: True to write gzip gexf files (.gexf.gz)
+        :return: full graph, entity graph, dynamic graph, list of chapter graphs, list of chapter entity graphs
+        """
 
         # Full graph
-        export_full_graph(self.full_graph, 'data/graph/', name=self.book_name + "-full-graph")
+        export_full_graph(self.full_graph, 'data/graph/', name=self.book_name + "-full-graph",
+                          prettyprint=prettyprint, compress=compress)
 
         # Entity graph
-        entity_graph = self.entity_interaction_graph(self.full_graph)
+        entity_graph = self.entity_graph
         pickle.dump(entity_graph, open('data/graph/' + self.book_name + '-entity-graph.pkl', 'wb'))
-        export_entity_graph(entity_graph, path='data/graph/', name=self.book_name + "-entity-graph")
+        export_entity_graph(entity_graph, path='data/graph/', name=self.book_name + "-entity-graph",
+                            prettyprint=prettyprint, compress=compress)
 
         # Dynamic graph
-        dynamic_graph = self.dynamic_entity_interaction_graph()
-        export_dynamic_graph(dynamic_graph, path='data/graph/', name=self.book_name + "-dynamic-graph")
+        dynamic_graph = self.dynamic_graph
+        export_dynamic_graph(dynamic_graph, path='data/graph/', name=self.book_name + "-dynamic-graph",
+                             prettyprint=prettyprint, compress=compress)
 
         # Chapters graph
         chapters_graph = [self.subgraph_from_chapter(chapter)
                           for chapter in range(len(self.chapter_nodes))]
 
         # Entity chapter graph
-        entity_chapter_graph = self.entity_graph_by_chapter()
+        entity_chapter_graph = self.entity_chapter_graphs
+
+        # Bundle reloaded by CharacterGraph.load
+        self.bundle = GraphBundle(self.book_name)
+        self.bundle.save({'full_graph': self.full_graph, 'entity_graph': entity_graph, 'dynamic_graph': dynamic_graph,
+                          'entity_chapter_graphs': entity_chapter_graph}, self.windows_size, sparse=self.sparse)
 
         return self.full_graph, entity_graph, dynamic_graph, chapters_graph, entity_chapter_graph
 
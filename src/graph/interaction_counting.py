@@ -0,0 +1,194 @@
+import networkx as nx
+import numpy as np
+from collections import Counter
+
+from .edge_type import EdgeType
+from .node_type import NodeType
+
+"""
+In this file are defined the functions used to count the interactions between entities.
+
+Following the interaction definition we used, two entities interacted each time two of their occurence nodes are
+linked together by an INTERACT_WITH edge. Instead of enumerating the paths of size 3 between every pair of entity
+nodes, we make one pass over the INTERACT_WITH edges, map each endpoint to its entity through its IS_ENTITY edge
+and add up the number of interactions of each pair of entities in a single sparse accumulator (a Counter whose keys
+are the pairs that actually interacted).
+"""
+
+
+def occurence_to_entity(graph):
+    """
+    :param graph: nxGraph containing occurence and entity nodes
+    :return: dict occurence_node -> entity_node, built from the IS_ENTITY edges of the graph
+    """
+    occ_to_entity = {}
+    for u_node, v_node, data in graph.edges(data=True):
+        if data["type"] == EdgeType.IS_ENTITY:
+            if graph.nodes[u_node]["type"] == NodeType.ENTITY:
+                occ_to_entity[v_node] = u_node
+            else:
+                occ_to_entity[u_node] = v_node
+    return occ_to_entity
+
+
+def count_entity_interactions(graph):
+    """
+    Count the number of interactions between each pair of entities of the graph
+    :param graph: nxGraph containing occurence, entity (and possibly chapter) nodes
+    :return: Counter (entity_1, entity_2) -> nb of interactions
+        Each pair of entities only appears once, ordered as the entities appear in graph.nodes
+    """
+    occ_to_entity = occurence_to_entity(graph)
+    entity_rank = {node: rank for rank, node in enumerate(graph.nodes)}
+
+    interaction_counter = Counter()
+    for u_node, v_node, data in graph.edges(data=True):
+        if data["type"] != EdgeType.INTERACT_WITH:
+            continue
+        entity_1 = occ_to_entity.get(u_node)
+        entity_2 = occ_to_entity.get(v_node)
+        if entity_1 is None or entity_2 is None or entity_1 == entity_2:
+            continue
+        if entity_rank[entity_1] > entity_rank[entity_2]:
+            entity_1, entity_2 = entity_2, entity_1
+        interaction_counter[(entity_1, entity_2)] += 1
+
+    return interaction_counter
+
+
+def entity_graph_from_counts(entity_nodes, interaction_counter):
+    """
+    :param entity_nodes: iterable of entity nodes, all of them will be present in the entity graph
+    :param interaction_counter: Counter (entity_1, entity_2) -> nb of interactions
+    :return: a undirected weight nxGraph where the node represent the entity and the weight the number of time
+        the entities interacted between each other
+        Edges are inserted following the order of entity_nodes, so that the adjacency order is the one
+        we obtained when looping over product(entity_nodes, entity_nodes)
+    """
+    entity_graph = nx.Graph()
+    for entity in entity_nodes:
+        entity_graph.add_node(entity, type=NodeType.ENTITY)
+
+    entity_rank = {node: rank for rank, node in enumerate(entity_graph.nodes)}
+    sorted_pairs = sorted(interaction_counter.items(),
+                          key=lambda item: tuple(sorted((entity_rank[item[0][0]], entity_rank[item[0][1]]))))
+    for (entity_1, entity_2), nb_interactions in sorted_pairs:
+        entity_graph.add_edge(entity_1, entity_2, weight=nb_interactions, type=EdgeType.INTERACT_WITH)
+
+    return entity_graph
+
+
+def window_pairs(positions, windows_size):
+    """
+    :param positions: int array sorted
+    :param windows_size: [int]
+    :return: two int arrays (i, j), i < j, of every pair of indexes such that positions[j] - positions[i] < windows_size
+        The pairs are sorted by i, then by j
+    """
+    idx = np.arange(len(positions))
+    window_end = np.searchsorted(positions, positions + windows_size, side='left')
+    nb_pairs = np.maximum(window_end - idx - 1, 0)
+    first = np.repeat(idx, nb_pairs)
+    pair_offset = np.arange(len(first)) - np.repeat(np.cumsum(nb_pairs) - nb_pairs, nb_pairs)
+    return first, first + pair_offset + 1
+
+
+def interaction_timeline(occurences, windows_size, first_position=None):
+    """
+    Collect the positions of every interaction between two entities in one sweep over the occurences sorted by
+    position. Two occurences interact if they appear together within a windows of windows_size tokens.
+
+    For a pair of entities (entity_1, entity_2) where entity_1 appears first in the text, each interaction is
+    stored as the position of the occurence of entity_1 (as it was done with the path
+    entity_1 -> occurence of entity_1 -> occurence of entity_2 -> entity_2).
+    As the sweep follows the text, the positions of each pair are emitted already sorted.
+
+    :param occurences: list of tuple (position [int], entity) sorted by position
+    :param windows_size: [int] size of the co-occurence windows
+    :param first_position: dict entity -> position of its first occurence, if it is already known
+        (see EntityOccurrenceIndex.first_positions)
+    :return: - dict entity -> position of its first occurence
+             - dict (entity_1, entity_2) -> list[int] sorted interaction positions, entity_1 appearing first
+    """
+    if first_position is None:
+        first_position = {}
+        for position, entity in occurences:
+            if entity not in first_position:
+                first_position[entity] = position
+
+    interaction_positions = {}
+    nb_occurences = len(occurences)
+    for idx_current, (current_pos, current_entity) in enumerate(occurences):
+        current_start = first_position[current_entity]
+
+        # Occurences that are within the windows, before and after the current one
+        idx_first = idx_current
+        while idx_first > 0 and current_pos - occurences[idx_first - 1][0] < windows_size:
+            idx_first -= 1
+        idx_last = idx_current + 1
+        while idx_last < nb_occurences and occurences[idx_last][0] - current_pos < windows_size:
+            idx_last += 1
+
+        for idx_other in range(idx_first, idx_last):
+            other_entity = occurences[idx_other][1]
+            if idx_other != idx_current and current_start < first_position[other_entity]:
+                interaction_positions.setdefault((current_entity, other_entity), []).append(current_pos)
+
+    return first_position, interaction_positions
+
+
+def multi_window_interaction_counts(positions, entity_ids, windows_sizes):
+    """
+    Count the interactions between entities for several windows sizes at once.
+    The pairs of occurences within the largest windows are generated once and sorted by distance : the pairs within
+    a smaller windows are a prefix of them, so the counts of each windows are the counts of the previous one plus
+    the pairs of the next slice.
+
+    :param positions: int array, position of each occurence, sorted
+    :param entity_ids: int array, id of the entity of each occurence
+    :param windows_sizes: list[int] sizes of the co-occurence windows
+    :return: dict windows_size -> Counter (entity_id_1, entity_id_2) -> nb of interactions, entity_id_1 < entity_id_2
+        (empty without windows sizes)
+    """
+    windows_sizes = sorted(set(windows_sizes))
+    if not windows_sizes:
+        return {}
+    first, second = window_pairs(positions, windows_sizes[-1])
+    entity_1, entity_2 = entity_ids[first], entity_ids[second]
+    is_counted = entity_1 != entity_2
+    distance = (positions[second] - positions[first])[is_counted]
+    nb_entities = int(entity_ids.max(initial=0)) + 1
+    pair_keys = np.minimum(entity_1, entity_2)[is_counted] * nb_entities + np.maximum(entity_1, entity_2)[is_counted]
+
+    by_distance = np.argsort(distance, kind='stable')
+    distance = distance[by_distance]
+    pair_keys, pair_idx = np.unique(pair_keys[by_distance], return_inverse=True)
+
+    counts = np.zeros(len(pair_keys), dtype=np.int64)
+    window_counts = {}
+    nb_pairs_done = 0
+    for windows_size in windows_sizes:
+        nb_pairs = np.searchsorted(distance, windows_size, side='left')
+        counts += np.bincount(pair_idx[nb_pairs_done:nb_pairs], minlength=len(pair_keys))
+        nb_pairs_done = nb_pairs
+        interacting = np.flatnonzero(counts)
+        window_counts[windows_size] = Counter(dict(zip(zip((pair_keys[interacting] // nb_entities).tolist(),
+                                                           (pair_keys[interacting] % nb_entities).tolist()),
+                                                       counts[interacting].tolist())))
+    return window_counts
+
+
+def entity_graphs_by_window(entity_index, windows_sizes):
+    """
+    Compute the entity interaction graph of each windows size in one pass (see multi_window_interaction_counts),
+    without building the full graph of each windows size
+    :param entity_index: EntityOccurrenceIndex of the occurence list
+    :param windows_sizes: list[int] sizes of the co-occurence windows
+    :return: dict windows_size -> entity interaction graph, as CharacterGraph(..., windows_size).entity_graph
+    """
+    entity_names = entity_index.entity_names
+    window_counts = multi_window_interaction_counts(entity_index.positions, entity_index.entity_ids, windows_sizes)
+    return {windows_size: entity_graph_from_counts(entity_names,
+                                                   Counter({(entity_names[entity_1], entity_names[entity_2]): count
+                                                            for (entity_1, entity_2), count in counts.items()}))
+            for windows_size, counts in window_counts.items()}
@@ -0,0 +1,103 @@
+import networkx as nx
+import numpy as np
+
+"""
+In this file is defined a vectorized PageRank over several graphs at once.
+
+The graphs are stacked in one block-diagonal matrix given as an edge list : each node belongs to one block (one graph)
+and the edges never cross two blocks. One power iteration updates every block with a single sparse matrix-vector
+product (numpy bincount over the edges), the teleportation and the dangling nodes being handled block by block.
+Each block stops being updated once it reaches the convergence criterion of nx.pagerank, so that each graph gets the
+values nx.pagerank(graph, weight='weight') would give, up to the tolerance.
+"""
+
+
+def block_pagerank(sources, targets, weights, blocks, nb_blocks, x_start=None, alpha=0.85, tol=1e-6, max_iter=100):
+    """
+    :param sources: int array, source node of each directed edge
+    :param targets: int array, target node of each directed edge (in the same block as its source)
+    :param weights: float array, weight of each edge
+    :param blocks: int array, block of each node
+    :param nb_blocks: [int]
+    :param x_start: float array, starting value of each node, normalized in each block (by default uniform)
+    :param alpha: damping factor
+    :param tol: error tolerance used to check the convergence of each block
+    :param max_iter: maximum number of iterations of the power method
+    :return: float array, PageRank of each node (sum to 1 in each block), number of iterations
+    """
+    nb_nodes = len(blocks)
+    block_sizes = np.bincount(blocks, minlength=nb_blocks)
+    node_block_sizes = block_sizes[blocks]
+
+    if x_start is None:
+        x = 1.0 / node_block_sizes
+    else:
+        x = x_start / np.bincount(blocks, weights=x_start, minlength=nb_blocks)[blocks]
+
+    out_strength = np.bincount(sources, weights=weights, minlength=nb_nodes)
+    is_dangling = out_strength == 0
+    inv_out_strength = np.divide(1.0, out_strength, out=np.zeros(nb_nodes), where=~is_dangling)
+    teleport = (1.0 - alpha) / node_block_sizes
+
+    converged = block_sizes == 0
+    for nb_iter in range(1, max_iter + 1):
+        x_last = x
+        # the rank of the dangling nodes is spread uniformly over the nodes of their block
+        dangling_rank = np.bincount(blocks, weights=x * is_dangling, minlength=nb_blocks)
+        x = alpha * (np.bincount(targets, weights=weights * (x * inv_out_strength)[sources], minlength=nb_nodes) +
+                     dangling_rank[blocks] / node_block_sizes) + teleport
+        x = np.where(converged[blocks], x_last, x)
+        converged |= np.bincount(blocks, weights=np.abs(x - x_last), minlength=nb_blocks) < block_sizes * tol
+        if converged.all():
+            return x, nb_iter
+    raise nx.PowerIterationFailedConvergence(max_iter)
+
+
+def directed_edges(edges_1, edges_2, edge_weights):
+    """
+    :param edges_1: int array, first end of each undirected edge
+    :param edges_2: int array, second end of each undirected edge
+    :param edge_weights: float array, weight of each edge
+    :return: sources, targets, weights of the edges in both directions (self loops are kept once, as in
+        nx.Graph.to_directed)
+    """
+    not_loop = edges_1 != edges_2
+    return np.concatenate([edges_1, edges_2[not_loop]]), np.concatenate([edges_2, edges_1[not_loop]]), \
+        np.concatenate([edge_weights, edge_weights[not_loop]])
+
+
+def batched_pagerank(graphs, weight='weight', alpha=0.85, tol=1e-6, max_iter=100):
+    """
+    PageRank of each graph, computed together in one block-diagonal power iteration
+    :param graphs: list of nxGraph (e.g. the entity graph of each chapter)
+    :param weight: edge attribute used as weight, 1 when an edge does not have it
+    :param alpha: damping factor
+    :param tol: error tolerance used to check convergence, as in nx.pagerank
+    :param max_iter: maximum number of iterations of the power method
+    :return: list of dict node -> PageRank, one per graph
+    """
+    # shared node index : the node i of the graph b has the id node_offsets[b] + i
+    graph_nodes = [list(graph) for graph in graphs]
+    node_offsets = np.zeros(len(graphs) + 1, dtype=np.int64)
+    np.cumsum([len(nodes) for nodes in graph_nodes], out=node_offsets[1:])
+    blocks = np.repeat(np.arange(len(graphs), dtype=np.int64), np.diff(node_offsets))
+
+    sources, targets, weights = [], [], []
+    for graph, nodes, offset in zip(graphs, graph_nodes, node_offsets.tolist()):
+        node_id = {node: offset + idx for idx, node in enumerate(nodes)}
+        edges = list(graph.edges(data=weight, default=1))
+        edges_1 = np.array([node_id[u] for u, _, _ in edges], dtype=np.int64)
+        edges_2 = np.array([node_id[v] for _, v, _ in edges], dtype=np.int64)
+        edge_weights = np.array([w for _, _, w in edges], dtype=np.float64)
+        if not graph.is_directed():
+            edges_1, edges_2, edge_weights = directed_edges(edges_1, edges_2, edge_weights)
+        sources.append(edges_1)
+        targets.append(edges_2)
+        weights.append(edge_weights)
+
+    ranks, _ = block_pagerank(np.concatenate([np.zeros(0, dtype=np.int64)] + sources),
+                              np.concatenate([np.zeros(0, dtype=np.int64)] + targets),
+                              np.concatenate([np.zeros(0)] + weights), blocks, len(graphs),
+                              alpha=alpha, tol=tol, max_iter=max_iter)
+    ranks = ranks.tolist()
+    return [dict(zip(nodes, ranks[node_offsets[b]:node_offsets[b + 1]])) for b, nodes in enumerate(graph_nodes)]
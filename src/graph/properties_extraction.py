@@ -3,6 +3,9 @@ import numpy as np
 import networkx as nx
 import matplotlib.pyplot as plt
 
+from .centrality_timeline import pagerank_timeline
+from .pagerank import batched_pagerank
+
 
 def importance_full_graph(full_g):
 	"""
@@ -13,7 +16,7 @@ def importance_full_graph(full_g):
 	# Compute degree (or weighted betweenness) centrality
 	# deg_centrality = nx.degree_centrality(full_g)
 	# deg_centrality = nx.betweenness_centrality(full_g, weight='weight')
-	deg_centrality = nx.pagerank(full_g, weight='weight')
+	deg_centrality = batched_pagerank([full_g], weight='weight')[0]
 
 	print('character importance of full entity graphs',
 	      dict(sorted(deg_centrality.items(), key=lambda kv: (kv[1]), reverse=True)[:10]))
@@ -38,7 +41,8 @@ def importance_subraphs(g):
 	# Compute degree (or weighted betweenness)  centrality for each graph
 	# deg_centrality = [nx.degree_centrality(graph) for graph in g]
 	# deg_centrality = [nx.betweenness_centrality(graph, weight = 'weight') for graph in g]
-	deg_centrality = [nx.pagerank(graph, weight='weight') for graph in g]
+	# (PageRank of all the chapter graphs in one block-diagonal power iteration, see pagerank.batched_pagerank)
+	deg_centrality = batched_pagerank(g, weight='weight')
 
 	# Keep 10 most important characters per chapter
 	sorted_deg_centrality = [sorted(deg_centrality[i].items(), key=lambda x: x[1], reverse=True)[0:10]
@@ -67,6 +71,28 @@ def importance_subraphs(g):
 	return sorted_dico, sorted_deg_centrality
 
 
+def importance_timeline(temporal_index, windows_length=2000, step=2000):
+	"""
+	:param temporal_index: TemporalInteractionIndex of the dynamic graph (see CharacterGraph.temporal_index)
+	:param windows_length: [int] length (in tokens) of the sliding window
+	:param step: [int] shift (in tokens) between two windows
+	:returns: DataFrame of the PageRank of each character in each window (see centrality_timeline.pagerank_timeline)
+	"""
+
+	# PageRank of each sliding window, warm-started from the previous one
+	importance_evol_df = pagerank_timeline(temporal_index, windows_length=windows_length, step=step)
+
+	# Keep only most influent characters
+	most_important_entities = list(importance_evol_df.sum().sort_values(ascending=False).index[:10])
+
+	# Plotting the importance evolution of some characters
+	print('PLOT evolving importance of 10 main characters every', step, 'tokens')
+	importance_evol_df[most_important_entities].plot()
+	plt.savefig('data/results/character_importance_timeline.png')
+
+	return importance_evol_df
+
+
 def properties_full_graph(full_g, most_central_characters):
 	"""
 	:param full_g: full entity graph
@@ -127,12 +153,14 @@ def properties_full_graph(full_g, most_central_characters):
 		print('several main characters type novel')
 
 
-def properties_subgraphs(full_g, g, most_central_characters, mcc_by_chapter):
+def properties_subgraphs(full_g, g, most_central_characters, mcc_by_chapter, entity_index=None):
 	"""
 	:param full_g: entity graph
 	:param g: list of chapter entity graphs
 	:param most_central_characters: list of book's main characters
 	:param mcc_by_chapter: book's main characters for each chapter
+	:param entity_index: EntityOccurrenceIndex of the book, to read the chapters where each entity appears
+	instead of going through the nodes of each chapter graph
 	Retrieves properties of the graphs
 	"""
 	print('-- ENTITY CHAPTER GRAPH PROPERTIES --')
@@ -157,31 +185,8 @@ def properties_subgraphs(full_g, g, most_central_characters, mcc_by_chapter):
 	# Proportion of full graph k core in each chapter k_core
 	prop_k_core = [len(set(k_core[i]).intersection(full_k_core)) / len(full_k_core) for i in range(len(k_core))]
 
-	# Store when each entity is introduced and disappears
-	dict_entities = {}  # key = entity, value = [chap_intro, chap_last_seen]
-	for entity in list(full_g.nodes()):
-		dict_entities[entity] = [0, 0]
-	introduced = []
-	for i, graph in enumerate(g):
-		seen_entities = list(graph.nodes())
-		for ent in seen_entities:
-			dict_entities[ent][1] = i + 1
-			if ent not in set(introduced):
-				dict_entities[ent][0] = i + 1
-		introduced += seen_entities
-	# Compute statistics
-	existing_ent = []
-	introduced_ent = []
-	disappeared_ent = []
-	for j in range(1, n_chap + 1):
-		exist = intro = disap = 0
-		for entity, val in dict_entities.items():
-			if val[0] == j: intro += 1
-			if val[1] == j - 1: disap += 1
-			if val[0] <= j and val[1] >= j: exist += 1
-		existing_ent.append(exist)  # list of existing entities at each chapter
-		introduced_ent.append(intro)  # list of all introduced entities in each chapter
-		disappeared_ent.append(disap)  # list of all entities that disappear from next chapter
+	# Number of existing, introduced and disappearing entities in each chapter
+	existing_ent, introduced_ent, disappeared_ent = entities_lifespan(full_g, g, entity_index)
 
 	# Distance between first and second most important characters
 	dist_importance = []
@@ -268,6 +273,42 @@ def properties_subgraphs(full_g, g, most_central_characters, mcc_by_chapter):
 	# Visualise cc, k_core, connexions, important nodes on graph
 
 
+def entities_lifespan(full_g, g, entity_index=None):
+	"""
+	:param full_g: entity graph
+	:param g: list of chapter entity graphs, in the order of the chapters
+	:param entity_index: EntityOccurrenceIndex of the book, if given the first and last chapter of each entity are
+	read from it instead of the nodes of the chapter graphs
+	:returns: for each chapter, the number of existing entities, of entities introduced in the chapter and of
+	entities that disappear from the next chapter
+	"""
+	# Store when each entity is introduced and disappears
+	dict_entities = {}  # key = entity, value = [chap_intro, chap_last_seen]
+	for entity in list(full_g.nodes()):
+		dict_entities[entity] = [0, 0]
+	if entity_index is not None:
+		first_chapters, last_chapters = entity_index.first_and_last_chapters()
+		for entity, first, last in zip(entity_index.entity_names, first_chapters.tolist(), last_chapters.tolist()):
+			dict_entities[entity] = [first + 1, last + 1]
+	else:
+		introduced = set()
+		for i, graph in enumerate(g):
+			seen_entities = list(graph.nodes())
+			for ent in seen_entities:
+				dict_entities[ent][1] = i + 1
+				if ent not in introduced:
+					dict_entities[ent][0] = i + 1
+			introduced.update(seen_entities)
+
+	# Compute statistics for all the chapters at once
+	chap_intro, chap_last_seen = np.array(list(dict_entities.values()), dtype=int).reshape(-1, 2).T
+	chapters = np.arange(1, len(g) + 1)[:, None]
+	existing_ent = np.sum((chap_intro <= chapters) & (chap_last_seen >= chapters), axis=1).tolist()
+	introduced_ent = np.sum(chap_intro == chapters, axis=1).tolist()
+	disappeared_ent = np.sum(chap_last_seen == chapters - 1, axis=1).tolist()
+	return existing_ent, introduced_ent, disappeared_ent
+
+
 def plot_prop(params_val_list, labels, n_chap, num):
 	"""
 	:param params_val_list: list of values of the variables to plot
@@ -0,0 +1,271 @@
+import networkx as nx
+import numpy as np
+from collections import Counter
+
+from .edge_type import EdgeType
+from .node_type import NodeType
+from .interaction_counting import window_pairs
+from .entity_index import EntityOccurrenceIndex
+
+"""
+In this file is defined a compact representation of the full character graph.
+
+Instead of one networkx node per occurence (keyed by a (character_name, position) tuple) and one attribute dict
+per node and edge, the nodes get integer ids :
+    [0, nb_occurences) -> occurence nodes, sorted by position
+    [nb_occurences, nb_occurences + nb_entities) -> entity nodes
+    [nb_occurences + nb_entities, nb_nodes) -> chapter nodes
+and the edges of each EdgeType are stored as a symmetric CSR adjacency (indptr, indices) of int arrays.
+The node keys (tuple, str, int) are only built when they are asked for, from the string tables of the occurence list.
+"""
+
+NODE_TYPE_CODE = {NodeType.OCCURENCE: 0, NodeType.ENTITY: 1, NodeType.CHAPTER: 2}
+CODE_NODE_TYPE = {code: node_type for node_type, code in NODE_TYPE_CODE.items()}
+
+
+def symmetric_csr(nb_nodes, u_nodes, v_nodes):
+    """
+    :param nb_nodes: [int]
+    :param u_nodes: int array, first end of each undirected edge
+    :param v_nodes: int array, second end of each undirected edge
+    :return: indptr, indices - the neighbors of node i are indices[indptr[i]:indptr[i + 1]], sorted
+    """
+    rows = np.concatenate([u_nodes, v_nodes]).astype(np.int64)
+    cols = np.concatenate([v_nodes, u_nodes]).astype(np.int64)
+    order = np.lexsort((cols, rows))
+    indptr = np.zeros(nb_nodes + 1, dtype=np.int64)
+    np.cumsum(np.bincount(rows, minlength=nb_nodes), out=indptr[1:])
+    return indptr, cols[order]
+
+
+class SparseCharacterGraph:
+    """
+    Full character graph (occurence, entity and chapter nodes, TIME, INTERACT_WITH, IS_ENTITY and BELONG_TO edges)
+    stored as typed CSR adjacency arrays. It has the same nodes and edges as the networkx graph built by
+    CharacterGraph.generate_full_graph : as in the networkx graph, each edge has one type, and INTERACT_WITH takes
+    precedence over TIME when two consecutive occurences of an entity are within the windows.
+    """
+    def __init__(self, node_type, node_index, adjacency, tables):
+        """
+        :param node_type: int8 array, code of the NodeType of each node (see NODE_TYPE_CODE)
+        :param node_index: int array, index of each node in the table of its type
+        :param adjacency: dict EdgeType -> (indptr, indices)
+        :param tables: dict with
+            'occurence_name': int array, index in character_name_table of each occurence
+            'occurence_position': int array, position of each occurence
+            'character_name_table': list[str]
+            'entity_table': list[str]
+            'chapter_table': int array
+        """
+        self.node_type = node_type
+        self.node_index = node_index
+        self.adjacency = adjacency
+        self.tables = tables
+
+    @classmethod
+    def from_occurences(cls, occurence_list, windows_size):
+        """
+        :param occurence_list: OccurenceColumns with entities
+        :param windows_size: [int] size of the co-occurence windows
+        :return: SparseCharacterGraph
+        """
+        return cls.from_index(EntityOccurrenceIndex.from_occurences(occurence_list), windows_size)
+
+    @classmethod
+    def from_index(cls, entity_index, windows_size):
+        """
+        :param entity_index: EntityOccurrenceIndex of the occurence list
+        :param windows_size: [int] size of the co-occurence windows
+        :return: SparseCharacterGraph
+        """
+        # Nodes
+        nb_occurences, nb_entities = len(entity_index), len(entity_index.entity_names)
+        nb_chapters = len(entity_index.chapter_table)
+        nb_nodes = nb_occurences + nb_entities + nb_chapters
+        entity_id = entity_index.entity_ids + nb_occurences
+        chapter_id = np.searchsorted(entity_index.chapter_table, entity_index.chapters) + nb_occurences + nb_entities
+
+        node_type = np.repeat(np.array([NODE_TYPE_CODE[NodeType.OCCURENCE], NODE_TYPE_CODE[NodeType.ENTITY],
+                                        NODE_TYPE_CODE[NodeType.CHAPTER]], dtype=np.int8),
+                              [nb_occurences, nb_entities, nb_chapters])
+        node_index = np.concatenate([np.arange(nb_occurences), np.arange(nb_entities), np.arange(nb_chapters)])
+
+        # Edges
+        occurence_id = np.arange(nb_occurences)
+        interact_u, interact_v = window_pairs(entity_index.positions, windows_size)
+        time_u, time_v = entity_index.time_pairs()
+        is_time = entity_index.positions[time_v] - entity_index.positions[time_u] >= windows_size
+        adjacency = {EdgeType.IS_ENTITY: symmetric_csr(nb_nodes, occurence_id, entity_id),
+                     EdgeType.BELONG_TO: symmetric_csr(nb_nodes, occurence_id, chapter_id),
+                     EdgeType.TIME: symmetric_csr(nb_nodes, time_u[is_time], time_v[is_time]),
+                     EdgeType.INTERACT_WITH: symmetric_csr(nb_nodes, interact_u, interact_v)}
+
+        tables = {'occurence_name': entity_index.character_names,
+                  'occurence_position': entity_index.positions,
+                  'character_name_table': entity_index.character_name_table,
+                  'entity_table': entity_index.entity_names,
+                  'chapter_table': entity_index.chapter_table}
+        return cls(node_type, node_index, adjacency, tables)
+
+    def number_of_nodes(self):
+        return len(self.node_type)
+
+    def number_of_edges(self):
+        return sum(len(indices) for _, indices in self.adjacency.values()) // 2
+
+    def node_key(self, node):
+        """
+        :param node: [int] id of a node
+        :return: the key of the node in the networkx graph : (character_name, position), entity name or chapter
+        """
+        index = int(self.node_index[node])
+        node_type = CODE_NODE_TYPE[int(self.node_type[node])]
+        if node_type == NodeType.OCCURENCE:
+            return (self.tables['character_name_table'][self.tables['occurence_name'][index]],
+                    int(self.tables['occurence_position'][index]))
+        if node_type == NodeType.ENTITY:
+            return self.tables['entity_table'][index]
+        return int(self.tables['chapter_table'][index])
+
+    def nodes_of_type(self, node_type):
+        """
+        :param node_type: [NodeType]
+        :return: int array, ids of the nodes that have the given type
+        """
+        return np.flatnonzero(self.node_type == NODE_TYPE_CODE[node_type])
+
+    def filter_nodes(self, node_type):
+        """
+        :param node_type: [NodeType]
+        :return: keys of the nodes that have the given type
+        """
+        return [self.node_key(node) for node in self.nodes_of_type(node_type)]
+
+    def nodes(self, data=False):
+        """
+        :param data: True to also return the attribute dict {'type': NodeType} of each node
+        :return: generator over the node keys (as networkx Graph.nodes)
+        """
+        for node in range(self.number_of_nodes()):
+            if data:
+                yield self.node_key(node), {'type': CODE_NODE_TYPE[int(self.node_type[node])]}
+            else:
+                yield self.node_key(node)
+
+    def edge_list(self, edge_type):
+        """
+        :param edge_type: [EdgeType]
+        :return: two int arrays (u, v), u < v, ends of each edge of the given type
+        """
+        indptr, indices = self.adjacency[edge_type]
+        u_nodes = np.repeat(np.arange(len(indptr) - 1), np.diff(indptr))
+        is_first = u_nodes < indices
+        return u_nodes[is_first], indices[is_first]
+
+    def edges(self, data=False):
+        """
+        :param data: True to also return the attribute dict {'type': EdgeType} of each edge
+        :return: generator over the edges (u_key, v_key) (as networkx Graph.edges)
+        """
+        for edge_type in EdgeType:
+            u_nodes, v_nodes = self.edge_list(edge_type)
+            for u_node, v_node in zip(u_nodes.tolist(), v_nodes.tolist()):
+                if data:
+                    yield self.node_key(u_node), self.node_key(v_node), {'type': edge_type}
+                else:
+                    yield self.node_key(u_node), self.node_key(v_node)
+
+    def subgraph(self, nodes):
+        """
+        :param nodes: int array, ids of the nodes to keep
+        :return: SparseCharacterGraph induced by the given nodes, relabeled from 0 (in the order of the ids)
+        """
+        nodes = np.unique(np.asarray(nodes, dtype=np.int64))
+        new_id = np.full(self.number_of_nodes(), -1, dtype=np.int64)
+        new_id[nodes] = np.arange(len(nodes))
+
+        adjacency = {}
+        for edge_type, (indptr, indices) in self.adjacency.items():
+            degrees = indptr[nodes + 1] - indptr[nodes]
+            neighbor_idx = np.repeat(indptr[nodes] - (np.cumsum(degrees) - degrees), degrees) + \
+                np.arange(degrees.sum())
+            u_nodes = np.repeat(np.arange(len(nodes)), degrees)
+            v_nodes = new_id[indices[neighbor_idx]]
+            is_kept = v_nodes >= 0
+            sub_indptr = np.zeros(len(nodes) + 1, dtype=np.int64)
+            np.cumsum(np.bincount(u_nodes[is_kept], minlength=len(nodes)), out=sub_indptr[1:])
+            adjacency[edge_type] = (sub_indptr, v_nodes[is_kept])
+
+        return SparseCharacterGraph(self.node_type[nodes], self.node_index[nodes], adjacency, self.tables)
+
+    def neighbors(self, node, edge_type):
+        """
+        :param node: [int] id of a node
+        :param edge_type: [EdgeType]
+        :return: int array, ids of the neighbors of the node through edges of the given type
+        """
+        indptr, indices = self.adjacency[edge_type]
+        return indices[indptr[node]:indptr[node + 1]]
+
+    def chapter_node(self, chapter_idx):
+        """
+        :param chapter_idx: [int]
+        :return: id of the chapter node, None if the graph has no such chapter
+        """
+        chapter_nodes = self.nodes_of_type(NodeType.CHAPTER)
+        chapters = self.tables['chapter_table'][self.node_index[chapter_nodes]]
+        match = np.flatnonzero(chapters == chapter_idx)
+        return int(chapter_nodes[match[0]]) if len(match) > 0 else None
+
+    def subgraph_from_chapter(self, chapter_idx):
+        """
+        Same subgraph as CharacterGraph.subgraph_from_chapter : the chapter node, its occurence nodes and the entity
+        nodes of those occurences
+        :param chapter_idx: [int]
+        :return: SparseCharacterGraph
+        """
+        chapter_node = self.chapter_node(chapter_idx)
+        if chapter_node is None:
+            raise nx.NetworkXError("The node %s is not in the graph." % chapter_idx)
+        occurence_nodes = self.neighbors(chapter_node, EdgeType.BELONG_TO)
+        indptr, indices = self.adjacency[EdgeType.IS_ENTITY]
+        entity_nodes = np.concatenate([indices[indptr[node]:indptr[node + 1]] for node in occurence_nodes] +
+                                      [np.zeros(0, dtype=np.int64)])
+        return self.subgraph(np.concatenate([[chapter_node], occurence_nodes, entity_nodes]))
+
+    def count_entity_interactions(self):
+        """
+        Same count as interaction_counting.count_entity_interactions, computed on the arrays
+        :return: Counter (entity_1, entity_2) -> nb of interactions, entity_1 having a lower id than entity_2
+        """
+        indptr, indices = self.adjacency[EdgeType.IS_ENTITY]
+        occurence_entity = np.full(self.number_of_nodes(), -1, dtype=np.int64)
+        occurence_nodes = self.nodes_of_type(NodeType.OCCURENCE)
+        has_entity = indptr[occurence_nodes + 1] > indptr[occurence_nodes]
+        occurence_entity[occurence_nodes[has_entity]] = indices[indptr[occurence_nodes[has_entity]]]
+
+        u_nodes, v_nodes = self.edge_list(EdgeType.INTERACT_WITH)
+        entity_1, entity_2 = occurence_entity[u_nodes], occurence_entity[v_nodes]
+        is_counted = (entity_1 >= 0) & (entity_2 >= 0) & (entity_1 != entity_2)
+        if not is_counted.any():
+            return Counter()
+        pairs = np.stack([np.minimum(entity_1, entity_2), np.maximum(entity_1, entity_2)])[:, is_counted]
+        pairs, counts = np.unique(pairs, axis=1, return_counts=True)
+
+        return Counter({(self.node_key(entity_1), self.node_key(entity_2)): nb_interactions
+                        for entity_1, entity_2, nb_interactions in zip(pairs[0].tolist(), pairs[1].tolist(),
+                                                                       counts.tolist())})
+
+    def to_networkx(self):
+        """
+        :return: the same graph as a networkx graph, as built by CharacterGraph.generate_full_graph
+        """
+        graph = nx.Graph()
+        for node_type in [NodeType.OCCURENCE, NodeType.CHAPTER, NodeType.ENTITY]:
+            for node in self.nodes_of_type(node_type):
+                graph.add_node(self.node_key(node), type=node_type)
+        for edge_type in [EdgeType.IS_ENTITY, EdgeType.BELONG_TO, EdgeType.TIME, EdgeType.INTERACT_WITH]:
+            u_nodes, v_nodes = self.edge_list(edge_type)
+            for u_node, v_node in zip(u_nodes.tolist(), v_nodes.tolist()):
+                graph.add_edge(self.node_key(u_node), self.node_key(v_node), type=edge_type)
+        return graph
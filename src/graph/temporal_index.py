@@ -0,0 +1,187 @@
+from bisect import bisect_left
+
+import networkx as nx
+import numpy as np
+
+from .edge_type import EdgeType
+
+"""
+In this file is defined the temporal index of the dynamic entity interaction graph.
+
+The dynamic graph stores, on each edge, the list of the positions in the text where the two entities interact.
+Looking at the graph "at time t" from it means scanning the positions of every edge. The index keeps instead :
+    - for each pair of entities, its sorted interaction positions (CSR layout : the positions of pair p are in
+      [pair_offsets[p], pair_offsets[p + 1]))
+    - a global event log : every interaction (position, pair) sorted by position
+    - the entities sorted by their first appearance
+so that a query only bisects the event log and reads the events of the asked interval.
+"""
+
+
+class TemporalInteractionIndex:
+    """
+    Interval index over the interaction positions of a dynamic entity interaction graph
+    (see CharacterGraph.dynamic_entity_interaction_graph). Intervals are half-open : [start, end)
+    """
+    def __init__(self, entity_starts, pairs, pair_offsets, pair_positions):
+        """
+        :param entity_starts: dict entity -> position of its first occurence
+        :param pairs: list of (entity_1, entity_2), entity_1 appearing first in the text
+        :param pair_offsets: int array of size len(pairs) + 1
+        :param pair_positions: int array, sorted interaction positions of each pair, pair after pair
+        """
+        self.pairs = pairs
+        self.pair_id = {pair: idx for idx, pair in enumerate(pairs)}
+        self.pair_offsets = pair_offsets
+        self.pair_positions = pair_positions
+
+        self.entity_start = entity_starts
+        self.entities = sorted(entity_starts, key=lambda entity: entity_starts[entity])
+        self.entity_starts = [entity_starts[entity] for entity in self.entities]
+        # entity ids (rank in self.entities) of the two entities of each pair
+        entity_id = {entity: idx for idx, entity in enumerate(self.entities)}
+        self.pair_entity_ids = np.array([[entity_id[entity_1], entity_id[entity_2]] for entity_1, entity_2 in pairs],
+                                        dtype=np.int64).reshape(-1, 2)
+
+        # global event log, sorted by position (stable : the events of a pair stay in order)
+        event_pairs = np.repeat(np.arange(len(pairs), dtype=np.int64), np.diff(pair_offsets))
+        order = np.argsort(pair_positions, kind='stable')
+        self.event_positions = pair_positions[order]
+        self.event_pairs = event_pairs[order]
+
+    @classmethod
+    def from_dynamic_graph(cls, dynamic_graph):
+        """
+        :param dynamic_graph: nxGraph - entity nodes with a start attribute, edges with a positions attribute
+        :return: TemporalInteractionIndex
+        """
+        entity_starts = dict(dynamic_graph.nodes(data='start'))
+        pairs = []
+        edge_positions = []
+        for entity_1, entity_2, positions in dynamic_graph.edges(data='positions'):
+            if entity_starts[entity_2] < entity_starts[entity_1]:
+                entity_1, entity_2 = entity_2, entity_1
+            pairs.append((entity_1, entity_2))
+            edge_positions.append(np.asarray(positions, dtype=np.int64))
+
+        pair_offsets = np.zeros(len(pairs) + 1, dtype=np.int64)
+        np.cumsum([len(positions) for positions in edge_positions], out=pair_offsets[1:])
+        pair_positions = np.concatenate(edge_positions) if edge_positions else np.zeros(0, dtype=np.int64)
+        return cls(entity_starts, pairs, pair_offsets, pair_positions)
+
+    def __len__(self):
+        return len(self.event_positions)
+
+    def events(self, start=None, end=None):
+        """
+        :param start: [int] first position of the interval, by default the beginning of the text
+        :param end: [int] position following the interval, by default the end of the text
+        :return: slice of the events of [start, end) in event_positions and event_pairs
+        """
+        first = 0 if start is None else int(np.searchsorted(self.event_positions, start, side='left'))
+        last = len(self) if end is None else int(np.searchsorted(self.event_positions, end, side='left'))
+        return slice(first, max(first, last))
+
+    def pair_history(self, entity_1, entity_2, start=None, end=None):
+        """
+        :param entity_1: entity name
+        :param entity_2: entity name, the order of the two entities does not matter
+        :param start: [int] first position of the interval, by default the beginning of the text
+        :param end: [int] position following the interval, by default the end of the text
+        :return: int array, sorted positions of the interactions of the two entities in [start, end)
+        """
+        pair_id = self.pair_id.get((entity_1, entity_2), self.pair_id.get((entity_2, entity_1)))
+        if pair_id is None:
+            return np.zeros(0, dtype=np.int64)
+        positions = self.pair_positions[self.pair_offsets[pair_id]:self.pair_offsets[pair_id + 1]]
+        first = 0 if start is None else np.searchsorted(positions, start, side='left')
+        last = len(positions) if end is None else np.searchsorted(positions, end, side='left')
+        return positions[first:max(first, last)]
+
+    def pair_weights(self, start=None, end=None):
+        """
+        :param start: [int] first position of the interval, by default the beginning of the text
+        :param end: [int] position following the interval, by default the end of the text
+        :return: dict (entity_1, entity_2) -> number of interactions in [start, end)
+        """
+        pair_ids, weights = np.unique(self.event_pairs[self.events(start, end)], return_counts=True)
+        return {self.pairs[pair_id]: weight for pair_id, weight in zip(pair_ids.tolist(), weights.tolist())}
+
+    def graph_from_weights(self, pair_weights, entities=()):
+        """
+        :param pair_weights: dict (entity_1, entity_2) -> weight
+        :param entities: entities to add even if they do not interact
+        :return: nxGraph - entity nodes with their start attribute, INTERACT_WITH edges with their weight
+        """
+        graph = nx.Graph()
+        for entity in entities:
+            graph.add_node(entity)
+        for (entity_1, entity_2), weight in pair_weights.items():
+            graph.add_edge(entity_1, entity_2, weight=weight, type=EdgeType.INTERACT_WITH)
+        nx.set_node_attributes(graph, {entity: self.entity_start[entity] for entity in graph.nodes}, 'start')
+        return graph
+
+    def snapshot(self, start, end):
+        """
+        :param start: [int] first position of the interval
+        :param end: [int] position following the interval
+        :return: nxGraph - entities which interact in [start, end), weighted by their number of interactions in it
+        """
+        return self.graph_from_weights(self.pair_weights(start, end))
+
+    def cumulative_graph(self, t):
+        """
+        :param t: [int] position in the text
+        :return: nxGraph - entities which appeared before t, weighted by their number of interactions before t
+        """
+        return self.graph_from_weights(self.pair_weights(end=t),
+                                       entities=self.entities[:bisect_left(self.entity_starts, t)])
+
+    def sliding_events(self, windows_length, step, start=0, end=None):
+        """
+        Sweep the windows [s, s + windows_length) for s = start, start + step, ... < end over the event log :
+        each event enters and leaves the sweep once, so the whole sweep is linear in the number of events
+        (plus the number of windows).
+        :param windows_length: [int] length of a window, in tokens
+        :param step: [int] shift between two windows, in tokens
+        :param start: [int] start of the first window
+        :param end: [int] end of the sweep, by default the last interaction position + 1
+        :return: generator of (window start, slice of the events which left the previous window,
+            slice of the events which entered the window) in event_positions and event_pairs
+        """
+        if end is None:
+            end = int(self.event_positions[-1]) + 1 if len(self) > 0 else start
+        positions = self.event_positions.tolist()
+        first = last = bisect_left(positions, start)
+        for windows_start in range(start, end, step):
+            windows_first = bisect_left(positions, windows_start, lo=first)
+            leaving = slice(first, max(first, min(windows_first, last)))
+            first = windows_first
+            last = max(last, first)
+            windows_last = bisect_left(positions, windows_start + windows_length, lo=last)
+            entering = slice(last, windows_last)
+            last = windows_last
+            yield windows_start, leaving, entering
+
+    def sliding_windows(self, windows_length, step, start=0, end=None):
+        """
+        Pair weights of the windows of the sweep (see sliding_events)
+        :param windows_length: [int] length of a window, in tokens
+        :param step: [int] shift between two windows, in tokens
+        :param start: [int] start of the first window
+        :param end: [int] end of the sweep, by default the last interaction position + 1
+        :return: generator of (window start, dict (entity_1, entity_2) -> number of interactions in the window)
+            the same dict is updated and yielded at each step : copy it to keep it
+        """
+        event_pairs = self.event_pairs.tolist()
+        weights = {}
+        for windows_start, leaving, entering in self.sliding_events(windows_length, step, start=start, end=end):
+            for idx in range(leaving.start, leaving.stop):
+                pair = self.pairs[event_pairs[idx]]
+                weights[pair] -= 1
+                if weights[pair] == 0:
+                    del weights[pair]
+            for idx in range(entering.start, entering.stop):
+                pair = self.pairs[event_pairs[idx]]
+                weights[pair] = weights.get(pair, 0) + 1
+            yield windows_start, weights
@@ -0,0 +1,3 @@
+from .occurence_storage import OccurenceColumns, save_occurences, load_occurences, occurences_exist, \
+    occurences_location, convert_pickle
+from .stage_cache import StageCache
@@ -0,0 +1,186 @@
+import numpy as np
+import os
+import pickle
+import sys
+
+"""
+In this file are defined the functions used to store the occurence lists in a columnar format.
+
+An occurence list is a list of dict {character_name:[str], position:[int], chapter:[int], (entity:[str])}.
+Instead of pickling one dict per occurence, it is stored in a folder that contains one .npy file per column :
+    - position.npy, chapter.npy : int32 arrays
+    - character_name.npy, entity.npy : int32 arrays of indexes in the string tables
+    - character_name_table.npy, entity_table.npy : arrays of the distinct strings (interned)
+The int32 arrays are memory-mapped when the folder is loaded, so loading does not copy them in memory.
+"""
+
+COLUMNS = ['position', 'chapter', 'character_name', 'entity']
+
+
+class OccurenceColumns:
+    """
+    Columnar occurence list. It behaves like the former list of dict (len, indexing, iteration) but the dicts
+    are only built on demand.
+    """
+    def __init__(self, position, chapter, character_name, character_name_table, entity=None, entity_table=None):
+        """
+        :param position: int32 array
+        :param chapter: int32 array
+        :param character_name: int32 array of indexes in character_name_table
+        :param character_name_table: list[str]
+        :param entity: int32 array of indexes in entity_table, None if the occurences are not linked to entities yet
+        :param entity_table: list[str]
+        """
+        self.position = position
+        self.chapter = chapter
+        self.character_name = character_name
+        self.character_name_table = character_name_table
+        self.entity = entity
+        self.entity_table = entity_table
+
+    @classmethod
+    def from_list(cls, occurence_list):
+        """
+        :param occurence_list: list[dict (character_name, position, chapter, (entity))]
+        :return: OccurenceColumns
+        """
+        position = np.array([occurence['position'] for occurence in occurence_list], dtype=np.int32)
+        chapter = np.array([occurence['chapter'] for occurence in occurence_list], dtype=np.int32)
+        character_name, character_name_table = intern([occurence['character_name']
+                                                        for occurence in occurence_list])
+        entity, entity_table = None, None
+        if len(occurence_list) > 0 and 'entity' in occurence_list[0]:
+            entity, entity_table = intern([occurence['entity'] for occurence in occurence_list])
+        return cls(position, chapter, character_name, character_name_table, entity, entity_table)
+
+    def character_names(self):
+        """
+        :return: list[str] character name of each occurence
+        """
+        return [self.character_name_table[idx] for idx in self.character_name.tolist()]
+
+    def entities(self):
+        """
+        :return: list[str] entity of each occurence
+        """
+        return [self.entity_table[idx] for idx in self.entity.tolist()]
+
+    def records(self):
+        """
+        :return: list of tuple (character_name, position, chapter, entity) -  entity is None if there is no entity
+        """
+        entities = self.entities() if self.entity is not None else [None] * len(self)
+        return list(zip(self.character_names(), self.position.tolist(), self.chapter.tolist(), entities))
+
+    def to_list(self):
+        """
+        :return: the occurence list as a list of dict
+        """
+        return [self[idx] for idx in range(len(self))]
+
+    def __len__(self):
+        return len(self.position)
+
+    def __getitem__(self, idx):
+        occurence = {'character_name': self.character_name_table[self.character_name[idx]],
+                     'position': int(self.position[idx]),
+                     'chapter': int(self.chapter[idx])}
+        if self.entity is not None:
+            occurence['entity'] = self.entity_table[self.entity[idx]]
+        return occurence
+
+    def __iter__(self):
+        for idx in range(len(self)):
+            yield self[idx]
+
+
+def intern(strings):
+    """
+    :param strings: list[str]
+    :return: int32 array of indexes in the table, table : list of the distinct strings by order of appearance
+    """
+    string_to_idx = {}
+    indexes = np.array([string_to_idx.setdefault(string, len(string_to_idx)) for string in strings], dtype=np.int32)
+    return indexes, list(string_to_idx.keys())
+
+
+def save_occurences(occurence_list, path):
+    """
+    Store an occurence list in the columnar format
+    :param occurence_list: list[dict] or OccurenceColumns
+    :param path: folder where to store the columns (created if needed)
+    """
+    if not isinstance(occurence_list, OccurenceColumns):
+        occurence_list = OccurenceColumns.from_list(occurence_list)
+    os.makedirs(path, exist_ok=True)
+    np.save(os.path.join(path, 'position.npy'), occurence_list.position)
+    np.save(os.path.join(path, 'chapter.npy'), occurence_list.chapter)
+    np.save(os.path.join(path, 'character_name.npy'), occurence_list.character_name)
+    np.save(os.path.join(path, 'character_name_table.npy'), np.array(occurence_list.character_name_table, dtype=str))
+    if occurence_list.entity is not None:
+        np.save(os.path.join(path, 'entity.npy'), occurence_list.entity)
+        np.save(os.path.join(path, 'entity_table.npy'), np.array(occurence_list.entity_table, dtype=str))
+
+
+def load_occurences(path):
+    """
+    Load an occurence list stored by save_occurences. The int32 columns are memory-mapped.
+    If the folder does not exist but a path.pkl file does (former format), the pickle is loaded and converted
+    in memory.
+    :param path: folder containing the columns
+    :return: OccurenceColumns
+    """
+    if not os.path.isdir(path) and os.path.exists(path + '.pkl'):
+        return OccurenceColumns.from_list(pickle.load(open(path + '.pkl', 'rb')))
+
+    def load_column(name):
+        return np.load(os.path.join(path, name + '.npy'), mmap_mode='r')
+
+    def load_table(name):
+        return np.load(os.path.join(path, name + '_table.npy')).tolist()
+
+    entity, entity_table = None, None
+    if os.path.exists(os.path.join(path, 'entity.npy')):
+        entity, entity_table = load_column('entity'), load_table('entity')
+    return OccurenceColumns(load_column('position'), load_column('chapter'),
+                            load_column('character_name'), load_table('character_name'),
+                            entity, entity_table)
+
+
+def occurences_exist(path):
+    """
+    :param path: folder containing the columns
+    :return: True if the occurence list is stored, in the columnar format or as a path.pkl file
+    """
+    return os.path.isdir(path) or os.path.exists(path + '.pkl')
+
+
+def occurences_location(path):
+    """
+    :param path: folder containing the columns
+    :return: the path where the occurence list is actually stored : the folder, or the path.pkl file (former format)
+    """
+    if not os.path.isdir(path) and os.path.exists(path + '.pkl'):
+        return path + '.pkl'
+    return path
+
+
+def convert_pickle(pickle_path):
+    """
+    Convert an occurence list stored as a pickled list of dict into the columnar format.
+    The columns are stored in a folder with the same name as the pickle file, without the .pkl extension
+    :param pickle_path: path to the .pkl file
+    :return: path to the folder
+    """
+    path = pickle_path[:-len('.pkl')]
+    save_occurences(pickle.load(open(pickle_path, 'rb')), path)
+    return path
+
+
+if __name__ == '__main__':
+    # Convert the given pickles, by default all the occurence lists of data/entity_list
+    # python -m src.storage.occurence_storage [data/entity_list/hp1_occ_list.pkl ...]
+    pickle_paths = sys.argv[1:] or ['data/entity_list/' + file_name for file_name in os.listdir('data/entity_list')
+                                    if file_name.endswith('.pkl')]
+    for pickle_path in pickle_paths:
+        print(pickle_path, '->', convert_pickle(pickle_path))
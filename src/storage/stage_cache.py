@@ -0,0 +1,146 @@
+import hashlib
+import json
+import os
+import pickle
+
+"""
+In this file is defined the cache used to decide which stage of the pipeline has to be recomputed.
+
+Each stage (chapterize, NER of a chapter, coref, graph creation, exports) is identified by a name and a key : a hash
+of the content of its inputs (text files, model folder, coref rules, parameters...).
+The key used the last time the stage was computed is stored in a manifest, so that a stage is only recomputed when
+one of its inputs changed.
+"""
+
+
+class StageCache:
+    """
+    Content-hashed cache of the pipeline stages of a book.
+    - data/cache/book_name/manifest.json : stage name -> key of the inputs used the last time the stage was computed
+    - data/cache/ner/key.pkl : output of BERT-NER on one chapter, shared between books since the key only depends on
+      the chapter text and the model
+    - data/cache/tokens/key.pkl : chunks and WordPiece ids of one chapter, the key only depends on the chapter text,
+      the vocabulary and the chunking (see EntitiesExtractor.split_text)
+    """
+    def __init__(self, book_name, cache_folder='data/cache/'):
+        """
+        :param book_name: str
+        :param cache_folder: folder where the manifests and the NER outputs are stored
+        """
+        self.cache_folder = cache_folder
+        self.manifest_path = os.path.join(cache_folder, book_name, 'manifest.json')
+        self.manifest = {}
+        if os.path.exists(self.manifest_path):
+            with open(self.manifest_path) as f:
+                self.manifest = json.load(f)
+        # path -> (size, modification time, digest) to avoid hashing again files that did not change
+        self.file_digests = self.manifest.setdefault('file_digests', {})
+        self.stages = self.manifest.setdefault('stages', {})
+
+    def save(self):
+        os.makedirs(os.path.dirname(self.manifest_path), exist_ok=True)
+        with open(self.manifest_path, 'w') as f:
+            json.dump(self.manifest, f, indent=1, sort_keys=True)
+
+    def hash_file(self, path):
+        """
+        :param path: path to a file
+        :return: sha256 of the content of the file
+        """
+        stat = os.stat(path)
+        size_and_time = [stat.st_size, stat.st_mtime_ns]
+        if path in self.file_digests and self.file_digests[path][:2] == size_and_time:
+            return self.file_digests[path][2]
+
+        digest = hashlib.sha256()
+        with open(path, 'rb') as f:
+            for block in iter(lambda: f.read(1 << 20), b''):
+                digest.update(block)
+        self.file_digests[path] = size_and_time + [digest.hexdigest()]
+        return digest.hexdigest()
+
+    def hash_path(self, path):
+        """
+        :param path: path to a file or a folder
+        :return: sha256 of the content of the file, or of the names and contents of the files of the folder
+        """
+        if not os.path.isdir(path):
+            return self.hash_file(path)
+        digest = hashlib.sha256()
+        for root, dirs, files in os.walk(path):
+            dirs.sort()
+            for file_name in sorted(files):
+                file_path = os.path.join(root, file_name)
+                digest.update(os.path.relpath(file_path, path).encode())
+                digest.update(self.hash_file(file_path).encode())
+        return digest.hexdigest()
+
+    @staticmethod
+    def key(*inputs):
+        """
+        :param inputs: digests (str) or parameters (json serializable)
+        :return: key of a stage computed from these inputs
+        """
+        return hashlib.sha256(json.dumps(inputs, sort_keys=True).encode()).hexdigest()
+
+    def is_fresh(self, stage, key, outputs=()):
+        """
+        :param stage: str, name of the stage
+        :param key: key of the current inputs of the stage
+        :param outputs: list of path that the stage produces
+        :return: True if the stage was computed with the same inputs and its outputs still exist
+        """
+        return self.stages.get(stage) == key and all(os.path.exists(output) for output in outputs)
+
+    def adopt(self, stage, key, outputs=()):
+        """
+        When a stage has never been recorded but its outputs exist (for instance the cache data we left in the
+        data folder), consider that they were computed from the current inputs
+        :return: True if the stage has been adopted
+        """
+        if stage not in self.stages and len(outputs) > 0 and all(os.path.exists(output) for output in outputs):
+            self.record(stage, key)
+            return True
+        return False
+
+    def record(self, stage, key):
+        """
+        Store the key of the inputs used to compute a stage
+        """
+        self.stages[stage] = key
+        self.save()
+
+    def invalidate(self, stage):
+        """
+        Forget a stage, so that it will be recomputed
+        """
+        if self.stages.pop(stage, None) is not None:
+            self.save()
+
+    def chapter_path(self, key, folder='ner'):
+        return os.path.join(self.cache_folder, folder, key + '.pkl')
+
+    def load_chapter(self, key, folder='ner'):
+        """
+        :param key: key of the chapter (chapter text and model)
+        :param folder: 'ner' for the BERT-NER outputs, 'tokens' for the tokenized chunks
+        :return: BERT-NER output of the chapter as returned by EntitiesExtractor.from_chapter_files (or its chunks),
+            None if it is not in the cache
+        """
+        if not os.path.exists(self.chapter_path(key, folder)):
+            return None
+        with open(self.chapter_path(key, folder), 'rb') as f:
+            return pickle.load(f)
+
+    def save_chapter(self, key, chapter_result, folder='ner'):
+        """
+        :param key: key of the chapter (chapter text and model)
+        :param chapter_result: BERT-NER output of the chapter as returned by EntitiesExtractor.from_chapter_files
+            (or its chunks)
+        :param folder: 'ner' for the BERT-NER outputs, 'tokens' for the tokenized chunks
+        """
+        os.makedirs(os.path.dirname(self.chapter_path(key, folder)), exist_ok=True)
+        # written then renamed, so that an interrupted run does not leave a truncated file
+        with open(self.chapter_path(key, folder) + '.tmp', 'wb') as f:
+            pickle.dump(chapter_result, f)
+        os.replace(self.chapter_path(key, folder) + '.tmp', self.chapter_path(key, folder))
@@ -1,8 +1,46 @@
+from src.storage import load_occurences
 from nameparser import HumanName
+from collections import Counter, namedtuple
 from enum import Enum
+from functools import lru_cache
 from tqdm import tqdm
 
 
+class ParsedName(namedtuple('ParsedName', ['title', 'first', 'middle', 'last', 'suffix', 'nickname', 'full_name'])):
+    """
+    Immutable record of the fields of a HumanName object, str() gives the name as formatted by HumanName
+    """
+    __slots__ = ()
+
+    def __str__(self):
+        return self.full_name
+
+
+@lru_cache(maxsize=65536)
+def parse_human_name(name, drop_first=False):
+    """
+    Parse a name with the HumanName parser. As the same names are met thousands of times in a novel,
+    the results are cached : use parse_human_name.cache_info() to get the hits and misses of the cache.
+    :param name: str, the whitespaces are expected to be normalized (see parsed_name)
+    :param drop_first: True to remove the first name from the parsed name
+    :return: ParsedName
+    """
+    human_name = HumanName(name)
+    if drop_first:
+        human_name.first = ""
+    return ParsedName(human_name.title, human_name.first, human_name.middle, human_name.last,
+                      human_name.suffix, human_name.nickname, str(human_name))
+
+
+def parsed_name(name, drop_first=False):
+    """
+    :param name: str
+    :param drop_first: True to remove the first name from the parsed name
+    :return: ParsedName of name, from the cache of parse_human_name
+    """
+    return parse_human_name(" ".join(name.split()), drop_first)
+
+
 class Genre(Enum):
     FEMALE = 1
     MALE = 2
@@ -11,7 +49,7 @@ class Genre(Enum):
 
 class Entity:
     """
-    We define an entity as being a HumanName object + a genre
+    We define an entity as being a parsed HumanName (ParsedName object) + a genre
     """
     def __init__(self, human_name, genre=Genre.UKN):
         self.human_name = human_name
@@ -31,6 +69,10 @@ class Coreferences:
     """
     Given a list of person name, the Coreferences class will iteratively generate a list of entities
     so that each HumanName is bind to one unique entity
+
+    To avoid scanning all the entities for each person name, the entities are indexed by (first, last) name,
+    by first name and by last name, and the number of person names associated to each entity is kept up to date
+    each time an entity is matched.
     """
 
     def __init__(self, person_name_list, coref_rules_folder='data/coref_rules/'):
@@ -42,6 +84,17 @@ class Coreferences:
         self.entity_set = set()
         self.entities_match = dict()
 
+        # Indexes of the entities of entity_set : key -> list of entities
+        self.entities_by_first_last = dict()
+        self.entities_by_first = dict()
+        self.entities_by_last = dict()
+        # Number of values of entities_match equal to each entity
+        self.entity_counter = Counter()
+        # Values of entities_match that are not an Entity object (see resolve pre-processing step)
+        self.other_matches = dict()
+        # Rank of each entity in the iteration order of entity_set, None when entity_set changed since it was computed
+        self.entity_rank = None
+
         self.male_names = self.load_genre_rules(coref_rules_folder+'male_name.txt')
         self.female_names = self.load_genre_rules(coref_rules_folder+'female_name.txt')
         self.male_titles = self.load_genre_rules(coref_rules_folder+'male_title.txt')
@@ -49,6 +102,15 @@ class Coreferences:
         self.neutral_titles = self.load_genre_rules(coref_rules_folder + 'neutral_titles.txt')
         self.nicknames = self.load_nicknames(coref_rules_folder + 'nicknames.txt')
 
+    @classmethod
+    def from_occurences(cls, path, coref_rules_folder='data/coref_rules/'):
+        """
+        :param path: folder containing an occurence list stored in the columnar format (see src.storage)
+        :param coref_rules_folder: path to folder containing list of different possible name/title for male/female
+        :return: Coreferences on the character names of the occurence list
+        """
+        return cls(load_occurences(path).character_names(), coref_rules_folder=coref_rules_folder)
+
     @staticmethod
     def load_genre_rules(path_file):
         """
@@ -56,7 +118,7 @@ class Coreferences:
         """
         with open(path_file, 'r') as f:
             list_of_rules = f.read().splitlines()
-        return [rule.lower() for rule in list_of_rules]
+        return set(rule.lower() for rule in list_of_rules)
 
     @staticmethod
     def load_nicknames(path_file):
@@ -80,9 +142,9 @@ class Coreferences:
         For step 3 : if we consider "Jade's bag"
             sometime BERT_ner will return Jade <B-PEr>, 's <I-PER> ... so the result character name will be Jade's
         :param character_name: str
-        :return: HumanName object
+        :return: ParsedName object
         """
-        return HumanName(character_name.lower())
+        return parsed_name(character_name.lower())
 
     def genre_of(self, human_name):
         """
@@ -109,7 +171,20 @@ class Coreferences:
         :param entity: Entity
         :return: int
         """
-        return list(self.entities_match.values()).count(entity)
+        return self.entity_counter[entity] + sum(1 for value in self.other_matches.values() if value == entity)
+
+    def first_in_entity_set(self, entity_list):
+        """
+        Among a list of entities, return the one that comes first when iterating over self.entity_set
+        (ie: the one that was selected when the candidates were found by scanning self.entity_set)
+        :param entity_list: list[Entity]
+        :return: Entity
+        """
+        if len(entity_list) == 1:
+            return entity_list[0]
+        if self.entity_rank is None:
+            self.entity_rank = {entity: rank for rank, entity in enumerate(self.entity_set)}
+        return min(entity_list, key=self.entity_rank.__getitem__)
 
     def most_frequent_entity(self, entity_list):
         """
@@ -123,7 +198,27 @@ class Coreferences:
         if len(entity_list) == 0:
             return None
         else:
-            return max(entity_list, key=lambda x:x[1])[0]
+            max_frequency = max(frequency for _, frequency in entity_list)
+            return self.first_in_entity_set([entity for entity, frequency in entity_list
+                                             if frequency == max_frequency])
+
+    def match(self, idx, entity):
+        """
+        Associate the person name of index idx to an entity, keeping the entity frequencies up to date
+        :param idx: int
+        :param entity: Entity
+        """
+        if idx in self.entities_match:
+            previous_entity = self.entities_match[idx]
+            if isinstance(previous_entity, Entity):
+                self.entity_counter[previous_entity] -= 1
+            else:
+                del self.other_matches[idx]
+        self.entities_match[idx] = entity
+        if isinstance(entity, Entity):
+            self.entity_counter[entity] += 1
+        else:
+            self.other_matches[idx] = entity
 
     def create_entity(self, idx, human_name):
         """
@@ -133,8 +228,47 @@ class Coreferences:
         :param human_name: HumanName
         """
         new_entity = Entity(human_name, self.genre_of(human_name))
-        self.entity_set.add(new_entity)
-        self.entities_match[idx] = new_entity
+        if new_entity not in self.entity_set:
+            self.entity_set.add(new_entity)
+            self.entity_rank = None
+            self.entities_by_first_last.setdefault((human_name.first, human_name.last), []).append(new_entity)
+            self.entities_by_first.setdefault(human_name.first, []).append(new_entity)
+            self.entities_by_last.setdefault(human_name.last, []).append(new_entity)
+        self.match(idx, new_entity)
+
+    def entities_with_first_and_last(self, human_name):
+        """
+        :param human_name: HumanName
+        :return: the entity which has the same first and last name than human_name, None if there is not
+        """
+        match_entities = self.entities_by_first_last.get((human_name.first, human_name.last), [])
+        if len(match_entities) == 0:
+            return None
+        return self.first_in_entity_set(match_entities)
+
+    def entities_with_first(self, first_name):
+        """
+        :param first_name: str
+        :return: list of the entities whose first name is first_name
+        """
+        return self.entities_by_first.get(first_name, [])
+
+    def entities_with_last(self, last_name):
+        """
+        :param last_name: str
+        :return: list of the entities whose last name is last_name
+        """
+        return self.entities_by_last.get(last_name, [])
+
+    def entities_with_same_genre(self, entity_list, human_name):
+        """
+        :param entity_list: list[Entity]
+        :param human_name: HumanName
+        :return: the entities of entity_list whose genre is compatible with the one of human_name
+        """
+        genre = self.genre_of(human_name)
+        return [entity for entity in entity_list
+                if genre == Genre.UKN or entity.genre == Genre.UKN or entity.genre == genre]
 
     def resolve(self, match_entity=None):
         """
@@ -153,15 +287,15 @@ class Coreferences:
         # by BERT NER but we won't try to associate it with an entity.
         # by default, we will associate such terms with a unique "NONE" entity
         remaining_list = []
-        empty_entity = Entity(HumanName("NONE"))
+        empty_entity = Entity(parsed_name("NONE"))
         for idx, human_name in human_name_list:
             if human_name.first == "" and human_name.last == "":
-                self.entities_match[idx] = empty_entity
+                self.match(idx, empty_entity)
             else:
+                if human_name.first == "``":
+                    human_name = parsed_name(self.person_name_list[idx].lower(), drop_first=True)
+                    self.match(idx, human_name)
                 remaining_list.append((idx, human_name))
-            if human_name.first == "``":
-                human_name.first = ""
-                self.entities_match[idx] = human_name
         human_name_list = remaining_list
 
         # STEP 1 :
@@ -173,17 +307,12 @@ class Coreferences:
         remaining_list = []  # to store the human name we have not succeed to bind to an entity
         for idx, human_name in tqdm(human_name_list):
             if human_name.title != "" and human_name.first != "" and human_name.last != "":
-                try:
-                    match_entity = [entity for entity in self.entity_set
-                                           if human_name.first == entity.human_name.first and
-                                              human_name.last == entity.human_name.last][0]
-                except IndexError:
-                    match_entity = None
+                match_entity = self.entities_with_first_and_last(human_name)
 
                 if match_entity is None:
                     self.create_entity(idx, human_name)
                 else:
-                    self.entities_match[idx] = match_entity
+                    self.match(idx, match_entity)
             else:
                 remaining_list.append((idx, human_name))
         human_name_list = remaining_list
@@ -197,17 +326,12 @@ class Coreferences:
         remaining_list = []
         for idx, human_name in tqdm(human_name_list):
             if human_name.first != "" and human_name.last != "":
-                try:
-                    match_entity = [entity for entity in self.entity_set
-                                           if human_name.first == entity.human_name.first and
-                                              human_name.last == entity.human_name.last][0]
-                except IndexError:
-                    match_entity = None
+                match_entity = self.entities_with_first_and_last(human_name)
 
                 if match_entity is None:
                     self.create_entity(idx, human_name)
                 else:
-                    self.entities_match[idx] = match_entity
+                    self.match(idx, match_entity)
             else:
                 remaining_list.append((idx, human_name))
         human_name_list = remaining_list
@@ -223,20 +347,14 @@ class Coreferences:
         remaining_list = []
         for idx, human_name in tqdm(human_name_list):
             if human_name.title != "" and human_name.first != "":
-                possible_entities = []
-                for entity in self.entity_set:
-                    if entity.human_name.first == human_name.first:
-                        if self.genre_of(human_name) == Genre.UKN or entity.genre == Genre.UKN:
-                            possible_entities.append(entity)
-                        else:
-                            if entity.genre == self.genre_of(human_name):
-                                possible_entities.append(entity)
+                possible_entities = self.entities_with_same_genre(self.entities_with_first(human_name.first),
+                                                                  human_name)
 
                 match_entity = self.most_frequent_entity(possible_entities)
                 if match_entity is None:
                     self.create_entity(idx, human_name)
                 else:
-                    self.entities_match[idx] = match_entity
+                    self.match(idx, match_entity)
             else:
                 remaining_list.append((idx, human_name))
         human_name_list = remaining_list
@@ -251,20 +369,14 @@ class Coreferences:
         remaining_list = []
         for idx, human_name in tqdm(human_name_list):
             if human_name.title != "" and human_name.last != "":
-                possible_entities = []
-                for entity in self.entity_set:
-                    if entity.human_name.last == human_name.last:
-                        if self.genre_of(human_name) == Genre.UKN or entity.genre == Genre.UKN:
-                            possible_entities.append(entity)
-                        else:
-                            if entity.genre == self.genre_of(human_name):
-                                possible_entities.append(entity)
+                possible_entities = self.entities_with_same_genre(self.entities_with_last(human_name.last),
+                                                                  human_name)
                 match_entity = self.most_frequent_entity(possible_entities)
 
                 if match_entity is None:
                     self.create_entity(idx, human_name)
                 else:
-                    self.entities_match[idx] = match_entity
+                    self.match(idx, match_entity)
             else:
                 remaining_list.append((idx, human_name))
         human_name_list = remaining_list
@@ -278,19 +390,17 @@ class Coreferences:
         print("Co-ref step 5 : associate character name that have just first name or last name to entity")
         for idx, human_name in tqdm(human_name_list):
             if human_name.first == "":
-                possible_entities = [entity for entity in self.entity_set
-                                     if entity.human_name.last == human_name.last or
-                                     entity.human_name.first == human_name.last]
+                name = human_name.last
             if human_name.last == "":
-                possible_entities = [entity for entity in self.entity_set
-                                     if entity.human_name.first == human_name.first or
-                                     entity.human_name.last == human_name.first]
+                name = human_name.first
+            possible_entities = self.entities_with_last(name) + \
+                [entity for entity in self.entities_with_first(name) if entity.human_name.last != name]
 
             match_entity = self.most_frequent_entity(possible_entities)
             if match_entity is None:
                 self.create_entity(idx, human_name)
             else:
-                self.entities_match[idx] = match_entity
+                self.match(idx, match_entity)
 
         return self.entities_match
 
@@ -318,31 +428,31 @@ class Coreferences:
         names_as_nicknames = {}
         set_entities = set()
         for index in range(len(idx_to_entity)):
-            parsed_name = HumanName(str(idx_to_entity[index])).as_dict()
+            parsed = parsed_name(str(idx_to_entity[index]))
             set_entities.add(idx_to_entity[index])
-            if 0 < len(parsed_name['first']) < 4 and parsed_name['last'] != "" and "." in parsed_name['first']:
-                names_with_initial[index] = parsed_name
-            elif parsed_name['last'] == "" and parsed_name['first'].upper() in list(self.nicknames.keys()):
-                names_as_nicknames[index] = parsed_name
+            if 0 < len(parsed.first) < 4 and parsed.last != "" and "." in parsed.first:
+                names_with_initial[index] = parsed
+            elif parsed.last == "" and parsed.first.upper() in self.nicknames:
+                names_as_nicknames[index] = parsed
 
         # Change entity matching for intials
         for key, name in names_with_initial.items():
             for entity in set_entities:
-                entity_parsed = HumanName(str(entity)).as_dict()
-                if name['last'] == entity_parsed['last'] and name['first'][0] == entity_parsed['first'][0] \
-                        and name['first'] != entity_parsed['first']:
+                entity_parsed = parsed_name(str(entity))
+                if name.last == entity_parsed.last and name.first[0] == entity_parsed.first[0] \
+                        and name.first != entity_parsed.first:
                     idx_to_entity[key] = entity  # most common
 
         # Change entity matching for nicknames
         for key, name in names_as_nicknames.items():
             for entity in set_entities:
-                entity_parsed = HumanName(str(entity)).as_dict()
-                if name['last'] == "" and name['first'].upper() in list(self.nicknames.keys()) and \
-                        entity_parsed['first'].upper() in list(self.nicknames[name['first'].upper()]):
+                entity_parsed = parsed_name(str(entity))
+                if name.last == "" and name.first.upper() in self.nicknames and \
+                        entity_parsed.first.upper() in self.nicknames[name.first.upper()]:
                     idx_to_entity[key] = entity
-                elif name['last'] == "" and name['first'].upper() in list(self.nicknames.keys()) and \
-                        name['first'] != entity_parsed['last'] and entity_parsed['title'] != "" and \
-                        entity_parsed['last'].upper() in list(self.nicknames[name['first'].upper()]):
+                elif name.last == "" and name.first.upper() in self.nicknames and \
+                        name.first != entity_parsed.last and entity_parsed.title != "" and \
+                        entity_parsed.last.upper() in self.nicknames[name.first.upper()]:
                     idx_to_entity[key] = entity
 
         # Remove 'NONE' entities
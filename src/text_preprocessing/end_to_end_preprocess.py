@@ -1,15 +1,17 @@
 # Import files
 from src.third_party.chapterize import Book
 from src.text_preprocessing.entities_extraction import EntitiesExtractor
+from src.text_preprocessing.text_chunker import CHUNKER_VERSION
 from src.text_preprocessing.coreferences_resolution import Coreferences
+from src.storage import save_occurences, load_occurences, occurences_location, StageCache
 
 # Import libraries
 import shutil
 import os
-import pickle
 
 
-def text_preprocessing(book_name, reprocess=False, bert_large=False):
+def text_preprocessing(book_name, reprocess=False, bert_large=False, ner_batch_size=None, workers=1, ner_overlap=0,
+                       ner_precision='fp32', ner_server=None, ner_pipeline=0):
     """
     Apply end-to-end text preprocessing from raw text to occurence list as detailled below :
     1/ Chapterize the book
@@ -20,54 +22,121 @@ def text_preprocessing(book_name, reprocess=False, bert_large=False):
          position -> [int] position of the occurence in the text (nb of bert-tokens since text beginning
          chapter -> [int] chapter corresponding to the positon
          entity -> [str] name of the entity that have been link to by CO-REF module}
-    5/ Dump the occurence list using pickle in data/entity_list/book_name.pkl
+    5/ Store the occurence list in the columnar format (see src.storage) in data/entity_list/book_name_occ_list
 
-    If the preprocess has always been done, don't do anything unless reprocess = True
+    Each step is only recomputed when its inputs changed (see src.storage.StageCache) :
+        - chapterize : the raw text
+        - NER : the text of each chapter, the BERT-NER model, its precision and the chunking, only the chapters that
+          changed are processed again. The tokenized chunks of each chapter are also cached : they are not tokenized
+          again after a crash or with another model which has the same vocabulary
+        - COREF : the NER output and the files of data/coref_rules
+    unless reprocess = True
 
     :param book_name: str of the book, must be present as txt file in data/raw/text
     :param reprocess: boolean, use True to force the re-preprocessing of a book
     :param bert_large: True to use bert_large, by default bert_base
+    :param ner_batch_size: number of chunks per BERT-NER forward pass, by default chunks are processed one by one
+    :param workers: number of processes used to apply BERT-NER on the chapters in parallel
+    :param ner_overlap: number of sentences of the previous chunk given as context to BERT-NER at the start of each
+        chunk (see TokenBudgetChunker)
+    :param ner_precision: 'fp32', or 'int8' to apply BERT-NER with its linear layers quantized (the quantized weights
+        are saved next to the model folder)
+    :param ner_server: url of a NER server (see bert_ner/api.py) which serves the BERT-NER model in ner_precision
+        (the server must run the same model folder : its digest is checked, since the outputs are cached under it).
+        If given, the model is not loaded by the pipeline : the chunks are sent to the server, which batches them with
+        the chunks of its other clients
+    :param ner_pipeline: if > 0, number of threads chunking and tokenizing the chapters ahead of BERT-NER, the forward
+        passes and the merging of the tags running concurrently (see NerPipeline)
     """
+    cache = StageCache(book_name)
+    raw_text_path = 'data/raw_text/' + book_name + '.txt'
+    chapter_folder = 'data/book_by_chapter/' + book_name + '/'
+    NER_path = 'data/entity_list/' + book_name
+    occurence_list_path = 'data/entity_list/' + book_name + '_occ_list'
+
     # STEP 1 : Split the book in chapter by using chapterize
-    if not os.path.exists('data/book_by_chapter/' + book_name) or reprocess:
+    if os.path.exists(raw_text_path):
+        chapterize_key = cache.key(cache.hash_file(raw_text_path))
+        cache.adopt('chapterize', chapterize_key, outputs=[chapter_folder])
+    else:
+        # no raw text : we can only use the chapters that are already there
+        chapterize_key = cache.stages.get('chapterize')
+    if not cache.is_fresh('chapterize', chapterize_key, outputs=[chapter_folder]) or reprocess:
         print("-- SPLIT BOOK BY CHAPTER --")
-        book = Book(filename='data/raw_text/' + book_name + '.txt', nochapters=False, stats=False)
+        if os.path.exists(chapter_folder):
+            shutil.rmtree(chapter_folder)
+        book = Book(filename=raw_text_path, nochapters=False, stats=False)
         # this will create a new folder named 'book_name-chapter', containing all the chapter in the current folder
         # so we move this folder in data/book_by_chapter
         os.rename(book_name + '-chapters', book_name)
         shutil.move(book_name, 'data/book_by_chapter/')
+        cache.record('chapterize', chapterize_key)
     else:
         print("-- LOAD CHAPTER FROM CACHE --")
 
     # STEP 2 : Apply NER on each chapter
-    if not os.path.exists('data/entity_list/' + book_name + '.pkl') or reprocess:
+    path_to_bert_ner = 'models/bert_ner_large/' if bert_large else 'models/bert_ner_base/'
+    chapter_list = EntitiesExtractor.list_chapter_files(chapter_folder)
+    model_digest = cache.hash_path(path_to_bert_ner) if os.path.isdir(path_to_bert_ner) else None
+    ner_parameters = {'chunker': CHUNKER_VERSION, 'overlap': ner_overlap, 'precision': ner_precision}
+    chapter_keys = [cache.key(cache.hash_file(chapter_folder + chapter), model_digest, ner_parameters)
+                    for chapter in chapter_list]
+    # without model, we can only use the NER output that is already there
+    NER_key = cache.key(chapter_keys) if model_digest is not None else cache.stages.get('ner')
+    cache.adopt('ner', NER_key, outputs=[occurences_location(NER_path)])
+    if not cache.is_fresh('ner', NER_key, outputs=[occurences_location(NER_path)]) or reprocess:
         print("-- APPLY BERT-NER ON EACH CHAPTER --")
-        if bert_large:
-            entities_extractor = EntitiesExtractor(path_to_bert_ner='models/bert_ner_large/')
-        else:
-            entities_extractor = EntitiesExtractor(path_to_bert_ner='models/bert_ner_base/')
+        chapter_results = [None if reprocess else cache.load_chapter(key) for key in chapter_keys]
+        to_process = [idx for idx, chapter_result in enumerate(chapter_results) if chapter_result is None]
+        print("Number of chapter in the NER cache: ", len(chapter_list) - len(to_process))
+        if len(to_process) > 0:
+            chapter_paths = [chapter_folder + chapter_list[idx] for idx in to_process]
+            if workers > 1:
+                new_results = EntitiesExtractor.from_chapter_files_parallel(path_to_bert_ner, chapter_paths, to_process,
+                                                                           workers, batch_size=ner_batch_size,
+                                                                           overlap=ner_overlap, token_cache=cache,
+                                                                           precision=ner_precision,
+                                                                           server_url=ner_server,
+                                                                           pipeline_workers=ner_pipeline,
+                                                                           model_digest=model_digest)
+            else:
+                entities_extractor = EntitiesExtractor(path_to_bert_ner=path_to_bert_ner, overlap=ner_overlap,
+                                                       token_cache=cache, precision=ner_precision,
+                                                       server_url=ner_server, pipeline_workers=ner_pipeline,
+                                                       model_digest=model_digest)
+                new_results = entities_extractor.from_chapter_files(chapter_paths, to_process,
+                                                                    batch_size=ner_batch_size)
+            for idx, chapter_result in zip(to_process, new_results):
+                cache.save_chapter(chapter_keys[idx], chapter_result)
+                chapter_results[idx] = chapter_result
 
-        NER_list = entities_extractor.from_chapter_folder(folder_path='data/book_by_chapter/' + book_name + '/')
-        pickle.dump(NER_list, open('data/entity_list/' + book_name + '.pkl', 'wb'))
+        # the same chapter text may have had another index when it was cached
+        chapter_results = [([dict(occurence, chapter=idx) for occurence in chapter_NER_list], nb_of_tokens)
+                           for idx, (chapter_NER_list, nb_of_tokens) in enumerate(chapter_results)]
+        NER_list = EntitiesExtractor.merge_chapters(chapter_results)
+        save_occurences(NER_list, NER_path)
+        cache.record('ner', NER_key)
     else:
         print("-- LOAD CHARACTER NAMES FROM CACHE --")
 
     # STEP 3 : Associate an entity to each character name
-    # if not os.path.exists('data/entity_list/'+book_name+'.pkl'):
-    if not os.path.exists('data/entity_list/' + book_name + '_occ_list.pkl') or reprocess:
+    coref_key = cache.key(cache.hash_path(occurences_location(NER_path)), cache.hash_path('data/coref_rules/'))
+    cache.adopt('coref', coref_key, outputs=[occurences_location(occurence_list_path)])
+    if not cache.is_fresh('coref', coref_key, outputs=[occurences_location(occurence_list_path)]) or reprocess:
         print("-- APPLY CO-REF RULES TO GENERATE ENTITIES")
-        NER_list = pickle.load(open('data/entity_list/' + book_name + '.pkl', 'rb'))
-        character_name_list = [occurence['character_name'] for occurence in NER_list]
-        coref = Coreferences(character_name_list, coref_rules_folder='data/coref_rules/')
+        NER_list = load_occurences(NER_path)
+        coref = Coreferences.from_occurences(NER_path, coref_rules_folder='data/coref_rules/')
         idx_to_entity = coref.resolve()
         idx_to_entity, l = coref.improved_matching(idx_to_entity)
-        occurence_list = [{'character_name': NER_list[i]['character_name'],
-                           'position': NER_list[i]['position'],
-                           'chapter': NER_list[i]['chapter'],
+        discarded = set(l)
+        occurence_list = [{'character_name': character_name,
+                           'position': position,
+                           'chapter': chapter,
                            'entity': str(idx_to_entity[i]).upper()}
-                          for i in range(len(NER_list)) if i not in l]
+                          for i, (character_name, position, chapter, _) in enumerate(NER_list.records())
+                          if i not in discarded]
         # Save final occurrence list
-        pickle.dump(occurence_list, open('data/entity_list/' + book_name + '_occ_list.pkl', 'wb'))
+        save_occurences(occurence_list, occurence_list_path)
+        cache.record('coref', coref_key)
     else:
         print("-- LOAD OCCURENCE LIST FROM CACHE --")
-
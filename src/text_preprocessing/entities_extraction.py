@@ -1,6 +1,11 @@
-from src.third_party.bert_ner.bert import Ner
+from src.third_party.bert_ner.bert import Ner, NerClient
+from src.text_preprocessing.text_chunker import TokenBudgetChunker, CHUNKER_VERSION
+from src.text_preprocessing.ner_pipeline import NerPipeline
+import hashlib
+import multiprocessing
 import os
 import re
+import torch
 from tqdm import tqdm
 
 class EntitiesExtractor:
@@ -15,48 +20,93 @@ class EntitiesExtractor:
         [{character_name:[str], position:[int], chapter[int]}]
     By default, if there is no information on the chapters (case 1 above) the chapter value will be -1
     """
-    def __init__(self, path_to_bert_ner):
+    def __init__(self, path_to_bert_ner, overlap=0, token_cache=None, precision='fp32', server_url=None,
+                 pipeline_workers=0, pipeline_queue_size=4, model_digest=None):
         """
         :param path_to_bert_ner: path to the bert ner model
+        :param overlap: number of sentences of the previous chunk given as context at the start of each chunk
+            (see TokenBudgetChunker)
+        :param token_cache: StageCache where the tokenized chunks of each text are saved, so that they are not
+            tokenized again (by another model with the same vocabulary, or after a crash). By default, no cache
+        :param precision: 'fp32' or 'int8' (dynamic quantization of the linear layers of BERT-NER, see Ner.load_model)
+        :param server_url: url of a NER server (see bert_ner/api.py) serving the model of path_to_bert_ner in this
+            precision. If given, the model is not loaded : only its tokenizer is, and the chunks are sent to the
+            server (see NerClient). By default, the model is loaded in this process
+        :param pipeline_workers: if > 0, the chunking, the forward passes and the decoding of the tags run concurrently
+            (see NerPipeline), pipeline_workers threads preparing the batches. By default (0), they run in sequence
+        :param pipeline_queue_size: maximum number of batches prepared ahead of the model in the pipeline
+        :param model_digest: digest of path_to_bert_ner (see StageCache.hash_path), which the NER server must serve.
+            By default, computed from the folder when a server is used
         """
-        self.bert_ner = Ner(path_to_bert_ner)
+        if server_url is None:
+            self.bert_ner = Ner(path_to_bert_ner, precision=precision)
+        else:
+            self.bert_ner = NerClient(path_to_bert_ner, server_url, precision=precision, model_digest=model_digest)
+        # [CLS] and [SEP] are added to each chunk
+        self.chunker = TokenBudgetChunker(self.bert_ner.tokenize, self.bert_ner.max_seq_length - 2, overlap=overlap)
+        self.token_cache = token_cache
+        self.pipeline = NerPipeline(self.bert_ner, nb_workers=pipeline_workers, queue_size=pipeline_queue_size) \
+            if pipeline_workers > 0 else None
+        if token_cache is not None:
+            self.tokenizer_key = token_cache.key(token_cache.hash_file(os.path.join(path_to_bert_ner, 'vocab.txt')),
+                                                 self.bert_ner.model_config["do_lower"], self.chunker.budget,
+                                                 {'chunker': CHUNKER_VERSION, 'overlap': overlap})
 
-    @staticmethod
-    def split_text(string, batch_size=256):
+    def measure(self, text):
         """
-        1/ the string is tokenize using space as separator
-        2/ the token_list is split in batch of batch_size
-        3/ from the batches, a generator of substring is generated
-        :param string: input_string
-        :param batch_size: int
-        :return: a generator of substring of size batch_size (batch_size = nb of tokens in the substring)
+        :param text: str
+        :return: number of words, number of BERT sub-tokens of the text
         """
-        token_list = string.split(" ")
+        encoding = self.bert_ner.tokenize(text)
+        return len(encoding.words), len(encoding.subword_ids)
 
-        for i in range(len(string) // batch_size):
-            yield " ".join(token_list[i * batch_size: (i + 1) * batch_size])
+    def split_text(self, text):
+        """
+        Split the text in chunks of whole sentences which fit in the input of BERT-NER (see TokenBudgetChunker)
+        The chunks are read from the token cache when the text was already tokenized
+        :param text: str
+        :return: list of Chunk (text, nb_context_words, nb_words, encoding)
+        """
+        return list(self.iter_chunks(text))
 
-        if len(string) % batch_size != 0:
-            yield " ".join(token_list[(len(token_list) // batch_size) * batch_size:])
+    def iter_chunks(self, text):
+        """
+        Same as split_text, but the chunks are given as soon as they are made (see NerPipeline)
+        :param text: str
+        :return: generator of Chunk
+        """
+        if self.token_cache is None:
+            yield from self.chunker.chunks(text)
+            return
+        key = self.token_cache.key(hashlib.sha256(text.encode()).hexdigest(), self.tokenizer_key)
+        chunks = self.token_cache.load_chapter(key, folder='tokens')
+        if chunks is not None:
+            yield from chunks
+            return
+        chunks = []
+        for chunk in self.chunker.chunks(text):
+            chunks.append(chunk)
+            yield chunk
+        self.token_cache.save_chapter(key, chunks, folder='tokens')
 
-    def from_text(self, text, initial_position=0, chapter=-1):
+    @staticmethod
+    def chunk_tokens(chunk, token_list):
         """
-        From a text from a given chapter, return a list of dict(character_name, position, chapter)
-        :param text: string
+        :param chunk: Chunk
+        :param token_list: output of BERT-NER on chunk.encoding
+        :return: the tokens of the words of the chunk which are not context (already tagged in the previous chunk)
+        """
+        return token_list[chunk.nb_context_words:]
+
+    @staticmethod
+    def merge_person_tokens(token_list, initial_position=0, chapter=-1):
+        """
+        Select only the PER entities from the output of BERT-NER and merge B-PER with I-PER
+        :param token_list: list [dict(word, tag, confidence)]
         :param initial_position: int, the index of first word in the global novel
         :param chapter: int, the index of the current chapter
-        :return: list [dict(character_name, position, chapter)]
+        :return: list [dict(character_name, position, chapter)], number of tokens
         """
-
-        # Apply BERT-NER on each substring
-        token_list = []
-        bar_text = "Process of chapter " + str(chapter) if chapter != -1 \
-                   else "Process of text"
-        for subtext in tqdm(list(EntitiesExtractor.split_text(text, batch_size=200)),
-                            desc=bar_text):
-            token_list += self.bert_ner.predict(subtext)
-
-        # Select only the PER entities + merge B-PER with I-PER
         output_list = []
         i = 0
         while i < len(token_list):
@@ -76,11 +126,41 @@ class EntitiesExtractor:
                                     'chapter': chapter})
         return output_list, i
 
-    def from_chapter_folder(self, folder_path):
+    def from_text(self, text, initial_position=0, chapter=-1, batch_size=None):
         """
-        :param folder_path: path to folder which contain a set of raw text chapter
+        From a text from a given chapter, return a list of dict(character_name, position, chapter)
+        :param text: string
+        :param initial_position: int, the index of first word in the global novel
+        :param chapter: int, the index of the current chapter
+        :param batch_size: int, number of chunks per BERT-NER forward pass.
+            By default (None), chunks are processed one by one
         :return: list [dict(character_name, position, chapter)]
         """
+        if self.pipeline is not None:
+            return self.run_pipeline([text], self.iter_chunks, [chapter], batch_size, initial_position)[0]
+
+        # Apply BERT-NER on each chunk
+        token_list = []
+        chunks = self.split_text(text)
+        if batch_size is None:
+            bar_text = "Process of chapter " + str(chapter) if chapter != -1 \
+                       else "Process of text"
+            for chunk in tqdm(chunks, desc=bar_text):
+                token_list += self.chunk_tokens(chunk, self.bert_ner.predict_encoding(chunk.encoding))
+        else:
+            outputs = self.bert_ner.predict_encodings([chunk.encoding for chunk in chunks], batch_size=batch_size)
+            for chunk, chunk_token_list in zip(chunks, outputs):
+                token_list += self.chunk_tokens(chunk, chunk_token_list)
+
+        # Select only the PER entities + merge B-PER with I-PER
+        return self.merge_person_tokens(token_list, initial_position, chapter)
+
+    @staticmethod
+    def list_chapter_files(folder_path):
+        """
+        :param folder_path: path to folder which contain a set of raw text chapter
+        :return: list of the chapter file names, sorted by chapter number
+        """
 
         def extract_chapter_number(string):
             return int(re.search('([0-9]+)\.txt', string).group(1))
@@ -88,19 +168,207 @@ class EntitiesExtractor:
         def sort_by_chapter(file_list):
             return sorted(file_list, key=extract_chapter_number, reverse=False)
 
-        chapter_list = sort_by_chapter(os.listdir(folder_path))
+        return sort_by_chapter(os.listdir(folder_path))
+
+    def from_chapter_folder(self, folder_path, batch_size=None):
+        """
+        :param folder_path: path to folder which contain a set of raw text chapter
+        :param batch_size: int, if given, the chunks of all the chapters are processed together by BERT-NER,
+            batch_size chunks per forward pass. By default (None), chunks are processed one by one
+        :return: list [dict(character_name, position, chapter)]
+        """
+        chapter_list = self.list_chapter_files(folder_path)
         print("Number of chapter to process: ", len(chapter_list))
 
+        chapter_paths = [folder_path + chapter for chapter in chapter_list]
+        return self.merge_chapters(self.from_chapter_files(chapter_paths, range(len(chapter_list)), batch_size))
+
+    def from_chapter_files(self, chapter_paths, chapter_indexes, batch_size=None):
+        """
+        Apply BERT-NER on each chapter independently
+        :param chapter_paths: list of path to raw text chapters
+        :param chapter_indexes: list of the index of each chapter in the novel
+        :param batch_size: int, if given, the chunks of all the chapters are processed together by BERT-NER,
+            batch_size chunks per forward pass. By default (None), chunks are processed one by one
+        :return: list of tuple, one per chapter :
+            (list [dict(character_name, position, chapter)] with positions relative to the chapter start,
+             number of tokens of the chapter)
+        """
+        if self.pipeline is not None:
+            return self.from_chapter_files_pipelined(chapter_paths, chapter_indexes, batch_size)
+        if batch_size is not None:
+            return self.from_chapter_files_batched(chapter_paths, chapter_indexes, batch_size)
+
+        chapter_results = []
+        for idx, chapter_path in tqdm(list(zip(chapter_indexes, chapter_paths)), desc='Advance progression'):
+            with open(chapter_path) as f:
+                chapter_results.append(self.from_text(f.read(), initial_position=0, chapter=idx))
+        return chapter_results
+
+    def from_chapter_files_batched(self, chapter_paths, chapter_indexes, batch_size):
+        """
+        Apply BERT-NER on the chunks of all the chapters at once, so that batches are not limited to one chapter
+        and chunks of similar length are padded together
+        :param chapter_paths: list of path to raw text chapters
+        :param chapter_indexes: list of the index of each chapter in the novel
+        :param batch_size: int, number of chunks per BERT-NER forward pass
+        :return: same as from_chapter_files
+        """
+        chunks = []
+        chapter_of_chunk = []
+        for rank, chapter_path in enumerate(chapter_paths):
+            with open(chapter_path) as f:
+                chapter_chunks = self.split_text(f.read())
+            chunks += chapter_chunks
+            chapter_of_chunk += [rank] * len(chapter_chunks)
+
+        chapter_token_lists = [[] for _ in chapter_paths]
+        outputs = self.bert_ner.predict_encodings([chunk.encoding for chunk in chunks], batch_size=batch_size)
+        for rank, chunk, chunk_token_list in zip(chapter_of_chunk, chunks, outputs):
+            chapter_token_lists[rank] += self.chunk_tokens(chunk, chunk_token_list)
+
+        return [self.merge_person_tokens(token_list, initial_position=0, chapter=idx)
+                for idx, token_list in zip(chapter_indexes, chapter_token_lists)]
+
+    def from_chapter_files_pipelined(self, chapter_paths, chapter_indexes, batch_size=None):
+        """
+        Apply BERT-NER on each chapter through the pipeline (see NerPipeline) : the next chapters are read, chunked
+        and tokenized while the model runs, and the tags of a chapter are merged once all its chunks are tagged
+        :param chapter_paths: list of path to raw text chapters
+        :param chapter_indexes: list of the index of each chapter in the novel
+        :param batch_size: int, number of chunks of a chapter per BERT-NER forward pass. By default (None), one chunk
+        :return: same as from_chapter_files
+        """
+        def read_chunks(chapter_path):
+            with open(chapter_path) as f:
+                return self.iter_chunks(f.read())
+
+        chapter_results = self.run_pipeline(chapter_paths, read_chunks, chapter_indexes, batch_size)
+        print(self.pipeline.report())
+        return chapter_results
+
+    def run_pipeline(self, jobs, split, chapter_indexes, batch_size=None, initial_position=0):
+        """
+        :param jobs: list of the inputs of split, one per chapter
+        :param split: function job -> iterable of Chunk
+        :param chapter_indexes: list of the index of each chapter in the novel
+        :param batch_size: int, number of chunks per BERT-NER forward pass. By default (None), one chunk
+        :param initial_position: int, the index of first word of each chapter
+        :return: list of tuple (list [dict(character_name, position, chapter)], number of tokens), one per job
+        """
+        def merge(rank, chunks, outputs):
+            token_list = []
+            for chunk, chunk_token_list in zip(chunks, outputs):
+                token_list += self.chunk_tokens(chunk, chunk_token_list)
+            return self.merge_person_tokens(token_list, initial_position, chapter_indexes[rank])
+
+        self.pipeline.batch_size = batch_size or 1
+        return self.pipeline.run(jobs, split, merge)
+
+    @staticmethod
+    def merge_chapters(chapter_results):
+        """
+        Concatenate the outputs of each chapter, shifting the positions by the number of tokens of the
+        previous chapters
+        :param chapter_results: list of tuple (list [dict(character_name, position, chapter)], nb of tokens)
+            as returned by from_chapter_files, sorted by chapter
+        :return: list [dict(character_name, position, chapter)]
+        """
         novel_NER_list = []
         initial_position = 0
-        for idx, chapter in tqdm(list(enumerate(chapter_list)), desc='Advance progression'):
-            with open(folder_path + chapter) as f:
-                text = f.read()
-                chapter_NER_list, nb_of_tokens = self.from_text(text,
-                                                                initial_position,
-                                                                chapter=idx)
-                initial_position += nb_of_tokens
-                novel_NER_list += chapter_NER_list
-
+        for chapter_NER_list, nb_of_tokens in chapter_results:
+            novel_NER_list += [dict(occurence, position=occurence['position'] + initial_position)
+                               for occurence in chapter_NER_list]
+            initial_position += nb_of_tokens
         return novel_NER_list
 
+    @staticmethod
+    def from_chapter_folder_parallel(path_to_bert_ner, folder_path, workers, batch_size=None, overlap=0):
+        """
+        Same as from_chapter_folder, but the chapters are processed by a pool of workers processes
+        (see from_chapter_files_parallel)
+        :param path_to_bert_ner: path to the bert ner model
+        :param folder_path: path to folder which contain a set of raw text chapter
+        :param workers: int, number of processes
+        :param batch_size: int, number of chunks per BERT-NER forward pass inside each process
+        :param overlap: number of sentences of context at the start of each chunk (see TokenBudgetChunker)
+        :return: list [dict(character_name, position, chapter)]
+        """
+        chapter_list = EntitiesExtractor.list_chapter_files(folder_path)
+        print("Number of chapter to process: ", len(chapter_list), "with", workers, "workers")
+
+        chapter_paths = [folder_path + chapter for chapter in chapter_list]
+        return EntitiesExtractor.merge_chapters(
+            EntitiesExtractor.from_chapter_files_parallel(path_to_bert_ner, chapter_paths, range(len(chapter_list)),
+                                                          workers, batch_size, overlap))
+
+    @staticmethod
+    def from_chapter_files_parallel(path_to_bert_ner, chapter_paths, chapter_indexes, workers, batch_size=None,
+                                    overlap=0, token_cache=None, precision='fp32', server_url=None,
+                                    pipeline_workers=0, model_digest=None):
+        """
+        Same as from_chapter_files, but the chapters are processed by a pool of workers processes.
+        Each process loads the BERT-NER model once (or shares the model of a NER server), then processes the chapters
+        one by one.
+        The results are given back in chapter order.
+        :param path_to_bert_ner: path to the bert ner model
+        :param chapter_paths: list of path to raw text chapters
+        :param chapter_indexes: list of the index of each chapter in the novel
+        :param workers: int, number of processes
+        :param batch_size: int, number of chunks per BERT-NER forward pass inside each process
+        :param overlap: number of sentences of context at the start of each chunk (see TokenBudgetChunker)
+        :param token_cache: StageCache where the tokenized chunks are saved (see EntitiesExtractor)
+        :param precision: 'fp32' or 'int8' precision of BERT-NER (see EntitiesExtractor)
+        :param server_url: url of a NER server shared by the processes (see EntitiesExtractor)
+        :param pipeline_workers: number of threads preparing the batches of the pipeline inside each process
+            (see EntitiesExtractor)
+        :param model_digest: digest of path_to_bert_ner, checked against the NER server (see EntitiesExtractor)
+        :return: same as from_chapter_files
+        """
+        work_items = [(idx, chapter_path, batch_size) for idx, chapter_path in zip(chapter_indexes, chapter_paths)]
+        if precision == 'int8' and server_url is None:
+            # quantized once here, the workers only load the saved weights
+            Ner.save_quantized_model(path_to_bert_ner)
+        # spawn rather than fork so that each process starts with a clean torch runtime
+        context = multiprocessing.get_context('spawn')
+        with context.Pool(processes=workers,
+                          initializer=_init_worker,
+                          initargs=(path_to_bert_ner, max(1, torch.get_num_threads() // workers), overlap,
+                                    token_cache, precision, server_url, pipeline_workers, model_digest)) as pool:
+            return list(tqdm(pool.imap(_process_chapter, work_items),
+                             total=len(work_items), desc='Advance progression'))
+
+
+# EntitiesExtractor of the current worker process (see EntitiesExtractor.from_chapter_files_parallel)
+_worker_extractor = None
+
+
+def _init_worker(path_to_bert_ner, nb_threads, overlap=0, token_cache=None, precision='fp32', server_url=None,
+                 pipeline_workers=0, model_digest=None):
+    """
+    Load the BERT-NER model once per worker process
+    :param path_to_bert_ner: path to the bert ner model
+    :param nb_threads: number of torch threads of the worker, so that the workers do not oversubscribe the cpu
+    :param overlap: number of sentences of context at the start of each chunk (see TokenBudgetChunker)
+    :param token_cache: StageCache where the tokenized chunks are saved (see EntitiesExtractor)
+    :param precision: 'fp32' or 'int8' precision of BERT-NER (see EntitiesExtractor)
+    :param server_url: url of a NER server shared by the processes (see EntitiesExtractor)
+    :param pipeline_workers: number of threads preparing the batches of the pipeline (see EntitiesExtractor)
+    :param model_digest: digest of path_to_bert_ner, checked against the NER server (see EntitiesExtractor)
+    """
+    global _worker_extractor
+    torch.set_num_threads(nb_threads)
+    _worker_extractor = EntitiesExtractor(path_to_bert_ner, overlap=overlap, token_cache=token_cache,
+                                          precision=precision, server_url=server_url,
+                                          pipeline_workers=pipeline_workers, model_digest=model_digest)
+
+
+def _process_chapter(work_item):
+    """
+    :param work_item: tuple (chapter index, path to the chapter, batch_size)
+    :return: list [dict(character_name, position, chapter)] with positions relative to the chapter start,
+        number of tokens of the chapter
+    """
+    idx, chapter_path, batch_size = work_item
+    with open(chapter_path) as f:
+        return _worker_extractor.from_text(f.read(), initial_position=0, chapter=idx, batch_size=batch_size)
@@ -0,0 +1,277 @@
+import queue
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+"""
+In this file is defined the pipelined application of BERT-NER on a list of texts.
+
+Applied chunk after chunk, the chunking and WordPiece tokenization (python), the forward pass (torch) and the decoding
+of the tags run one after the other : torch waits while the text is tokenized, and the other way round. The pipeline
+runs them as three stages linked by bounded queues :
+    - prepare : a pool of threads splits the texts in chunks (see TokenBudgetChunker) and turns each group of
+      batch_size chunks into tensors (Ner.prepare_batch), ahead of the model
+    - model : one thread runs the forward passes (Ner.run_batch), torch releasing the GIL meanwhile
+    - merge : the calling thread decodes the tags (Ner.decode_batch) and, once all the chunks of a text are tagged,
+      merges them (e.g. B-PER / I-PER merging, see EntitiesExtractor.run_pipeline and
+      EntitiesExtractor.from_chapter_files_pipelined)
+When a queue is full, the stage which feeds it waits (backpressure) : at most queue_size batches are prepared ahead.
+On an error in any stage, or an interruption of the calling thread (Ctrl-C), every stage stops waiting on the queues
+and the threads end.
+The time each stage spends working, waiting for its input and blocked on its full output queue, and the depth of the
+queues, are kept in NerPipeline.stats to see which stage is the bottleneck.
+"""
+
+# end of the stream of batches
+_END = object()
+
+# interval (in seconds) at which a thread waiting on a queue checks whether the pipeline stops
+_POLL_INTERVAL = 0.1
+
+
+class PipelineStopped(Exception):
+    """ raised in a stage waiting on a queue when the pipeline stops """
+
+
+class MonitoredQueue(queue.Queue):
+    """
+    Bounded queue which samples its depth after each put
+    """
+    def __init__(self, maxsize):
+        super().__init__(maxsize)
+        self.nb_puts = 0
+        self.depth_sum = 0
+        self.max_depth = 0
+
+    def timed_put(self, item, stop):
+        """
+        :param item: item to queue, waits while the queue is full
+        :param stop: threading.Event, PipelineStopped is raised once it is set
+        :return: time waited (in seconds)
+        """
+        start = time.monotonic()
+        while True:
+            if stop.is_set():
+                raise PipelineStopped()
+            try:
+                self.put(item, timeout=_POLL_INTERVAL)
+                break
+            except queue.Full:
+                pass
+        waited = time.monotonic() - start
+        with self.mutex:
+            depth = self._qsize()
+            self.nb_puts += 1
+            self.depth_sum += depth
+            self.max_depth = max(self.max_depth, depth)
+        return waited
+
+    def timed_get(self, stop):
+        """
+        :param stop: threading.Event, PipelineStopped is raised once it is set
+        :return: next item, waits while the queue is empty, time waited (in seconds)
+        """
+        start = time.monotonic()
+        while True:
+            if stop.is_set():
+                raise PipelineStopped()
+            try:
+                item = self.get(timeout=_POLL_INTERVAL)
+                return item, time.monotonic() - start
+            except queue.Empty:
+                pass
+
+    def summary(self):
+        """
+        :return: dict capacity, mean and max depth of the queue
+        """
+        with self.mutex:
+            return {'capacity': self.maxsize, 'mean_depth': self.depth_sum / self.nb_puts if self.nb_puts else 0.0,
+                    'max_depth': self.max_depth}
+
+
+class StageStats:
+    """
+    Time spent by the threads of a stage working, waiting for their input and blocked on their full output queue
+    """
+    def __init__(self, nb_threads=1):
+        self.nb_threads = nb_threads
+        self.lock = threading.Lock()
+        self.nb_batches = 0
+        self.busy = 0.0
+        self.waiting = 0.0
+        self.blocked = 0.0
+
+    def add(self, busy=0.0, waiting=0.0, blocked=0.0, nb_batches=0):
+        with self.lock:
+            self.busy += busy
+            self.waiting += waiting
+            self.blocked += blocked
+            self.nb_batches += nb_batches
+
+    def summary(self, wall):
+        """
+        :param wall: duration of the run (in seconds)
+        :return: dict of the times of the stage, utilization : fraction of the time of its threads spent working
+        """
+        return {'threads': self.nb_threads, 'batches': self.nb_batches, 'busy_s': self.busy,
+                'waiting_s': self.waiting, 'blocked_s': self.blocked,
+                'utilization': self.busy / (wall * self.nb_threads) if wall > 0 else 0.0}
+
+
+class NerPipeline:
+    """
+    Apply BERT-NER on texts with the chunking, the forward passes and the decoding running concurrently
+    """
+    def __init__(self, bert_ner, batch_size=1, nb_workers=2, queue_size=4):
+        """
+        :param bert_ner: Ner or NerClient (prepare_batch, run_batch and decode_batch)
+        :param batch_size: [int] number of chunks per batch, the chunks of a batch come from the same text
+        :param nb_workers: [int] number of threads of the prepare stage
+        :param queue_size: [int] maximum number of batches waiting between two stages
+        """
+        self.bert_ner = bert_ner
+        self.batch_size = batch_size
+        self.nb_workers = nb_workers
+        self.queue_size = queue_size
+        self.stats = None
+
+    def run(self, jobs, split, finish):
+        """
+        :param jobs: list of the inputs of split (texts, paths of chapters...)
+        :param split: function job -> iterable of Chunk, called by the threads of the prepare stage
+        :param finish: function (rank of the job, list of its Chunk, list of the outputs of BERT-NER on them) -> result,
+            called by the merge stage
+        :return: list of the results of the jobs, in order
+        """
+        batch_queue = MonitoredQueue(self.queue_size)
+        output_queue = MonitoredQueue(self.queue_size)
+        stages = {'prepare': StageStats(self.nb_workers), 'model': StageStats(), 'merge': StageStats()}
+        # set on the first error of a stage or at the end of the run : the stages stop waiting on the queues
+        stop = threading.Event()
+        errors = []
+        remaining_jobs = [len(jobs)]
+        lock = threading.Lock()
+        start = time.monotonic()
+
+        def fail(error):
+            errors.append(error)
+            stop.set()
+
+        def put_batch(rank, chunks, last):
+            # items of batch_queue : (rank of the job, chunks, tensors, last batch of the job)
+            busy_start = time.monotonic()
+            features = self.bert_ner.prepare_batch([chunk.encoding for chunk in chunks]) if chunks else None
+            busy = time.monotonic() - busy_start
+            stages['prepare'].add(busy=busy, blocked=batch_queue.timed_put((rank, chunks, features, last), stop),
+                                  nb_batches=1)
+
+        def prepare(rank, job):
+            try:
+                chunks = []
+                busy_start = time.monotonic()
+                for chunk in split(job):
+                    if stop.is_set():
+                        return
+                    chunks.append(chunk)
+                    if len(chunks) == self.batch_size:
+                        stages['prepare'].add(busy=time.monotonic() - busy_start)
+                        put_batch(rank, chunks, False)
+                        chunks = []
+                        busy_start = time.monotonic()
+                stages['prepare'].add(busy=time.monotonic() - busy_start)
+                put_batch(rank, chunks, True)
+            except PipelineStopped:
+                pass
+            except Exception as e:
+                fail(e)
+            finally:
+                with lock:
+                    remaining_jobs[0] -= 1
+                    last_job = remaining_jobs[0] == 0
+                if last_job:
+                    try:
+                        batch_queue.timed_put(_END, stop)
+                    except PipelineStopped:
+                        pass
+
+        def model():
+            try:
+                while True:
+                    item, waited = batch_queue.timed_get(stop)
+                    if item is _END:
+                        output_queue.timed_put(_END, stop)
+                        return
+                    # items of output_queue : (rank of the job, chunks, tensors, outputs, last batch of the job)
+                    rank, chunks, features, last = item
+                    outputs = None
+                    busy_start = time.monotonic()
+                    if chunks:
+                        outputs = self.bert_ner.run_batch(features)
+                    busy = time.monotonic() - busy_start
+                    blocked = output_queue.timed_put((rank, chunks, features, outputs, last), stop)
+                    stages['model'].add(busy=busy, waiting=waited, blocked=blocked, nb_batches=1)
+            except PipelineStopped:
+                pass
+            except Exception as e:
+                fail(e)
+
+        model_thread = threading.Thread(target=model, name="ner-model", daemon=True)
+        model_thread.start()
+        pool = ThreadPoolExecutor(max_workers=self.nb_workers, thread_name_prefix="ner-prepare")
+        results = [None] * len(jobs)
+        job_chunks = [[] for _ in jobs]
+        job_outputs = [[] for _ in jobs]
+        try:
+            if len(jobs) == 0:
+                batch_queue.timed_put(_END, stop)
+            for rank, job in enumerate(jobs):
+                pool.submit(prepare, rank, job)
+
+            while True:
+                item, waited = output_queue.timed_get(stop)
+                if item is _END:
+                    break
+                rank, chunks, features, outputs, last = item
+                busy_start = time.monotonic()
+                if chunks:
+                    job_outputs[rank] += self.bert_ner.decode_batch([chunk.encoding for chunk in chunks], features,
+                                                                    outputs)
+                    job_chunks[rank] += chunks
+                if last:
+                    results[rank] = finish(rank, job_chunks[rank], job_outputs[rank])
+                    job_chunks[rank], job_outputs[rank] = None, None
+                stages['merge'].add(busy=time.monotonic() - busy_start, waiting=waited, nb_batches=1)
+        except PipelineStopped:
+            # a stage failed : its error is raised below
+            pass
+        finally:
+            # on an error or an interruption of the merge stage, the other stages must not stay blocked on the queues
+            stop.set()
+            pool.shutdown(wait=True, cancel_futures=True)
+            model_thread.join()
+            wall = time.monotonic() - start
+            self.stats = {'wall_s': wall,
+                          'stages': {name: stage.summary(wall) for name, stage in stages.items()},
+                          'queues': {'batches': batch_queue.summary(), 'outputs': output_queue.summary()}}
+        if errors:
+            raise errors[0]
+        return results
+
+    def report(self):
+        """
+        :return: str, table of the statistics of the last run
+        """
+        if self.stats is None:
+            return "No run"
+        lines = ["NER pipeline : {:.2f}s".format(self.stats['wall_s']),
+                 "{:<8} {:>7} {:>8} {:>9} {:>10} {:>10} {:>11}".format('stage', 'threads', 'batches', 'busy (s)',
+                                                                      'input (s)', 'output (s)', 'utilization')]
+        for name, stage in self.stats['stages'].items():
+            lines.append("{:<8} {:>7} {:>8} {:>9.2f} {:>10.2f} {:>10.2f} {:>10.0%}".format(
+                name, stage['threads'], stage['batches'], stage['busy_s'], stage['waiting_s'], stage['blocked_s'],
+                stage['utilization']))
+        for name, queue_stats in self.stats['queues'].items():
+            lines.append("queue {:<8} depth mean {:.2f}, max {} / {}".format(
+                name, queue_stats['mean_depth'], queue_stats['max_depth'], queue_stats['capacity']))
+        return "\n".join(lines)
@@ -0,0 +1,134 @@
+import warnings
+from collections import namedtuple
+from nltk import sent_tokenize
+
+"""
+In this file is defined the chunker which splits the text of a chapter in the inputs of BERT-NER.
+
+Each chunk is made of whole sentences and fits in the sub-token budget of the model (max_seq_length minus [CLS] and
+[SEP]) : no chunk is truncated or longer than what the model was trained on, and no chunk is empty.
+A sentence longer than the budget is split between its words, by slicing its encoding : the words of the pieces are
+the words of the sentence. The sub-tokens of a single word longer than the budget are cut to the budget.
+Each sentence is tokenized once : the encoding of a chunk is the concatenation of the encodings of its sentences, so the
+text of a chunk is never tokenized again.
+With overlap > 0, the last sentences of a chunk are repeated at the start of the next one, so that the words at the
+border of a chunk are tagged with some context. The words of this context are tagged twice : only the first tags are
+kept (see Chunk.nb_context_words), so that the positions of the occurences do not depend on the overlap.
+"""
+
+# Version of the chunking, part of the key of the NER cache (see text_preprocessing)
+CHUNKER_VERSION = 3
+
+# text : text of the chunk, nb_context_words : number of words at the start of the text already tagged in the previous
+# chunk, nb_words : number of words of the text, encoding : input of BERT-NER (see bert.Encoding)
+Chunk = namedtuple('Chunk', ['text', 'nb_context_words', 'nb_words', 'encoding'])
+
+
+class TokenBudgetChunker:
+    """
+    Pack whole sentences in chunks of at most budget sub-tokens
+    """
+    def __init__(self, tokenize, budget, overlap=0):
+        """
+        :param tokenize: function text -> encoding of the text for the model, with the words of the text, the ids of
+            their sub-tokens and a concatenate classmethod (see bert.Ner.tokenize)
+        :param budget: [int] maximum number of sub-tokens of a chunk
+        :param overlap: [int] number of sentences of the previous chunk repeated at the start of each chunk
+        """
+        self.tokenize = tokenize
+        self.budget = budget
+        self.overlap = overlap
+
+    def sentences(self, text):
+        """
+        :param text: str
+        :return: generator of (sentence, encoding), the sentences longer than the budget being split between their
+            words
+        """
+        for sentence in sent_tokenize(text):
+            encoding = self.tokenize(sentence)
+            if len(encoding.words) == 0:
+                continue
+            if len(encoding.subword_ids) <= self.budget:
+                yield sentence, encoding
+                continue
+            yield from self.split(encoding)
+
+    def split(self, encoding):
+        """
+        :param encoding: encoding of a sentence longer than the budget
+        :return: generator of (text, encoding) of the pieces of the sentence, cut between its words, of at most budget
+            sub-tokens. The sub-tokens of a word longer than the budget are cut to the budget (its first sub-token,
+            which is tagged, is kept)
+        """
+        # index of the first sub-token of each word, and the end of the last one
+        starts = [idx for idx, valid in enumerate(encoding.valid_positions) if valid == 1]
+        starts.append(len(encoding.subword_ids))
+        first_word = 0
+        for word_idx in range(len(encoding.words)):
+            word_end = starts[word_idx + 1]
+            if word_end - starts[first_word] <= self.budget:
+                continue
+            if word_idx > first_word:
+                yield self.piece(encoding, starts, first_word, word_idx)
+                first_word = word_idx
+            if word_end - starts[word_idx] > self.budget:
+                warnings.warn("The word {!r} has {} sub-tokens, cut to the budget of {}".format(
+                    encoding.words[word_idx], word_end - starts[word_idx], self.budget))
+                start = starts[word_idx]
+                yield encoding.words[word_idx], type(encoding)(
+                    encoding.words[word_idx:word_idx + 1], encoding.subword_ids[start:start + self.budget],
+                    encoding.valid_positions[start:start + self.budget])
+                first_word = word_idx + 1
+        if first_word < len(encoding.words):
+            yield self.piece(encoding, starts, first_word, len(encoding.words))
+
+    @staticmethod
+    def piece(encoding, starts, first_word, end_word):
+        """
+        :param encoding: encoding of a sentence
+        :param starts: index of the first sub-token of each word of the sentence, and the number of its sub-tokens
+        :param first_word: index of the first word of the piece
+        :param end_word: index of the word after the piece
+        :return: (text, encoding) of the words [first_word, end_word[ of the sentence
+        """
+        start, end = starts[first_word], starts[end_word]
+        return " ".join(encoding.words[first_word:end_word]), type(encoding)(
+            encoding.words[first_word:end_word], encoding.subword_ids[start:end], encoding.valid_positions[start:end])
+
+    def chunks(self, text):
+        """
+        :param text: str
+        :return: generator of Chunk, never empty. The words of the chunks, without their context words, are the words
+            of the text in order
+        """
+        sentences = []
+        nb_subtokens = 0
+        nb_context = 0
+        for sentence in self.sentences(text):
+            sentence_subtokens = len(sentence[1].subword_ids)
+            if sentences and nb_subtokens + sentence_subtokens > self.budget:
+                yield self.make_chunk(sentences, nb_context)
+                # context : the last sentences of the chunk which fit with the new sentence
+                nb_context = min(self.overlap, len(sentences) - nb_context)
+                sentences = sentences[len(sentences) - nb_context:]
+                nb_subtokens = sum(len(encoding.subword_ids) for _, encoding in sentences)
+                while sentences and nb_subtokens + sentence_subtokens > self.budget:
+                    nb_subtokens -= len(sentences.pop(0)[1].subword_ids)
+                    nb_context -= 1
+            sentences.append(sentence)
+            nb_subtokens += sentence_subtokens
+        if len(sentences) > nb_context:
+            yield self.make_chunk(sentences, nb_context)
+
+    @staticmethod
+    def make_chunk(sentences, nb_context):
+        """
+        :param sentences: list of (sentence, encoding)
+        :param nb_context: number of sentences at the start which are context
+        :return: Chunk
+        """
+        encoding = sentences[0][1].concatenate([sentence_encoding for _, sentence_encoding in sentences])
+        return Chunk(" ".join(sentence for sentence, _ in sentences),
+                     sum(len(sentence_encoding.words) for _, sentence_encoding in sentences[:nb_context]),
+                     len(encoding.words), encoding)
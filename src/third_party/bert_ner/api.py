@@ -1,22 +1,105 @@
+import argparse
+
 from flask import Flask,request,jsonify
 from flask_cors import CORS
 
-from bert import Ner
+from bert import Ner, Encoding, PRECISIONS
+from micro_batching import MicroBatcher, Overloaded
+
+# The requests are not run one by one : each request thread queues its inputs in a MicroBatcher, whose thread runs the
+# forward passes on the inputs of all the clients (see micro_batching.py)
 
 app = Flask(__name__)
 CORS(app)
 
-model = Ner("out_!x")
+model = None
+model_info = None
+batcher = None
+
+def invalid_encodings(encodings):
+    """
+    check the inputs before they are queued, so that a bad input never shares a batch with the inputs of other clients
+    return None, or the response to the first invalid input : 413 if it is too long, 400 if it is malformed
+    """
+    for idx,encoding in enumerate(encodings):
+        try:
+            if len(encoding.subword_ids) + 2 > model.max_seq_length:
+                error, code = "{} sub-tokens, at most {}".format(len(encoding.subword_ids), model.max_seq_length - 2), 413
+            else:
+                error, code = model.encoding_error(encoding), 400
+        except TypeError:
+            error, code = "an encoding is [words, subword_ids, valid_positions]", 400
+        if error is not None:
+            return jsonify({"result":"Invalid Input " + str(idx) + " : " + error}), code
+    return None
 
 @app.route("/predict",methods=['POST'])
 def predict():
     text = request.json["text"]
+    encoding = model.tokenize(text)
+    invalid = invalid_encodings([encoding])
+    if invalid is not None:
+        return invalid
     try:
-        out = model.predict(text)
+        out = batcher.submit(encoding).result()
         return jsonify({"result":out})
+    except Overloaded:
+        return jsonify({"result":"Server Overloaded"}), 503
     except Exception as e:
         print(e)
         return jsonify({"result":"Model Failed"})
 
+@app.route("/predict_encodings",methods=['POST'])
+def predict_encodings():
+    """ predict on tokenized inputs (see bert.NerClient) : {"encodings": [[words, subword_ids, valid_positions]]} """
+    try:
+        encodings = [Encoding(*encoding) for encoding in request.json["encodings"]]
+    except TypeError:
+        return jsonify({"result":"Invalid Input : an encoding is [words, subword_ids, valid_positions]"}), 400
+    invalid = invalid_encodings(encodings)
+    if invalid is not None:
+        return invalid
+    if len(encodings) > batcher.max_queue:
+        # could never be queued, even on an idle server
+        return jsonify({"result":"Request Too Large, at most " + str(batcher.max_queue) + " encodings"}), 413
+    try:
+        futures = batcher.submit_many(encodings)
+        return jsonify({"result":[future.result() for future in futures]})
+    except Overloaded:
+        return jsonify({"result":"Server Overloaded"}), 503
+    except Exception as e:
+        print(e)
+        return jsonify({"result":"Model Failed"}), 500
+
+@app.route("/info",methods=['GET'])
+def info():
+    """ model served, checked by the clients before they send their encodings """
+    return jsonify(model_info)
+
+@app.route("/stats",methods=['GET'])
+def stats():
+    """ queue, batch size, latency and throughput statistics (see MicroBatcher.stats) """
+    return jsonify(batcher.stats())
+
 if __name__ == "__main__":
-    app.run('0.0.0.0',port=8000)
\ No newline at end of file
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--model", type=str, default="out_!x", help="folder of the model")
+    parser.add_argument("--precision", type=str, default="fp32", choices=PRECISIONS)
+    parser.add_argument("--host", type=str, default="0.0.0.0")
+    parser.add_argument("--port", type=int, default=8000)
+    parser.add_argument("--max_batch_size", type=int, default=32, help="maximum number of inputs per forward pass")
+    parser.add_argument("--max_wait_ms", type=float, default=10,
+                        help="maximum time an input waits for other inputs before its forward pass")
+    parser.add_argument("--max_queue", type=int, default=1024,
+                        help="maximum number of queued inputs, the requests above are rejected with 503")
+    args = parser.parse_args()
+
+    model = Ner(args.model, precision=args.precision)
+    model_info = {"model": model.model_digest(args.model), "vocab": model.vocab_digest(args.model),
+                  "do_lower": model.model_config["do_lower"], "max_seq_length": model.max_seq_length,
+                  "precision": args.precision, "max_queue": args.max_queue}
+    batcher = MicroBatcher(lambda encodings: model.predict_encodings(encodings, batch_size=len(encodings),
+                                                                     progress=False),
+                           max_batch_size=args.max_batch_size, max_wait=args.max_wait_ms / 1000,
+                           max_queue=args.max_queue)
+    app.run(args.host,port=args.port,threaded=True)
@@ -2,103 +2,267 @@
 
 from __future__ import absolute_import, division, print_function
 
+import hashlib
 import json
 import os
+import tempfile
+import time
+import urllib.error
+import urllib.request
+from collections import namedtuple
+from functools import lru_cache
 
 import torch
 import torch.nn.functional as F
 from nltk import word_tokenize
 from pytorch_transformers import (BertConfig, BertForTokenClassification,
                                   BertTokenizer)
+from tqdm import tqdm
 
 
 class BertNer(BertForTokenClassification):
 
+    @staticmethod
+    def gather_valid(sequence_output, valid_ids):
+        """
+        move the output of the first sub-token of each word (valid_ids == 1) to the front of its row,
+        the remaining positions being filled with zeros.
+        the destination of each valid sub-token is given by the cumulative sum of valid_ids along the row
+        """
+        batch_size,max_len,feat_dim = sequence_output.shape
+        valid_mask = valid_ids == 1
+        target_positions = torch.cumsum(valid_mask.long(), dim=1) - 1
+        rows = torch.arange(batch_size, device=sequence_output.device).unsqueeze(1).expand(batch_size,max_len)
+        valid_output = torch.zeros(batch_size,max_len,feat_dim,dtype=torch.float32,device=sequence_output.device)
+        valid_output[rows[valid_mask],target_positions[valid_mask]] = sequence_output[valid_mask]
+        return valid_output
+
     def forward(self, input_ids, token_type_ids=None, attention_mask=None, valid_ids=None):
         sequence_output = self.bert(input_ids, token_type_ids, attention_mask, head_mask=None)[0]
-        batch_size,max_len,feat_dim = sequence_output.shape
-        valid_output = torch.zeros(batch_size,max_len,feat_dim,dtype=torch.float32,device='cuda' if torch.cuda.is_available() else 'cpu')
-        for i in range(batch_size):
-            jj = -1
-            for j in range(max_len):
-                    if valid_ids[i][j].item() == 1:
-                        jj += 1
-                        valid_output[i][jj] = sequence_output[i][j]
+        valid_output = self.gather_valid(sequence_output, valid_ids)
         sequence_output = self.dropout(valid_output)
         logits = self.classifier(sequence_output)
         return logits
 
+class Encoding(namedtuple('Encoding', ['words', 'subword_ids', 'valid_positions'])):
+    """
+    words of a text (nltk word_tokenize), WordPiece ids of its words and valid_positions (1 on the first sub-token of
+    each word), without [CLS] and [SEP]
+    """
+
+    @classmethod
+    def concatenate(cls, encodings):
+        """ encoding of the concatenation of texts """
+        return cls([word for encoding in encodings for word in encoding.words],
+                   [idx for encoding in encodings for idx in encoding.subword_ids],
+                   [valid for encoding in encodings for valid in encoding.valid_positions])
+
+
+class CachedWordPiece:
+    """
+    tokenize a text with one word_tokenize, each word being WordPiece-tokenized once per process :
+    the subword ids of the words are kept in a bounded LRU cache (character names, "said", "the"... are frequent)
+    """
+
+    def __init__(self, tokenizer, cache_size: int = 65536):
+        self.tokenizer = tokenizer
+        self.word_ids = lru_cache(maxsize=cache_size)(self.wordpiece_ids)
+
+    def wordpiece_ids(self, word: str):
+        return tuple(self.tokenizer.convert_tokens_to_ids(self.tokenizer.tokenize(word)))
+
+    def encode(self, text: str):
+        """ return the Encoding of text """
+        words = word_tokenize(text)
+        subword_ids = []
+        valid_positions = []
+        for word in words:
+            word_ids = self.word_ids(word)
+            subword_ids.extend(word_ids)
+            valid_positions.extend([1] + [0] * (len(word_ids) - 1) if word_ids else [])
+        return Encoding(words, subword_ids, valid_positions)
+
+
+# precisions of the weights of the model : fp32 (original weights) or int8 (dynamic quantization of the linear layers,
+# cpu only)
+PRECISIONS = ["fp32", "int8"]
+
+
 class Ner:
 
-    def __init__(self,model_dir: str):
-        self.model , self.tokenizer, self.model_config = self.load_model(model_dir)
+    def __init__(self,model_dir: str, precision: str = "fp32"):
+        self.model , self.tokenizer, self.model_config = self.load_model(model_dir, precision=precision)
+        self.precision = precision
         self.label_map = self.model_config["label_map"]
         self.max_seq_length = self.model_config["max_seq_length"]
         self.label_map = {int(k):v for k,v in self.label_map.items()}
-        self.device = "cuda" if torch.cuda.is_available() else "cpu"
+        self.wordpiece = CachedWordPiece(self.tokenizer)
+        self.cls_id,self.sep_id = self.tokenizer.convert_tokens_to_ids(["[CLS]","[SEP]"])
+        # quantized linear layers only run on cpu
+        self.device = "cuda" if torch.cuda.is_available() and precision == "fp32" else "cpu"
         self.model = self.model.to(self.device)
         self.model.eval()
 
-    def load_model(self, model_dir: str, model_config: str = "model_config.json"):
+    def load_model(self, model_dir: str, model_config: str = "model_config.json", precision: str = "fp32"):
+        if precision not in PRECISIONS:
+            raise ValueError("Unknown precision " + precision + ", expected one of " + str(PRECISIONS))
         model_config = os.path.join(model_dir,model_config)
         model_config = json.load(open(model_config))
-        model = BertNer.from_pretrained(model_dir)
+        model = self.load_quantized_model(model_dir) if precision == "int8" else BertNer.from_pretrained(model_dir)
         tokenizer = BertTokenizer.from_pretrained(model_dir, do_lower_case=model_config["do_lower"])
         return model, tokenizer, model_config
 
+    @staticmethod
+    def quantize(model):
+        """ dynamic int8 quantization of the linear layers : weights stored in int8, activations quantized on the fly """
+        return torch.quantization.quantize_dynamic(model, {torch.nn.Linear}, dtype=torch.qint8)
+
+    @staticmethod
+    def quantized_model_dir(model_dir: str):
+        """ folder of the quantized weights, next to the model folder (models/bert_ner_base-int8/) """
+        return os.path.normpath(model_dir) + "-int8"
+
+    @classmethod
+    def quantized_weights(cls, model_dir: str):
+        """
+        path of the quantized weights of the model, True if they were saved from the current pytorch_model.bin
+        (same size and modification time)
+        """
+        weights = os.stat(os.path.join(model_dir, "pytorch_model.bin"))
+        source = {"size": weights.st_size, "mtime_ns": weights.st_mtime_ns}
+        quantized_dir = cls.quantized_model_dir(model_dir)
+        source_path = os.path.join(quantized_dir, "source.json")
+        quantized_weights = os.path.join(quantized_dir, "pytorch_model.bin")
+        up_to_date = os.path.exists(quantized_weights) and os.path.exists(source_path) and \
+            json.load(open(source_path)) == source
+        return quantized_weights, up_to_date
+
+    @classmethod
+    def save_quantized_model(cls, model_dir: str, model=None):
+        """
+        save the quantized weights of the model if they are not up to date (see quantized_weights).
+        call it once before starting several processes with precision int8, so that they all load the saved weights.
+        the files are written to unique temporary files then renamed : concurrent saves never leave a partial file,
+        and source.json is only written once the weights are in place
+        """
+        quantized_weights, up_to_date = cls.quantized_weights(model_dir)
+        if up_to_date:
+            return
+        if model is None:
+            model = cls.quantize(BertNer.from_pretrained(model_dir))
+        weights = os.stat(os.path.join(model_dir, "pytorch_model.bin"))
+        quantized_dir = cls.quantized_model_dir(model_dir)
+        os.makedirs(quantized_dir, exist_ok=True)
+
+        def atomic_write(path, write):
+            fd, tmp_path = tempfile.mkstemp(dir=quantized_dir, suffix=".tmp")
+            try:
+                with os.fdopen(fd, "wb") as f:
+                    write(f)
+                os.replace(tmp_path, path)
+            except BaseException:
+                os.remove(tmp_path)
+                raise
+
+        atomic_write(quantized_weights, lambda f: torch.save(model.state_dict(), f))
+        atomic_write(os.path.join(quantized_dir, "source.json"),
+                     lambda f: f.write(json.dumps({"size": weights.st_size, "mtime_ns": weights.st_mtime_ns}).encode()))
+
+    def load_quantized_model(self, model_dir: str):
+        """ quantize the model, or load its quantized weights if they are up to date (see quantized_weights) """
+        quantized_weights, up_to_date = self.quantized_weights(model_dir)
+        if up_to_date:
+            # the fp32 weights are not read : the quantized layers are created from the config, then loaded
+            model = self.quantize(BertNer(BertConfig.from_pretrained(model_dir)))
+            model.load_state_dict(torch.load(quantized_weights, weights_only=False))
+            return model
+
+        model = self.quantize(BertNer.from_pretrained(model_dir))
+        self.save_quantized_model(model_dir, model)
+        return model
+
+    @staticmethod
+    def model_digest(model_dir: str):
+        """
+        sha256 of the names and contents of the files of the model folder (same value as StageCache.hash_path, the
+        digest of the model in the key of the NER cache)
+        """
+        digest = hashlib.sha256()
+        for root, dirs, files in os.walk(model_dir):
+            dirs.sort()
+            for file_name in sorted(files):
+                file_path = os.path.join(root, file_name)
+                file_digest = hashlib.sha256()
+                with open(file_path, "rb") as f:
+                    for block in iter(lambda: f.read(1 << 20), b""):
+                        file_digest.update(block)
+                digest.update(os.path.relpath(file_path, model_dir).encode())
+                digest.update(file_digest.hexdigest().encode())
+        return digest.hexdigest()
+
+    @staticmethod
+    def vocab_digest(model_dir: str):
+        """ sha256 of the vocabulary of the model : two models with the same digest give the same encodings """
+        with open(os.path.join(model_dir, "vocab.txt"), "rb") as f:
+            return hashlib.sha256(f.read()).hexdigest()
+
     def tokenize(self, text: str):
-        """ tokenize input"""
-        words = word_tokenize(text)
-        tokens = []
-        valid_positions = []
-        for i,word in enumerate(words):
-            token = self.tokenizer.tokenize(word)
-            tokens.extend(token)
-            for i in range(len(token)):
-                if i == 0:
-                    valid_positions.append(1)
-                else:
-                    valid_positions.append(0)
-        return tokens, valid_positions
+        """ tokenize input (see CachedWordPiece) """
+        return self.wordpiece.encode(text)
 
-    def preprocess(self, text: str):
-        """ preprocess """
-        tokens, valid_positions = self.tokenize(text)
-        ## insert "[CLS]"
-        tokens.insert(0,"[CLS]")
-        valid_positions.insert(0,1)
-        ## insert "[SEP]"
-        tokens.append("[SEP]")
-        valid_positions.append(1)
-        segment_ids = []
-        for i in range(len(tokens)):
-            segment_ids.append(0)
-        input_ids = self.tokenizer.convert_tokens_to_ids(tokens)
+    def encoding_error(self, encoding: Encoding):
+        """
+        return None if the model can predict on the tokenized input, else the reason why it cannot :
+        malformed (the first sub-token of each word marked once in valid_positions, ids in the vocabulary) or longer
+        than max_seq_length with [CLS] and [SEP]
+        """
+        if len(encoding.valid_positions) != len(encoding.subword_ids) or \
+                any(valid not in (0, 1) for valid in encoding.valid_positions):
+            return "valid_positions must have one 0 or 1 per sub-token"
+        if sum(encoding.valid_positions) != len(encoding.words) or \
+                (len(encoding.valid_positions) > 0 and encoding.valid_positions[0] != 1):
+            return "valid_positions must mark the first sub-token of each word"
+        if any(not isinstance(idx, int) or not 0 <= idx < len(self.tokenizer.vocab) for idx in encoding.subword_ids):
+            return "subword_ids must be ids of the vocabulary"
+        if len(encoding.subword_ids) + 2 > self.max_seq_length:
+            return "{} sub-tokens, at most {}".format(len(encoding.subword_ids), self.max_seq_length - 2)
+        return None
+
+    def encode(self, encoding: Encoding):
+        """ add special tokens to a tokenized input, without padding """
+        ## insert "[CLS]" and "[SEP]"
+        input_ids = [self.cls_id] + list(encoding.subword_ids) + [self.sep_id]
+        valid_positions = [1] + list(encoding.valid_positions) + [1]
+        segment_ids = [0] * len(input_ids)
         input_mask = [1] * len(input_ids)
-        while len(input_ids) < self.max_seq_length:
+        return input_ids,input_mask,segment_ids,valid_positions
+
+    @staticmethod
+    def pad(features, length: int):
+        """ pad encoded input up to length """
+        input_ids,input_mask,segment_ids,valid_positions = [list(feature) for feature in features]
+        while len(input_ids) < length:
             input_ids.append(0)
             input_mask.append(0)
             segment_ids.append(0)
             valid_positions.append(0)
         return input_ids,input_mask,segment_ids,valid_positions
 
-    def predict(self, text: str):
-        input_ids,input_mask,segment_ids,valid_ids = self.preprocess(text)
-        input_ids = torch.tensor([input_ids],dtype=torch.long,device=self.device)
-        input_mask = torch.tensor([input_mask],dtype=torch.long,device=self.device)
-        segment_ids = torch.tensor([segment_ids],dtype=torch.long,device=self.device)
-        valid_ids = torch.tensor([valid_ids],dtype=torch.long,device=self.device)
-        with torch.no_grad():
-            logits = self.model(input_ids, segment_ids, input_mask,valid_ids)
-        logits = F.softmax(logits,dim=2)
-        logits_label = torch.argmax(logits,dim=2)
-        logits_label = logits_label.detach().cpu().numpy().tolist()[0]
+    def preprocess(self, text: str):
+        """ preprocess """
+        return self.pad(self.encode(self.tokenize(text)), self.max_seq_length)
 
-        logits_confidence = [values[label].item() for values,label in zip(logits[0],logits_label)]
+    def decode(self, words, logits, valid_ids):
+        """ turn the logits of one input into a list of {word, tag, confidence} """
+        logits = F.softmax(logits,dim=1)
+        logits_label = torch.argmax(logits,dim=1)
+        logits_label = logits_label.detach().cpu().numpy().tolist()
+
+        logits_confidence = [values[label].item() for values,label in zip(logits,logits_label)]
 
         logits = []
         pos = 0
-        for index,mask in enumerate(valid_ids[0]):
+        for index,mask in enumerate(valid_ids):
             if index == 0:
                 continue
             if mask == 1:
@@ -108,8 +272,140 @@ class Ner:
         logits.pop()
 
         labels = [(self.label_map[label],confidence) for label,confidence in logits]
-        words = word_tokenize(text)
         assert len(labels) == len(words)
         output = [{"word":word,"tag":label,"confidence":confidence} for word,(label,confidence) in zip(words,labels)]
         return output
 
+    def predict(self, text: str):
+        return self.predict_encoding(self.tokenize(text))
+
+    def predict_encoding(self, encoding: Encoding):
+        """ predict on a tokenized input, padded to max_seq_length """
+        input_ids,input_mask,segment_ids,valid_ids = self.pad(self.encode(encoding), self.max_seq_length)
+        input_ids = torch.tensor([input_ids],dtype=torch.long,device=self.device)
+        input_mask = torch.tensor([input_mask],dtype=torch.long,device=self.device)
+        segment_ids = torch.tensor([segment_ids],dtype=torch.long,device=self.device)
+        valid_ids = torch.tensor([valid_ids],dtype=torch.long,device=self.device)
+        with torch.no_grad():
+            logits = self.model(input_ids, segment_ids, input_mask,valid_ids)
+        return self.decode(encoding.words, logits[0], valid_ids[0])
+
+    def predict_batch(self, texts, batch_size: int = 32):
+        """
+        predict on a list of texts, batch_size texts per forward pass.
+        return the list of outputs of predict, in the order of texts
+        """
+        return self.predict_encodings([self.tokenize(text) for text in texts], batch_size=batch_size)
+
+    def predict_encodings(self, encodings, batch_size: int = 32, progress: bool = True):
+        """
+        predict on a list of tokenized inputs, batch_size inputs per forward pass.
+        inputs are sorted by number of sub-tokens so that each batch is only padded up to its longest member.
+        return the list of outputs of predict, in the order of encodings
+        """
+        order = sorted(range(len(encodings)), key=lambda idx: len(encodings[idx].subword_ids))
+        outputs = [None] * len(encodings)
+        for start in tqdm(range(0, len(order), batch_size), desc="BERT-NER batches", disable=not progress):
+            batch_order = order[start:start + batch_size]
+            batch = [encodings[idx] for idx in batch_order]
+            features = self.prepare_batch(batch)
+            for idx,output in zip(batch_order, self.decode_batch(batch, features, self.run_batch(features))):
+                outputs[idx] = output
+        return outputs
+
+    # the three steps of the prediction on a batch, which can run in different threads (see ner_pipeline.NerPipeline)
+
+    def prepare_batch(self, encodings):
+        """ cpu tensors (input_ids, input_mask, segment_ids, valid_ids) of tokenized inputs, padded up to the longest """
+        features = [self.encode(encoding) for encoding in encodings]
+        length = max(len(feature[0]) for feature in features)
+        features = [self.pad(feature, length) for feature in features]
+        return [torch.tensor([feature[k] for feature in features],dtype=torch.long) for k in range(4)]
+
+    def run_batch(self, features):
+        """ forward pass on the tensors of prepare_batch, return the logits on cpu """
+        input_ids,input_mask,segment_ids,valid_ids = [feature.to(self.device) for feature in features]
+        with torch.no_grad():
+            logits = self.model(input_ids, segment_ids, input_mask,valid_ids)
+        return logits.cpu()
+
+    def decode_batch(self, encodings, features, logits):
+        """ outputs of predict of a batch, from the logits of run_batch """
+        valid_ids = features[3]
+        return [self.decode(encoding.words, logits[row], valid_ids[row]) for row,encoding in enumerate(encodings)]
+
+class NerClient(Ner):
+    """
+    Ner whose predictions are made by a NER server (see api.py) : only the tokenizer of the model is loaded, the
+    inputs are tokenized locally and their encodings are sent to the server, which batches them with the inputs of its
+    other clients. Several processes can then share one loaded model
+    """
+
+    def __init__(self, model_dir: str, server_url: str, precision: str = "fp32", model_digest: str = None,
+                 timeout: float = 600, max_retries: int = 10):
+        self.model_config = json.load(open(os.path.join(model_dir,"model_config.json")))
+        self.tokenizer = BertTokenizer.from_pretrained(model_dir, do_lower_case=self.model_config["do_lower"])
+        self.label_map = {int(k):v for k,v in self.model_config["label_map"].items()}
+        self.max_seq_length = self.model_config["max_seq_length"]
+        self.wordpiece = CachedWordPiece(self.tokenizer)
+        self.cls_id,self.sep_id = self.tokenizer.convert_tokens_to_ids(["[CLS]","[SEP]"])
+        self.server_url = server_url.rstrip("/")
+        self.timeout = timeout
+        self.max_retries = max_retries
+
+        # the encodings are only valid for the model of the server if it has the same vocabulary, and its outputs are
+        # cached under the digest of model_dir (given by the caller when it already computed it, see Ner.model_digest)
+        info = self.request("info")
+        expected = {"model": model_digest or self.model_digest(model_dir), "vocab": self.vocab_digest(model_dir),
+                    "do_lower": self.model_config["do_lower"], "max_seq_length": self.max_seq_length,
+                    "precision": precision}
+        mismatches = [key for key in expected if info.get(key) != expected[key]]
+        if mismatches:
+            raise ValueError("The NER server at " + self.server_url + " does not serve the model " + model_dir +
+                             " in " + precision + ", mismatch of " + str(mismatches))
+        # larger requests could never be queued by the server
+        self.max_request_size = info["max_queue"]
+
+    def request(self, route: str, payload=None):
+        """
+        GET (without payload) or POST (json payload) a route of the server.
+        a request rejected because the queue of the server is full (503) is retried with an exponential backoff
+        """
+        data = None if payload is None else json.dumps(payload).encode()
+        for attempt in range(self.max_retries + 1):
+            request = urllib.request.Request(self.server_url + "/" + route, data=data,
+                                             headers={"Content-Type": "application/json"})
+            try:
+                with urllib.request.urlopen(request, timeout=self.timeout) as response:
+                    return json.load(response)
+            except urllib.error.HTTPError as e:
+                if e.code != 503 or attempt == self.max_retries:
+                    raise
+            time.sleep(min(5.0, 0.1 * 2 ** attempt))
+
+    def predict_encoding(self, encoding: Encoding):
+        return self.predict_encodings([encoding], progress=False)[0]
+
+    def predict_encodings(self, encodings, batch_size: int = 32, progress: bool = True):
+        """
+        predict on a list of tokenized inputs, batch_size inputs per request.
+        the server chooses the forward passes : the inputs of a request can be batched with the ones of other clients
+        return the list of outputs of predict, in the order of encodings
+        """
+        outputs = []
+        batch_size = min(batch_size, self.max_request_size)
+        for start in tqdm(range(0, len(encodings), batch_size), desc="BERT-NER requests", disable=not progress):
+            outputs += self.run_batch(self.prepare_batch(encodings[start:start + batch_size]))
+        return outputs
+
+    def prepare_batch(self, encodings):
+        """ payload of the request of a batch """
+        return {"encodings": [list(encoding) for encoding in encodings]}
+
+    def run_batch(self, features):
+        """ outputs of the server on a batch """
+        return self.request("predict_encodings", features)["result"]
+
+    def decode_batch(self, encodings, features, outputs):
+        """ the server already decoded its outputs """
+        return outputs
@@ -0,0 +1,197 @@
+"""Micro-batching of the requests of the NER server."""
+
+import math
+import threading
+import time
+from collections import deque
+from concurrent.futures import Future
+
+
+class Overloaded(Exception):
+    """ raised when the queue of a MicroBatcher is full : the caller should retry later """
+
+
+class MicroBatcher:
+    """
+    Group the inputs submitted by concurrent callers into batches for one model thread.
+
+    A batch is flushed as soon as it has max_batch_size inputs, or when the oldest queued input has waited max_wait
+    seconds. Each caller gets a Future, resolved with the output of its input. At most max_queue inputs wait in the
+    queue : above, submit raises Overloaded (backpressure) instead of letting the latency grow without bound.
+    """
+
+    def __init__(self, predict_batch, max_batch_size: int = 32, max_wait: float = 0.01, max_queue: int = 1024,
+                 window: int = 1000):
+        """
+        :param predict_batch: function list of inputs -> list of outputs, in the same order. Only called from the
+            thread of the batcher
+        :param max_batch_size: maximum number of inputs per call of predict_batch
+        :param max_wait: maximum time (in seconds) an input waits for other inputs before its batch is flushed
+        :param max_queue: maximum number of inputs waiting in the queue
+        :param window: number of recent inputs and batches the latency and throughput statistics are computed on
+        """
+        self.predict_batch = predict_batch
+        self.max_batch_size = max_batch_size
+        self.max_wait = max_wait
+        self.max_queue = max_queue
+        # (input, future, submission time) in order of submission
+        self.queue = deque()
+        self.condition = threading.Condition()
+        self.closed = False
+
+        self.started = time.monotonic()
+        self.nb_submitted = 0
+        self.nb_completed = 0
+        self.nb_failed = 0
+        self.nb_rejected = 0
+        self.nb_batches = 0
+        self.busy_time = 0.0
+        self.latencies = deque(maxlen=window)
+        self.completion_times = deque(maxlen=window)
+        self.batch_sizes = deque(maxlen=window)
+
+        self.thread = threading.Thread(target=self.run, name="micro-batcher", daemon=True)
+        self.thread.start()
+
+    def submit_many(self, inputs):
+        """
+        Queue the inputs of one caller, all or none of them
+        :param inputs: list of inputs of predict_batch
+        :return: list of Future, one per input
+        """
+        futures = [Future() for _ in inputs]
+        now = time.monotonic()
+        with self.condition:
+            if self.closed:
+                raise RuntimeError("The batcher is closed")
+            if len(self.queue) + len(inputs) > self.max_queue:
+                self.nb_rejected += len(inputs)
+                raise Overloaded("{} inputs in the queue, at most {}".format(len(self.queue), self.max_queue))
+            self.queue.extend((item, future, now) for item, future in zip(inputs, futures))
+            self.nb_submitted += len(inputs)
+            self.condition.notify()
+        return futures
+
+    def submit(self, item):
+        """
+        :param item: input of predict_batch
+        :return: Future of its output
+        """
+        return self.submit_many([item])[0]
+
+    def next_batch(self):
+        """
+        Wait until a batch is full or until the deadline of its oldest input
+        :return: list of (input, future, submission time), None when the batcher is closed and its queue is empty
+        """
+        with self.condition:
+            while not self.queue and not self.closed:
+                self.condition.wait()
+            if not self.queue:
+                return None
+            deadline = self.queue[0][2] + self.max_wait
+            while len(self.queue) < self.max_batch_size and not self.closed:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    break
+                self.condition.wait(remaining)
+            return [self.queue.popleft() for _ in range(min(self.max_batch_size, len(self.queue)))]
+
+    def predict(self, inputs):
+        """
+        :param inputs: list of inputs of predict_batch
+        :return: list of the outputs of predict_batch on inputs
+        """
+        outputs = self.predict_batch(inputs)
+        if len(outputs) != len(inputs):
+            raise ValueError("{} outputs for {} inputs".format(len(outputs), len(inputs)))
+        return outputs
+
+    def run(self):
+        """
+        loop of the thread of the batcher : flush the batches until the batcher is closed.
+        when a batch fails, its inputs are predicted one by one : an invalid input only fails its own caller
+        """
+        while True:
+            batch = self.next_batch()
+            if batch is None:
+                return
+            inputs = [item for item, _, _ in batch]
+            start = time.monotonic()
+            # (output, None) or (None, exception) of each input
+            results = []
+            try:
+                results = [(output, None) for output in self.predict(inputs)]
+            except Exception as e:
+                if len(batch) == 1:
+                    results = [(None, e)]
+                else:
+                    for item in inputs:
+                        try:
+                            results.append((self.predict([item])[0], None))
+                        except Exception as item_error:
+                            results.append((None, item_error))
+            end = time.monotonic()
+
+            # the statistics are updated before the callers get their outputs
+            with self.condition:
+                self.nb_batches += 1
+                self.busy_time += end - start
+                self.batch_sizes.append(len(batch))
+                for (_, _, submitted), (_, error) in zip(batch, results):
+                    if error is None:
+                        self.nb_completed += 1
+                        self.latencies.append(end - submitted)
+                        self.completion_times.append(end)
+                    else:
+                        self.nb_failed += 1
+            for (_, future, _), (output, error) in zip(batch, results):
+                if error is None:
+                    future.set_result(output)
+                else:
+                    future.set_exception(error)
+
+    def close(self):
+        """ stop accepting inputs, process the queued ones and stop the thread """
+        with self.condition:
+            self.closed = True
+            self.condition.notify_all()
+        self.thread.join()
+
+    @staticmethod
+    def percentile(sorted_values, q: float):
+        """ nearest-rank percentile q (in [0, 100]) of a sorted list, 0 if it is empty """
+        if not sorted_values:
+            return 0.0
+        return sorted_values[max(0, min(len(sorted_values) - 1, math.ceil(q / 100 * len(sorted_values)) - 1))]
+
+    def stats(self):
+        """
+        :return: dict of the counters of the batcher, the latency (from submission to output, in ms) and the batch
+            size of the recent inputs, the throughput (outputs per second) since the start and over the recent inputs,
+            and the utilization (fraction of the time spent in predict_batch)
+        """
+        with self.condition:
+            now = time.monotonic()
+            uptime = now - self.started
+            latencies = sorted(self.latencies)
+            recent_span = now - self.completion_times[0] if self.completion_times else 0.0
+            return {"queue_size": len(self.queue),
+                    "max_queue": self.max_queue,
+                    "max_batch_size": self.max_batch_size,
+                    "max_wait_ms": 1000 * self.max_wait,
+                    "submitted": self.nb_submitted,
+                    "completed": self.nb_completed,
+                    "failed": self.nb_failed,
+                    "rejected": self.nb_rejected,
+                    "batches": self.nb_batches,
+                    "mean_batch_size": sum(self.batch_sizes) / len(self.batch_sizes) if self.batch_sizes else 0.0,
+                    "latency_ms": {"mean": 1000 * sum(latencies) / len(latencies) if latencies else 0.0,
+                                   "p50": 1000 * self.percentile(latencies, 50),
+                                   "p95": 1000 * self.percentile(latencies, 95),
+                                   "p99": 1000 * self.percentile(latencies, 99),
+                                   "max": 1000 * latencies[-1] if latencies else 0.0},
+                    "throughput": self.nb_completed / uptime if uptime > 0 else 0.0,
+                    "recent_throughput": len(self.completion_times) / recent_span if recent_span > 0 else 0.0,
+                    "utilization": self.busy_time / uptime if uptime > 0 else 0.0,
+                    "uptime_s": uptime}